@@ -0,0 +1,93 @@
+"""Cost of the event statistics: one loop each, or a single analysis pass.
+
+Agents travel between random nodes of a grid, then the loops of
+processs_events and analyse_events are timed on the events as a list of
+tuples and as a ColumnarLog.
+
+Run with: python benchmarks/bench_analysis.py
+"""
+
+import random
+from time import perf_counter
+
+from mobslim.agents import ActivityType, Plan
+from mobslim.expected import SimpleExpectedDurations
+from mobslim.listener import ColumnarListener
+from mobslim.network import Grid
+from mobslim.planners.greedy_trip_planner import GreedyTripPlanner
+from mobslim.planners.rerouters.simple_rerouter import StaticRouter
+from mobslim.processs_events import (
+    analyse_events,
+    av_link_durations,
+    av_link_speeds,
+    expected_link_durations,
+    trip_durations,
+    trip_lengths,
+)
+from mobslim.sim import Sim
+
+AGENTS = [1_000, 10_000, 50_000]
+
+
+def simulate(agents: int):
+    """Simulate agents going to work and back on a grid."""
+    rng = random.Random(0)
+    network = Grid(size=10, length=100, flow_capacity=0.5)
+    network.G = network.G.to_directed()  # links both ways
+    nodes = list(network.G.nodes)
+    plans = {}
+    for i in range(agents):
+        home, work = rng.sample(nodes, 2)
+        plan = Plan()
+        plan.add_activity(ActivityType.HOME, home, rng.randrange(0, 36000))
+        plan.add_trip(home, work, 0)
+        plan.add_activity(ActivityType.WORK, work, 28800)
+        plan.add_trip(work, home, 0)
+        plan.add_activity(ActivityType.HOME, home, 0)
+        plan.finish()
+        plans[i] = plan
+    router = StaticRouter(network, SimpleExpectedDurations(network))
+    GreedyTripPlanner(plans, router, network).plan()
+    sim = Sim(network, ColumnarListener())
+    sim.set(plans)
+    return network, plans, sim.run()
+
+
+def loops(network, plans, events) -> dict:
+    return {
+        "trip_durations": trip_durations(events),
+        "trip_lengths": trip_lengths(network, events),
+        "av_link_durations": av_link_durations(plans, network, events),
+        "expected_link_durations": expected_link_durations(
+            plans, network, events
+        ),
+        "av_link_speeds": av_link_speeds(plans, network, events),
+    }
+
+
+def timed(function, *args) -> tuple:
+    start = perf_counter()
+    result = function(*args)
+    return perf_counter() - start, result
+
+
+def main():
+    print(
+        f"{'agents':>8} {'events':>9} {'loops s':>9} {'list s':>9} "
+        f"{'columns s':>10}"
+    )
+    for agents in AGENTS:
+        network, plans, log = simulate(agents)
+        events = list(log)
+        loop_time, expected = timed(loops, network, plans, events)
+        list_time, from_list = timed(analyse_events, network, events)
+        columns_time, from_columns = timed(analyse_events, network, log)
+        assert from_list == expected and from_columns == expected
+        print(
+            f"{agents:>8} {len(events):>9} {loop_time:>9.3f} "
+            f"{list_time:>9.3f} {columns_time:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Per-route cost of the networkx, CSR and contraction hierarchy routers on
+grids of growing size.
+
+Routes are found between random pairs of nodes of a directed grid, with
+expected durations of one to two times the minimum. Trees are routes from
+one origin to every node, as used to route trips in batches. Customizing is
+the cost of setting new weights in the contraction hierarchy, as after each
+update.
+
+Run with: python benchmarks/bench_router.py
+"""
+
+import random
+from time import perf_counter
+
+from mobslim.expected import SimpleExpectedDurations
+from mobslim.network import Grid
+from mobslim.planners.rerouters.contraction_router import ContractionRouter
+from mobslim.planners.rerouters.csr_router import CSRRouter
+from mobslim.planners.rerouters.simple_rerouter import StaticRouter
+
+SIZES = [20, 50, 100]  # grid cells a side
+ROUTES = 100
+TREES = 5
+
+
+def grid(size: int, seed: int = 0):
+    rng = random.Random(seed)
+    network = Grid(size=size, length=100)
+    network.G = network.G.to_directed()
+    expectations = SimpleExpectedDurations(network)
+    for edge in expectations.edge_durations:
+        expectations.edge_durations[edge] *= rng.uniform(1, 2)
+    return network, expectations
+
+
+def bench_routes(router, pairs: list) -> tuple:
+    """Time routing each pair.
+
+    Returns:
+        tuple: Mean seconds per route, and the routes.
+    """
+    start = perf_counter()
+    routes = [router.get_route(a, b, 0) for a, b in pairs]
+    return (perf_counter() - start) / len(pairs), routes
+
+
+def bench_trees(router, origins: list, nodes: list) -> float:
+    """Time routing from each origin to every node.
+
+    Returns:
+        float: Mean seconds per origin.
+    """
+    start = perf_counter()
+    for origin in origins:
+        router.get_routes(
+            origin, [(node, 0) for node in nodes if node != origin]
+        )
+    return (perf_counter() - start) / len(origins)
+
+
+def main():
+    print(
+        f"{'nodes':>7} {'nx ms':>8} {'csr ms':>8} {'a* ms':>8} "
+        f"{'ch ms':>8} {'nx tree ms':>11} {'csr tree ms':>12} "
+        f"{'ch tree ms':>11} {'customize s':>12}"
+    )
+    for size in SIZES:
+        network, expectations = grid(size)
+        rng = random.Random(size)
+        nodes = list(network.G.nodes)
+        pairs = [tuple(rng.sample(nodes, 2)) for _ in range(ROUTES)]
+        origins = rng.sample(nodes, TREES)
+
+        static = StaticRouter(network, expectations)
+        csr = CSRRouter(network, expectations)
+        astar = CSRRouter(network, expectations, heuristic=True)
+        nx_time, expected = bench_routes(static, pairs)
+        csr_time, routes = bench_routes(csr, pairs)
+        astar_time, astar_routes = bench_routes(astar, pairs)
+        assert routes == expected
+        # a* routes are as short, but may take another of tied paths
+        assert [d for _, d in astar_routes] == [d for _, d in expected]
+        ch = ContractionRouter(network, expectations)
+        ch_time, ch_routes = bench_routes(ch, pairs)
+        # so may contraction hierarchy routes, summed in another order
+        for (_, a), (_, b) in zip(ch_routes, expected):
+            assert abs(a - b) < 1e-6
+        start = perf_counter()
+        ch.set_weights()
+        customize = perf_counter() - start
+        nx_tree = bench_trees(static, origins, nodes)
+        csr_tree = bench_trees(csr, origins, nodes)
+        ch_tree = bench_trees(ch, origins, nodes)
+        print(
+            f"{len(nodes):>7} {nx_time * 1e3:>8.2f} {csr_time * 1e3:>8.2f} "
+            f"{astar_time * 1e3:>8.2f} {ch_time * 1e3:>8.2f} "
+            f"{nx_tree * 1e3:>11.1f} {csr_tree * 1e3:>12.1f} "
+            f"{ch_tree * 1e3:>11.1f} {customize:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Per-instruction cost of the heap and calendar schedulers as agents grow.
+
+Each agent is scheduled at a random time of day, then every pop reschedules
+the agent after a random whole second delay, as Sim does after each
+instruction, until all agents have had a number of instructions.
+
+Run with: python benchmarks/bench_scheduler.py
+"""
+
+import random
+from time import perf_counter
+
+from mobslim.schedulers import CalendarScheduler, HeapScheduler
+
+AGENTS = [10_000, 100_000, 1_000_000]
+INSTRUCTIONS = 4  # per agent
+
+
+def bench_scheduler(
+    scheduler: type, agents: int, instructions: int = INSTRUCTIONS
+) -> float:
+    """Time popping and rescheduling agents through the day.
+
+    Returns:
+        float: Mean seconds per pop and push.
+    """
+    rng = random.Random(0)
+    entries = [
+        (float(rng.randrange(0, 21600)), agent) for agent in range(agents)
+    ]
+    delays = [float(rng.randrange(1, 3600)) for _ in range(agents)]
+    remaining = [instructions] * agents
+
+    start = perf_counter()
+    queue = scheduler(entries)
+    steps = 0
+    while queue:
+        time, agent = queue.pop()
+        steps += 1
+        remaining[agent] -= 1
+        if remaining[agent]:
+            queue.push(time + delays[agent], agent)
+    return (perf_counter() - start) / steps
+
+
+def main():
+    print(f"{'agents':>10} {'heap us':>10} {'calendar us':>12}")
+    for agents in AGENTS:
+        heap = bench_scheduler(HeapScheduler, agents)
+        calendar = bench_scheduler(CalendarScheduler, agents)
+        print(f"{agents:>10} {heap * 1e6:>10.3f} {calendar * 1e6:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
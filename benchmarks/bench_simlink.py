@@ -0,0 +1,51 @@
+"""Per-event cost of SimLink entry and exit as link storage grows.
+
+Run with: python benchmarks/bench_simlink.py
+"""
+
+from time import perf_counter
+
+from mobslim.links import SimLink
+from mobslim.sim import VEH_SIZE
+
+CAPACITIES = [10, 100, 1000, 5000]  # vehicles
+EVENTS = 100_000
+
+
+def bench_link(vehicles: int, events: int = EVENTS) -> float:
+    """Time enter and exit events on a link held close to full storage.
+
+    Returns:
+        float: Mean seconds per step of one entry and one exit.
+    """
+    link = SimLink(
+        {
+            "length": vehicles * VEH_SIZE,
+            "lanes": 1,
+            "freespeed": 10,
+            "flow_capacity": 1,
+        }
+    )
+    for i in range(vehicles - 1):
+        link.enter(i, VEH_SIZE, 0)
+
+    time = link.min_duration
+    start = perf_counter()
+    for i in range(events):
+        if link.can_enter(VEH_SIZE, time):
+            link.enter(i, VEH_SIZE, time)
+        if link.can_exit(time):
+            link.exit(i, time)
+        time += 1
+    return (perf_counter() - start) / events
+
+
+def main():
+    print(f"{'vehicles':>10} {'us/step':>10}")
+    for vehicles in CAPACITIES:
+        cost = bench_link(vehicles)
+        print(f"{vehicles:>10} {cost * 1e6:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
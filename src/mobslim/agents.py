@@ -1,6 +1,9 @@
+import random
 import xml.etree.ElementTree as ET
 from enum import Enum
-from typing import Optional
+from typing import Callable, Iterator, Optional, Tuple
+
+from mobslim.network import iter_elements
 
 # instruction will be composed of (InstructionType, asset_id, duration)
 
@@ -65,6 +68,9 @@ class SOS:
     def get_instructions(self):
         yield (InstructionType.SOS, None, None, 0)
 
+    def copy(self):
+        return SOS()
+
     def __repr__(self):
         return "SOS()"
 
@@ -82,6 +88,9 @@ class Activity:
         ]:
             yield instruction
 
+    def copy(self):
+        return Activity(self.type, self.location, self.duration)
+
     def __repr__(self):
         return f"Act({self.type}, loc={self.location}, dur={self.duration})"
 
@@ -106,6 +115,11 @@ class Trip:
             ]:
                 yield instruction
 
+    def copy(self):
+        trip = Trip(self.origin, self.destination, self.expected_duration)
+        trip.route = None if self.route is None else list(self.route)
+        return trip
+
     def __repr__(self):
         return f"Trip({self.origin}>{self.destination}, duration={self.expected_duration}, route={self.route})"
 
@@ -114,6 +128,9 @@ class EOS:
     def get_instructions(self):
         yield (InstructionType.EOS, None, None, 0)
 
+    def copy(self):
+        return EOS()
+
     def __repr__(self):
         return "EOS()"
 
@@ -142,36 +159,116 @@ def load_from_xml(path: str):
             </plan>
         </person>
     """
-    plans = {}
-    tree = ET.parse(path)
-    root = tree.getroot()
-    for person in root.findall("person"):
+    return dict(iter_plans_xml(path))
+
+
+def iter_plans_xml(
+    path: str,
+    keep: Optional[Callable[[str], bool]] = None,
+    fraction: Optional[float] = None,
+    seed: int = 0,
+) -> Iterator[Tuple[str, Plan]]:
+    """Stream the plans of a MATSim plans file, as load_from_xml.
+
+    Persons are parsed one at a time and cleared once read, so memory is
+    that of the plans kept, not of the XML. Persons may be filtered by id,
+    and sampled with a fraction. Unlike sample_plans, each person is kept by
+    a draw of its own, seeded by seed and its id, so the sample is
+    reproducible but only about the fraction in size.
+
+    Args:
+        path (str): The path to the plans file.
+        keep (Callable, optional): Whether to keep the person of an id.
+        fraction (float, optional): The fraction of persons to sample.
+        seed (int): The seed of the sample.
+
+    Yields:
+        tuple: The id and plan of each person kept, in file order.
+    """
+    if fraction is not None and (fraction < 0 or fraction > 1):
+        raise ValueError("Sample fraction must be between 0 and 1.")
+    for person in iter_elements(path, ("person",)):
         person_id = person.get("id")
-        xml_plan = person.find("plan")
-        plan = Plan()
-        # loop through acts and legs in xml plan
-        for component in xml_plan:
-            if component.tag == "act":
-                act_type = component.get("type")
-                node = int(component.get("node"))
-
-                if component.get("end_time"):
-                    duration = string_to_seconds(component.get("end_time"))
-                elif component.get("dur"):
-                    duration = string_to_seconds(component.get("dur"))
-                else:
-                    duration = None
-
-                if act_type == "h":
-                    plan.add_activity(ActivityType.HOME, node, duration)
-                elif act_type == "w":
-                    plan.add_activity(ActivityType.WORK, node, duration)
-
-            if component.tag == "leg":
-                plan.add_trip(None, None, None)
-        fixup_ods(plan)  # Ensure origin and destination are set
-        plans[person_id] = plan
-    return plans
+        if keep is not None and not keep(person_id):
+            continue
+        if fraction is not None and random.Random(f"{seed}/{person_id}").random() >= fraction:
+            continue
+        yield person_id, plan_from_xml(person.find("plan"))
+
+
+def iter_plan_chunks_xml(path: str, chunk_size: int = 10000, **kwargs) -> Iterator[dict]:
+    """Stream the plans of a MATSim plans file in chunks.
+
+    Args:
+        path (str): The path to the plans file.
+        chunk_size (int): The most plans in each chunk.
+        **kwargs: Filtering and sampling, as iter_plans_xml.
+
+    Yields:
+        dict: The plans of up to chunk_size persons, in file order.
+    """
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be at least 1.")
+    chunk = {}
+    for person_id, plan in iter_plans_xml(path, **kwargs):
+        chunk[person_id] = plan
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = {}
+    if chunk:
+        yield chunk
+
+
+def plan_from_xml(xml_plan: ET.Element) -> Plan:
+    """Build a Plan from a MATSim plan element."""
+    plan = Plan()
+    # loop through acts and legs in xml plan
+    for component in xml_plan:
+        if component.tag == "act":
+            act_type = component.get("type")
+            node = int(component.get("node"))
+
+            if component.get("end_time"):
+                duration = string_to_seconds(component.get("end_time"))
+            elif component.get("dur"):
+                duration = string_to_seconds(component.get("dur"))
+            else:
+                duration = None
+
+            if act_type == "h":
+                plan.add_activity(ActivityType.HOME, node, duration)
+            elif act_type == "w":
+                plan.add_activity(ActivityType.WORK, node, duration)
+
+        if component.tag == "leg":
+            plan.add_trip(None, None, None)
+    fixup_ods(plan)  # Ensure origin and destination are set
+    return plan
+
+
+def sample_plans(plans: dict, fraction: float, seed: int = 0) -> dict:
+    """Draw a reproducible random sample of agents from plans.
+
+    Simulate samples with link flow and storage capacities scaled by the same
+    fraction, so that congestion matches the full population.
+
+    Args:
+        plans (dict): A dictionary of plans for each agent.
+        fraction (float): The fraction of agents to keep, between 0 and 1.
+        seed (int): The seed of the sample.
+
+    Returns:
+        dict: The plans of the sampled agents, in their original order.
+    """
+    if fraction < 0 or fraction > 1:
+        raise ValueError("Sample fraction must be between 0 and 1.")
+    try:
+        agent_ids = sorted(plans)
+    except TypeError:  # agent ids cannot be ordered, keep the given order
+        agent_ids = list(plans)
+    size = round(fraction * len(agent_ids))
+    sample = set(random.Random(seed).sample(agent_ids, size))
+    return {agent_id: plan for agent_id, plan in plans.items() if agent_id in sample}
 
 
 def fixup_ods(plan: Plan):
@@ -0,0 +1,158 @@
+import copy
+import multiprocessing
+from typing import Callable, Dict, Hashable, List, Optional
+
+import numpy as np
+
+from mobslim.agents import Plan
+from mobslim.expected import SimpleExpectedDurations
+from mobslim.links import SimLinks
+from mobslim.listener import EventListener
+from mobslim.network import Network
+from mobslim.optimizer import Optimizer
+from mobslim.planners.greedy_trip_planner import GreedyTripPlanner
+from mobslim.planners.rerouters.core import BaseRouter
+from mobslim.planners.rerouters.simple_rerouter import StaticRouter
+from mobslim.processs_events import analyse_events
+from mobslim.schedulers import HeapScheduler
+from mobslim.sim import Sim
+
+# network and plans of a worker process, sent once when the worker starts
+_shared = {}
+
+
+def replication_seeds(seed: int, replications: int) -> List[int]:
+    """Get independent seeds for each replication from one seed."""
+    children = np.random.SeedSequence(seed).spawn(replications)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+def static_router(network: Network) -> BaseRouter:
+    """Make a StaticRouter on simple expected durations, the default router."""
+    return StaticRouter(network, SimpleExpectedDurations(network))
+
+
+def run_ensemble(
+    network: Network,
+    plans: Dict[Hashable, Plan],
+    replications: int,
+    iterations: int = 1,
+    seed: int = 0,
+    p: float = 0.2,
+    processes: Optional[int] = None,
+    links: type = SimLinks,
+    scheduler: type = HeapScheduler,
+    router: Callable[[Network], BaseRouter] = static_router,
+) -> List[dict]:
+    """Run seeded replications of planning and simulation on a process pool.
+
+    Each replication plans routes for all agents, simulates, then replans and
+    simulates again for each further iteration, as the Optimizer does, with
+    its own seeded planner. The network and plans are sent to each worker
+    once, and only summaries are sent back.
+
+    Args:
+        network (Network): The network to simulate.
+        plans (dict): A dictionary of plans for each agent, left unchanged.
+        replications (int): The number of replications.
+        iterations (int): The number of simulations in each replication.
+        seed (int): The seed all replication seeds are drawn from.
+        p (float): The probability of an agent replanning each iteration.
+        processes (int): The number of worker processes, or None for one per
+            cpu.
+        links (type): The link store to hold link state.
+        scheduler (type): The scheduler of agent instructions.
+        router (Callable): Makes each replication's router for the network,
+            a module level function or class, so it can be sent to workers.
+
+    Returns:
+        list: A summary dictionary for each replication, in order.
+    """
+    tasks = [
+        (i, replication_seed, iterations, p, links, scheduler, router)
+        for i, replication_seed in enumerate(
+            replication_seeds(seed, replications)
+        )
+    ]
+    # spawn rather than fork, as forking a process running threads, such as
+    # streaming listeners or pyarrow's, can deadlock
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(
+        processes, initializer=_share, initargs=(network, plans)
+    ) as pool:
+        return pool.starmap(_replicate, tasks)
+
+
+def _share(network: Network, plans: Dict[Hashable, Plan]):
+    _shared["network"] = network
+    _shared["plans"] = plans
+
+
+def _replicate(
+    replication: int,
+    seed: int,
+    iterations: int,
+    p: float,
+    links: type,
+    scheduler: type,
+    router: Callable[[Network], BaseRouter],
+) -> dict:
+    network = _shared["network"]
+    return replicate(
+        network,
+        copy.deepcopy(_shared["plans"]),
+        replication,
+        seed,
+        iterations=iterations,
+        p=p,
+        links=links,
+        scheduler=scheduler,
+        router=router,
+    )
+
+
+def replicate(
+    network: Network,
+    plans: Dict[Hashable, Plan],
+    replication: int,
+    seed: int,
+    iterations: int = 1,
+    p: float = 0.2,
+    links: type = SimLinks,
+    scheduler: type = HeapScheduler,
+    router: Callable[[Network], BaseRouter] = static_router,
+) -> dict:
+    """Run one seeded replication and summarise its final simulation.
+
+    Args:
+        network (Network): The network to simulate.
+        plans (dict): A dictionary of plans for each agent, planned in place.
+        replication (int): The number of the replication.
+        seed (int): The seed of the replication's planner.
+        iterations (int): The number of simulations.
+        p (float): The probability of an agent replanning each iteration.
+        links (type): The link store to hold link state.
+        scheduler (type): The scheduler of agent instructions.
+        router (Callable): Makes the router for the network.
+
+    Returns:
+        dict: Summary metrics of the final simulation.
+    """
+    planner = GreedyTripPlanner(plans, router(network), network, p=p, seed=seed)
+    planner.plan()
+    sim = Sim(network, EventListener(), links=links, scheduler=scheduler)
+    optimizer = Optimizer(sim, planner.plans, planner)
+    events = optimizer.run(max_runs=iterations, verbose=False)
+
+    stats = analyse_events(network, events)
+    durations = stats["trip_durations"]
+    lengths = stats["trip_lengths"]
+    return {
+        "replication": replication,
+        "seed": seed,
+        "trips": len(durations),
+        "mean_trip_duration": float(np.mean(durations)) if durations else None,
+        "mean_trip_length": float(np.mean(lengths)) if lengths else None,
+        "trip_durations": durations,
+        "link_durations": stats["expected_link_durations"],
+    }
@@ -1,7 +1,16 @@
+from collections.abc import MutableMapping
+
+import numpy as np
 from networkx import Graph
 
+from mobslim.listener import AggregatingListener
 from mobslim.network import Network
-from mobslim.processs_events import expected_link_durations
+from mobslim.processs_events import (
+    event_columns,
+    follows,
+    observed_link_durations,
+)
+from mobslim.tapes import ENTER_LINK, EXIT_LINK
 
 
 class ExpectedLinkDurations:
@@ -36,30 +45,212 @@ class ExpectedLinkDurations:
         raise NotImplementedError("This method is not implemented yet.")
 
 
+class LinkDurations(MutableMapping):
+    """A dictionary view, by edge, of a link-indexed array of durations.
+
+    Links written through the view are added to moved, if given.
+    """
+
+    def __init__(
+        self, durations: np.ndarray, link_ids: dict, moved: set = None
+    ):
+        self.durations = durations
+        self.link_ids = link_ids
+        self.moved = moved
+
+    def __getitem__(self, edge: tuple) -> float:
+        return self.durations.item(self.link_ids[edge])
+
+    def __setitem__(self, edge: tuple, duration: float):
+        link = self.link_ids[edge]
+        self.durations[link] = duration
+        if self.moved is not None:
+            self.moved.add(link)
+
+    def __delitem__(self, edge: tuple):
+        raise TypeError("Links cannot be removed.")
+
+    def __iter__(self):
+        return iter(self.link_ids)
+
+    def __len__(self):
+        return len(self.link_ids)
+
+
 class SimpleExpectedDurations(ExpectedLinkDurations):
-    """A simple implementation of expected durations for edges in a graph."""
+    """A simple implementation of expected durations for edges in a graph.
+
+    Durations are held in one array by link id, in the edge order of the
+    network, which routers may share. Only links traversed in the events, or
+    still away from their minimum duration, are updated. Links away from
+    their minimum are kept in a set as they move, so updates do not scan the
+    network.
+    """
 
     def __init__(self, network: Network):
-        self.edge_durations = network.minimum_durations()
-        if None in self.edge_durations.values():
+        min_durations = network.minimum_durations()
+        if None in min_durations.values():
             raise ValueError("All edges must have a duration attribute.")
+        self.link_ids = network.link_index()
+        self.minimums = np.array(
+            [min_durations[edge] for edge in self.link_ids], dtype=np.float64
+        )
+        self.durations = self.minimums.copy()
+        # read as python floats without numpy overhead, and shared with routers
+        self.cells = memoryview(self.durations)
+        # links that may be away from their minimum duration
+        self.moved = set()
+        self.edge_durations = LinkDurations(
+            self.durations, self.link_ids, self.moved
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["cells"]  # memoryviews do not pickle
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.cells = memoryview(self.durations)
+        self.edge_durations = LinkDurations(
+            self.durations, self.link_ids, self.moved
+        )
 
     def get(self, edge: tuple, time: int) -> float:
         """Get the expected duration for a given edge at a specific time."""
-        return self.edge_durations[edge]
+        return self.cells[self.link_ids[edge]]
 
-    def update(self, plans: dict, network: Network, events: list, alpha: float = 1.0):
-        durations = expected_link_durations(plans, network, events)
-        for edge, duration in durations.items():
-            if duration is not None:
-                self.update_link(edge, None, duration, alpha=alpha)
+    def update(
+        self, plans: dict, network: Network, events: list, alpha: float = 1.0
+    ):
+        """Blend the average duration of each traversed link into its expected
+        duration, and the minimum duration into the rest, as links at their
+        minimum stay there.
+        """
+        observed, means = observed_link_durations(
+            network, events, self.link_ids
+        )
+        moved = np.fromiter(self.moved, dtype=np.int64, count=len(self.moved))
+        moved = moved[self.durations[moved] != self.minimums[moved]]
+        links = np.union1d(observed, moved)
+        targets = self.minimums[links]
+        targets[np.searchsorted(links, observed)] = means
+        durations = (1 - alpha) * self.durations[links] + alpha * targets
+        self.durations[links] = durations
+        # in place, as the view of edge durations holds the set
+        self.moved.clear()
+        self.moved.update(links[durations != self.minimums[links]].tolist())
 
-    def update_link(self, edge: tuple, time: int, duration: float, alpha: float = 0.5):
+    def update_link(
+        self, edge: tuple, time: int, duration: float, alpha: float = 0.5
+    ):
         """Update the expected duration for a given edge at a specific time."""
-        self.edge_durations[edge] = (1 - alpha) * self.edge_durations[
-            edge
-        ] + alpha * duration
+        link = self.link_ids[edge]
+        self.cells[link] = (1 - alpha) * self.cells[link] + alpha * duration
+        self.moved.add(link)
 
     def av_duration(self) -> float:
         """Calculate the average expected duration across all edges."""
-        return sum(self.edge_durations.values()) / len(self.edge_durations)
+        return sum(self.durations.tolist()) / len(self.durations)
+
+
+class BinnedExpectedDurations(ExpectedLinkDurations):
+    """Expected durations of each link in each bin of time of day.
+
+    Durations are held in a dense [link x bin] array, so memory is fixed by
+    the network and the number of bins, and lookups are one index. Link ids
+    are the edge order of the network, as Network.link_index. Times past the
+    horizon use the last bin.
+    """
+
+    def __init__(
+        self,
+        network: Network,
+        bin_size: int = 900,
+        horizon: int = 86400,
+        dtype=np.float32,
+    ):
+        """
+        Args:
+            network (Network): The network of the links.
+            bin_size (int): Seconds of each time bin.
+            horizon (int): Seconds of time covered by the bins.
+            dtype: The float type of the durations.
+        """
+        min_durations = network.minimum_durations()
+        if None in min_durations.values():
+            raise ValueError("All edges must have a duration attribute.")
+        self.link_ids = network.link_index()
+        self.bin_size = bin_size
+        self.n_bins = max(int(np.ceil(horizon / bin_size)), 1)
+        self.minimums = np.array(
+            [min_durations[edge] for edge in self.link_ids], dtype=np.float64
+        )
+        self.durations = np.repeat(
+            self.minimums[:, None], self.n_bins, axis=1
+        ).astype(dtype)
+        # flat view of the durations, read as python floats without numpy overhead
+        self.cells = memoryview(self.durations.reshape(-1))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["cells"]  # memoryviews do not pickle
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.cells = memoryview(self.durations.reshape(-1))
+
+    def bin(self, time: float) -> int:
+        """Get the bin of a time, clamped to the bins."""
+        return min(max(int(time // self.bin_size), 0), self.n_bins - 1)
+
+    def get(self, edge: tuple, time: float) -> float:
+        """Get the expected duration for a given edge at a specific time.
+
+        With time None, the mean duration over all bins.
+        """
+        link = self.link_ids[edge]
+        if time is None:
+            return float(self.durations[link].mean())
+        return self.cells[link * self.n_bins + self.bin(time)]
+
+    def update(
+        self, plans: dict, network: Network, events: list, alpha: float = 1.0
+    ):
+        """Blend the mean duration of the traversals entering each link in each
+        bin into its expected duration, or the minimum duration where there
+        were none.
+        """
+        if isinstance(events, AggregatingListener):
+            if not events.keep_log:
+                raise ValueError(
+                    "Binned durations need the event log, with times."
+                )
+            events = events.log
+        times, agents, codes, links = event_columns(network, events)
+        order = np.argsort(agents, kind="stable")
+        enters, exits = follows(order, agents, codes, ENTER_LINK, EXIT_LINK)
+        bins = np.clip(times[enters] // self.bin_size, 0, self.n_bins - 1)
+        cells = links[enters] * self.n_bins + bins.astype(np.int64)
+        size = self.durations.size
+        totals = np.bincount(
+            cells, weights=times[exits] - times[enters], minlength=size
+        )
+        counts = np.bincount(cells, minlength=size)
+        observed = np.repeat(self.minimums, self.n_bins)
+        np.divide(totals, counts, out=observed, where=counts > 0)
+        # in place, so the flat view stays valid
+        flat = self.durations.reshape(-1)
+        flat[:] = (1 - alpha) * flat + alpha * observed
+
+    def update_link(
+        self, edge: tuple, time: float, duration: float, alpha: float = 0.5
+    ):
+        """Update the expected duration for a given edge at a specific time."""
+        cell = self.link_ids[edge] * self.n_bins + self.bin(time)
+        self.cells[cell] = (1 - alpha) * self.cells[cell] + alpha * duration
+
+    def av_duration(self) -> float:
+        """Calculate the average expected duration across all links and bins."""
+        return float(self.durations.mean())
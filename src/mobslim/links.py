@@ -0,0 +1,219 @@
+from collections import deque
+from typing import Hashable
+
+import numpy as np
+
+from mobslim.network import Network
+
+
+class SimLink:
+    def __init__(
+        self,
+        attributes: dict,
+        flow_capacity_factor: float = 1.0,
+        storage_capacity_factor: float = 1.0,
+        size: int = 0,
+    ):
+        """
+        Initialize a simulated link
+
+        :param attributes: A dictionary containing the attributes of the link, including 'length'.
+        :param flow_capacity_factor: Scale of the flow capacity, such as the sample rate of the population.
+        :param storage_capacity_factor: Scale of the storage capacity.
+        :param size: Size of a vehicle in meters, the least storage capacity,
+            so that a scaled down link can still hold one vehicle.
+        """
+        length = attributes["length"]  # Distance of the link
+        lanes = attributes["lanes"]  # Number of lanes on the link
+        freespeed = attributes["freespeed"]  # Free speed on the link
+        flow_capacity = attributes["flow_capacity"]  # Flow capacity of the link
+
+        self.storage_capacity = max(
+            length * lanes * storage_capacity_factor, size
+        )  # meters
+        self.flow_capacity = int(
+            1 / (flow_capacity * lanes) / flow_capacity_factor
+        )  # seconds per vehicle
+        self.min_duration = int(length / freespeed)  # seconds
+
+        self.queue = deque()
+        self.occupancy = 0  # meters
+        self.earliest_next_exit = 0
+
+    def reset(self):
+        self.queue = deque()
+        self.occupancy = 0
+        self.earliest_next_exit = 0
+
+    def can_exit(self, time: int) -> bool:
+        _, _, earliest_exit = self.queue[
+            0
+        ]  # todo: this is a duplicate check in sim loop
+        return earliest_exit <= time and self.has_flow_capacity(time)
+
+    def next_exit_time(self) -> int:
+        """Get the earliest time the link can release its next vehicle."""
+        _, _, earliest_exit = self.queue[0]
+        return max(earliest_exit, self.earliest_next_exit)
+
+    def exit(self, agent_id: Hashable, time: int) -> tuple:
+        self.earliest_next_exit = time + self.flow_capacity
+        vehicle = self.queue.popleft()
+        self.occupancy -= vehicle[1]
+        return vehicle
+
+    def can_enter(self, size: int, time: int) -> bool:
+        return self.has_storage_capacity(size)
+
+    def enter(self, agent_id: Hashable, size: int, time: int):
+        self.add_to_queue(agent_id, size, time)
+
+    def has_storage_capacity(self, size: int) -> bool:
+        return self.occupancy + size <= self.storage_capacity
+
+    def has_flow_capacity(self, time: int) -> bool:
+        return time >= self.earliest_next_exit
+
+    def add_to_queue(self, agent_id: Hashable, size: int, time: int):
+        earliest_exit = time + self.min_duration
+        self.queue.append((agent_id, size, earliest_exit))
+        self.occupancy += size
+
+
+class SimLinks:
+    """Link state for a simulation as one SimLink per network edge.
+
+    Links are addressed by integer link id, in network edge order.
+    """
+
+    def __init__(
+        self,
+        network: Network,
+        size: int,
+        flow_capacity_factor: float = 1.0,
+        storage_capacity_factor: float = 1.0,
+    ):
+        self.links = [
+            SimLink(
+                attributes, flow_capacity_factor, storage_capacity_factor, size
+            )
+            for _, attributes in network.G.edges.items()
+        ]
+
+    def __len__(self):
+        return len(self.links)
+
+    def reset(self):
+        for link in self.links:
+            link.reset()
+
+    def can_exit(self, link: int, time: float) -> bool:
+        return self.links[link].can_exit(time)
+
+    def next_exit_time(self, link: int) -> float:
+        return self.links[link].next_exit_time()
+
+    def exit(self, link: int, agent_id: Hashable, time: float):
+        self.links[link].exit(agent_id, time)
+
+    def can_enter(self, link: int, size: int, time: float) -> bool:
+        return self.links[link].can_enter(size, time)
+
+    def enter(self, link: int, agent_id: Hashable, size: int, time: float):
+        self.links[link].enter(agent_id, size, time)
+
+
+class ArrayLinks:
+    """Link state for a simulation held as contiguous arrays, one row per link.
+
+    Behaves as SimLinks, but without a Python object per link. Vehicle queues
+    share one ring buffer of earliest exit times, with a segment per link sized
+    to the most vehicles of the given size that fit in its storage.
+    """
+
+    def __init__(
+        self,
+        network: Network,
+        size: int,
+        flow_capacity_factor: float = 1.0,
+        storage_capacity_factor: float = 1.0,
+    ):
+        n = network.G.number_of_edges()
+        length = np.empty(n)
+        lanes = np.empty(n)
+        freespeed = np.empty(n)
+        flow_capacity = np.empty(n)
+        for i, (_, attributes) in enumerate(network.G.edges.items()):
+            length[i] = attributes["length"]
+            lanes[i] = attributes["lanes"]
+            freespeed[i] = attributes["freespeed"]
+            flow_capacity[i] = attributes["flow_capacity"]
+
+        self.index = np.arange(n, dtype=np.int64)
+        # at least one vehicle, so scaled down links are not closed
+        self.storage_capacity = np.maximum(
+            length * lanes * storage_capacity_factor, size
+        )  # meters
+        self.flow_capacity = (
+            1 / (flow_capacity * lanes) / flow_capacity_factor
+        ).astype(
+            np.int64
+        )  # s/veh
+        self.min_duration = (length / freespeed).astype(np.int64)  # seconds
+
+        slots = np.maximum(self.storage_capacity // size, 1).astype(np.int64)
+        self.start = np.zeros(n, dtype=np.int64)
+        np.cumsum(slots[:-1], out=self.start[1:])
+        self.slots = slots
+        self.exits = np.zeros(int(slots.sum()))  # ring buffer of earliest exits
+        self.sizes = np.zeros(int(slots.sum()), dtype=np.int32)
+
+        self.reset()
+
+    def __len__(self):
+        return len(self.index)
+
+    def reset(self):
+        n = len(self.index)
+        self.head = np.zeros(n, dtype=np.int64)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.occupancy = np.zeros(n, dtype=np.int64)  # meters
+        self.earliest_next_exit = np.zeros(n)
+
+    def can_exit(self, link: int, time: float) -> bool:
+        earliest_exit = self.exits.item(
+            self.start.item(link) + self.head.item(link)
+        )
+        return earliest_exit <= time and time >= self.earliest_next_exit.item(
+            link
+        )
+
+    def next_exit_time(self, link: int) -> float:
+        earliest_exit = self.exits.item(
+            self.start.item(link) + self.head.item(link)
+        )
+        return max(earliest_exit, self.earliest_next_exit.item(link))
+
+    def exit(self, link: int, agent_id: Hashable, time: float):
+        self.earliest_next_exit[link] = time + self.flow_capacity.item(link)
+        head = self.head.item(link)
+        self.occupancy[link] -= self.sizes.item(self.start.item(link) + head)
+        self.head[link] = (head + 1) % self.slots.item(link)
+        self.count[link] -= 1
+
+    def can_enter(self, link: int, size: int, time: float) -> bool:
+        return self.occupancy.item(link) + size <= self.storage_capacity.item(
+            link
+        )
+
+    def enter(self, link: int, agent_id: Hashable, size: int, time: float):
+        count = self.count.item(link)
+        if count == self.slots.item(link):
+            raise ValueError(f"Link {link} has no free vehicle slots.")
+        tail = self.start.item(link) + (
+            self.head.item(link) + count
+        ) % self.slots.item(link)
+        self.exits[tail] = time + self.min_duration.item(link)
+        self.sizes[tail] = size
+        self.occupancy[link] += size
+        self.count[link] = count + 1
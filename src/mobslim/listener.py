@@ -1,13 +1,44 @@
+import logging
+
+import numpy as np
 import pandas as pd
 
+from mobslim.agents import InstructionType
+from mobslim.network import Network
+from mobslim.tapes import (
+    ENTER_ACTIVITY,
+    ENTER_LINK,
+    EXIT_ACTIVITY,
+    EXIT_LINK,
+    Tapes,
+    decode,
+)
+
+logger = logging.getLogger(__name__)
+
+ITER_CHUNK = 65536  # events decoded at a time when iterating columns
+LINK_INSTRUCTIONS = (InstructionType.EnterLink, InstructionType.ExitLink)
+TRIP_INSTRUCTIONS = (
+    InstructionType.EnterActivity,
+    InstructionType.ExitActivity,
+    *LINK_INSTRUCTIONS,
+)
+
 
 class EventListener:
     """
     Base class for event listeners in the simulation.
+
+    Listeners are only sent the instruction types they subscribe to, all of
+    them unless subscriptions are given.
     """
 
-    def __init__(self):
+    subscriptions = frozenset(InstructionType)
+
+    def __init__(self, subscriptions=None):
         self.log = []
+        if subscriptions is not None:
+            self.subscriptions = frozenset(subscriptions)
 
     def add(self, time, a, b) -> None:
         self.log.append((time, a, b))
@@ -16,6 +47,252 @@ class EventListener:
         """Reset the event listener state."""
         self.log = []
 
+    def bind(self, tapes: Tapes) -> None:
+        """Take the compiled tapes of the simulation about to run."""
+
+    def add_instruction(self, time, agent: int, tapes: Tapes, row: int) -> None:
+        """Add the instruction at a tape row, for the agent numbered agent."""
+        self.add(time, tapes.agent_ids[agent], tapes.instruction(row))
+
+
+class ColumnarListener(EventListener):
+    """
+    Event listener writing events into growable NumPy columns.
+
+    Events are held as time, agent number, instruction code, link or
+    facility id and duration, with no Python objects per event. The log is a
+    ColumnarLog, which can be iterated as (time, agent_id, instruction)
+    events like the log of an EventListener.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset the event listener state."""
+        self.size = 0
+        self.times = np.empty(self.capacity)
+        self.agents = np.empty(self.capacity, dtype=np.int32)
+        self.codes = np.empty(self.capacity, dtype=np.int8)
+        self.indices = np.empty(self.capacity, dtype=np.int32)
+        self.durations = np.empty(self.capacity)
+        self.agent_ids = []
+        self.facilities = []
+        self.links = []
+        self.encoding = None
+
+    def bind(self, tapes: Tapes) -> None:
+        """Take the decode tables of the simulation about to run."""
+        self.agent_ids = tapes.agent_ids
+        self.facilities = tapes.facilities
+        self.links = tapes.links
+        self.encoding = None
+
+    def add_instruction(self, time, agent: int, tapes: Tapes, row: int) -> None:
+        i = self.size
+        if i == len(self.times):
+            self.grow()
+        self.times[i] = time
+        self.agents[i] = agent
+        self.codes[i] = tapes.opcodes.item(row)
+        self.indices[i] = tapes.indices.item(row)
+        self.durations[i] = tapes.durations.item(row)
+        self.size = i + 1
+
+    def add(self, time, a, b) -> None:
+        """Add an (time, agent_id, instruction) event, encoding it to columns."""
+        if self.encoding is None:
+            # ids of agents, links and facilities, built on first use
+            self.encoding = tuple(
+                {key: i for i, key in enumerate(table)}
+                for table in (self.agent_ids, self.links, self.facilities)
+            )
+        agents, links, facilities = self.encoding
+        opcode, act, location, duration = b
+        if opcode in (InstructionType.EnterLink, InstructionType.ExitLink):
+            index = links[location]
+        elif opcode in (
+            InstructionType.EnterActivity,
+            InstructionType.ExitActivity,
+        ):
+            index = facilities[(act, location)]
+        else:
+            index = -1
+        i = self.size
+        if i == len(self.times):
+            self.grow()
+        self.times[i] = time
+        self.agents[i] = agents[a]
+        self.codes[i] = opcode.value
+        self.indices[i] = index
+        self.durations[i] = np.nan if duration is None else duration
+        self.size = i + 1
+
+    def grow(self) -> None:
+        """Double the capacity of the columns."""
+        capacity = 2 * max(len(self.times), 1)
+        for name in ("times", "agents", "codes", "indices", "durations"):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[: self.size] = column[: self.size]
+            setattr(self, name, grown)
+
+    @property
+    def log(self) -> "ColumnarLog":
+        """Get the events so far, as views of the columns."""
+        n = self.size
+        return ColumnarLog(
+            times=self.times[:n],
+            agents=self.agents[:n],
+            codes=self.codes[:n],
+            indices=self.indices[:n],
+            durations=self.durations[:n],
+            agent_ids=self.agent_ids,
+            facilities=self.facilities,
+            links=self.links,
+        )
+
+
+class ColumnarLog:
+    """
+    Events as columns, with the tables to decode them.
+
+    Iterating gives (time, agent_id, instruction) events, the same as the
+    log of an EventListener, so it can be used wherever such a log is.
+    """
+
+    def __init__(
+        self,
+        times: np.ndarray,
+        agents: np.ndarray,
+        codes: np.ndarray,
+        indices: np.ndarray,
+        durations: np.ndarray,
+        agent_ids: list,
+        facilities: list,
+        links: list,
+    ):
+        self.times = times
+        self.agents = agents  # agent number, index of agent_ids
+        self.codes = codes  # InstructionType value
+        self.indices = indices  # link or facility id, -1 if neither
+        self.durations = durations  # NaN if not planned
+        self.agent_ids = agent_ids
+        self.facilities = facilities  # facility id: (ActivityType, location)
+        self.links = links  # link id: (u, v)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __iter__(self):
+        agent_ids, facilities, links = (
+            self.agent_ids,
+            self.facilities,
+            self.links,
+        )
+        # decode a chunk at a time, so memory mapped columns are not all read
+        for start in range(0, len(self.times), ITER_CHUNK):
+            chunk = slice(start, start + ITER_CHUNK)
+            for time, agent, code, index, duration in zip(
+                self.times[chunk].tolist(),
+                self.agents[chunk].tolist(),
+                self.codes[chunk].tolist(),
+                self.indices[chunk].tolist(),
+                self.durations[chunk].tolist(),
+            ):
+                yield time, agent_ids[agent], decode(
+                    code, index, duration, facilities, links
+                )
+
+    def __getitem__(self, i: int) -> tuple:
+        return (
+            self.times.item(i),
+            self.agent_ids[self.agents.item(i)],
+            decode(
+                self.codes.item(i),
+                self.indices.item(i),
+                self.durations.item(i),
+                self.facilities,
+                self.links,
+            ),
+        )
+
+    @classmethod
+    def from_events(cls, events: list) -> "ColumnarLog":
+        """Encode (time, agent_id, instruction) events into columns.
+
+        Agents, links and facilities are numbered in order of first use.
+        """
+        tables = ({}, {}, {})  # agent ids, links, facilities
+        agents, links, facilities = tables
+        columns = ([], [], [], [], [])
+        times, numbers, codes, indices, durations = columns
+        for time, agent_id, (opcode, act, location, duration) in events:
+            if opcode in LINK_INSTRUCTIONS:
+                index = links.setdefault(location, len(links))
+            elif opcode in (
+                InstructionType.EnterActivity,
+                InstructionType.ExitActivity,
+            ):
+                key = (act, location)
+                index = facilities.setdefault(key, len(facilities))
+            else:
+                index = -1
+            times.append(time)
+            numbers.append(agents.setdefault(agent_id, len(agents)))
+            codes.append(opcode.value)
+            indices.append(index)
+            durations.append(np.nan if duration is None else duration)
+        return cls(
+            times=np.array(times, dtype=np.float64),
+            agents=np.array(numbers, dtype=np.int32),
+            codes=np.array(codes, dtype=np.int8),
+            indices=np.array(indices, dtype=np.int32),
+            durations=np.array(durations, dtype=np.float64),
+            agent_ids=list(agents),
+            facilities=list(facilities),
+            links=list(links),
+        )
+
+    def window(self, start: float, end: float) -> "ColumnarLog":
+        """Get the events from start up to end, as views of the columns.
+
+        Events must be in time order, as from a simulation.
+        """
+        first, last = np.searchsorted(self.times, (start, end))
+        return self.take(slice(first, last))
+
+    def take(self, rows: np.ndarray) -> "ColumnarLog":
+        """Get the events at some rows, or a slice, with the same decode tables."""
+        return ColumnarLog(
+            times=self.times[rows],
+            agents=self.agents[rows],
+            codes=self.codes[rows],
+            indices=self.indices[rows],
+            durations=self.durations[rows],
+            agent_ids=self.agent_ids,
+            facilities=self.facilities,
+            links=self.links,
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """Get the events as a DataFrame of the columns, without copying them.
+
+        Returns:
+            pd.DataFrame: Columns time, agent, code, index and duration.
+        """
+        return pd.DataFrame(
+            {
+                "time": self.times,
+                "agent": self.agents,
+                "code": self.codes,
+                "index": self.indices,
+                "duration": self.durations,
+            },
+            copy=False,
+        )
+
 
 class CSVChunkWriter:
     """
@@ -62,7 +339,192 @@ class CSVChunkWriter:
 
     def finish(self) -> None:
         self.write()
-        self.logger.info(f"Chunkwriter finished for {self.path}")
+        logger.info(f"Chunkwriter finished for {self.path}")
 
     def __len__(self):
         return self.idx + len(self.chunk)
+
+
+class AggregatingListener(EventListener):
+    """
+    Event listener keeping trip and link statistics up to date as events arrive.
+
+    Keeps a count and sum of durations for each link, and the start time and
+    length so far of each agent's current trip, giving the same statistics as
+    processs_events without scanning the log. The functions there accept the
+    listener in place of a log. With keep_log False, no log is kept, and only
+    activity and link events are subscribed to.
+    """
+
+    def __init__(self, network: Network, keep_log: bool = True):
+        self.network = network
+        self.keep_log = keep_log
+        if not keep_log:
+            self.subscriptions = frozenset(TRIP_INSTRUCTIONS)
+        self.link_lengths = np.array(
+            [attributes["length"] for attributes in network.G.edges.values()],
+            dtype=np.float64,
+        )
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset the event listener state."""
+        self.log = []
+        n = len(self.link_lengths)
+        self.link_counts = np.zeros(n, dtype=np.int64)
+        self.link_sums = np.zeros(n)
+        self.link_errors = np.zeros(n)  # compensation of the sums
+        self.bind_agents([])
+        self.durations = []  # of completed trips, in order of arrival
+        self.lengths = []  # of completed trips, in order of arrival
+        self.encoding = None
+
+    def bind(self, tapes: Tapes) -> None:
+        """Take the agents of the simulation about to run."""
+        self.bind_agents(tapes.agent_ids)
+
+    def bind_agents(self, agent_ids: list) -> None:
+        self.agent_ids = agent_ids
+        self.encoding = None
+        n = len(agent_ids)
+        self.entered = np.zeros(n)  # time the current link was entered
+        self.trip_start = np.full(n, np.nan)  # NaN if not on a trip
+        self.trip_length = np.full(n, np.nan)  # NaN if not on a trip
+
+    def add_instruction(self, time, agent: int, tapes: Tapes, row: int) -> None:
+        if self.keep_log:
+            self.log.append(
+                (time, tapes.agent_ids[agent], tapes.instruction(row))
+            )
+        self.record(
+            time, agent, tapes.opcodes.item(row), tapes.indices.item(row)
+        )
+
+    def add(self, time, a, b) -> None:
+        if self.keep_log:
+            self.log.append((time, a, b))
+        if self.encoding is None:
+            # ids of agents and links, built on first use
+            self.encoding = (
+                {agent_id: i for i, agent_id in enumerate(self.agent_ids)},
+                self.network.link_index(),
+            )
+        agents, links = self.encoding
+        opcode = b[0]
+        index = links[b[2]] if opcode in LINK_INSTRUCTIONS else -1
+        self.record(time, agents[a], opcode.value, index)
+
+    def record(self, time, agent: int, code: int, index: int) -> None:
+        """Update the statistics with an event."""
+        if code == ENTER_LINK:
+            self.entered[agent] = time
+            self.trip_length[agent] += self.link_lengths.item(index)
+        elif code == EXIT_LINK:
+            self.link_counts[index] += 1
+            self.add_duration(index, time - self.entered.item(agent))
+        elif code == EXIT_ACTIVITY:
+            if self.trip_start.item(agent) != self.trip_start.item(agent):
+                self.trip_start[agent] = time
+            self.trip_length[agent] = 0
+        elif code == ENTER_ACTIVITY:
+            start = self.trip_start.item(agent)
+            if start == start:
+                self.durations.append(time - start)
+                self.trip_start[agent] = np.nan
+            length = self.trip_length.item(agent)
+            if length == length:
+                self.lengths.append(length)
+                self.trip_length[agent] = np.nan
+
+    def add_duration(self, link: int, duration: float) -> None:
+        """Add to the sum of durations on a link, with Neumaier summation.
+
+        This is the summation of the builtin sum, so averages are exactly
+        those of processs_events.
+        """
+        total = self.link_sums.item(link)
+        result = total + duration
+        if abs(total) >= abs(duration):
+            self.link_errors[link] += (total - result) + duration
+        else:
+            self.link_errors[link] += (duration - result) + total
+        self.link_sums[link] = result
+
+    def trip_durations(self) -> list:
+        """Get the durations of completed trips, as trip_durations."""
+        return list(self.durations)
+
+    def trip_lengths(self) -> list:
+        """Get the lengths of completed trips, as trip_lengths."""
+        return list(self.lengths)
+
+    def av_link_durations(self) -> dict:
+        """Get the average duration on each link, None if unused."""
+        means = self.link_means()
+        return {
+            edge: means[i] if self.link_counts.item(i) else None
+            for i, edge in enumerate(self.network.G.edges)
+        }
+
+    def expected_link_durations(self) -> dict:
+        """Get the average duration on each link, the minimum if unused."""
+        means = self.link_means()
+        minimum = self.network.minimum_durations()
+        return {
+            edge: means[i] if self.link_counts.item(i) else minimum[edge]
+            for i, edge in enumerate(self.network.G.edges)
+        }
+
+    def link_means(self) -> list:
+        counts = np.maximum(self.link_counts, 1)
+        return ((self.link_sums + self.link_errors) / counts).tolist()
+
+
+class Listeners(EventListener):
+    """
+    Send events to several listeners, each only the types it subscribes to.
+
+    The log is a list of the logs of each listener.
+    """
+
+    def __init__(self, listeners: list):
+        self.listeners = list(listeners)
+        self.subscriptions = frozenset().union(
+            *(listener.subscriptions for listener in self.listeners)
+        )
+        # listeners subscribed to each opcode
+        self.routes = [
+            [
+                listener
+                for listener in self.listeners
+                if instruction in listener.subscriptions
+            ]
+            for instruction in InstructionType
+        ]
+
+    def reset(self) -> None:
+        for listener in self.listeners:
+            listener.reset()
+
+    def bind(self, tapes: Tapes) -> None:
+        for listener in self.listeners:
+            listener.bind(tapes)
+
+    def add_instruction(self, time, agent: int, tapes: Tapes, row: int) -> None:
+        for listener in self.routes[tapes.opcodes.item(row)]:
+            listener.add_instruction(time, agent, tapes, row)
+
+    def add(self, time, a, b) -> None:
+        for listener in self.routes[b[0].value]:
+            listener.add(time, a, b)
+
+    @property
+    def log(self) -> list:
+        return [listener.log for listener in self.listeners]
+
+
+def subscribed_opcodes(listener: EventListener) -> list:
+    """Get whether a listener subscribes to each opcode, indexed by opcode."""
+    return [
+        instruction in listener.subscriptions for instruction in InstructionType
+    ]
@@ -1,8 +1,36 @@
 import xml.etree.ElementTree as ET
+from typing import Iterator
 
 from networkx import DiGraph, Graph
 
 
+def iter_elements(path: str, tags: tuple) -> Iterator[ET.Element]:
+    """Stream the elements of an XML file with one of the given tags.
+
+    Each element is yielded once parsed, with its children, then cleared and
+    dropped from its parent, so the tree held is only the elements being
+    parsed. Use an element only before the next is yielded.
+
+    Args:
+        path (str): The path to the XML file.
+        tags (tuple): The tags of the elements to yield.
+
+    Yields:
+        Element: Each element with one of the tags, in document order.
+    """
+    parents = []
+    for event, element in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag in tags:
+            yield element
+            element.clear()
+            if parents:
+                parents[-1].remove(element)
+
+
 class Network:
 
     def __init__(self):
@@ -25,42 +53,48 @@ class Network:
         """
         return self.G.edges
 
+    def link_index(self) -> dict:
+        """Get integer link ids for the edges of the network, in edge order.
+
+        Returns:
+            dict: A dictionary with edges as keys and link ids as values.
+        """
+        return {edge: i for i, edge in enumerate(self.G.edges)}
+
     def load_xml(self, path: str):
         """Load a network from an XML file.
 
+        The file is streamed, so memory is that of the network built, not of
+        the XML.
+
         Args:
             path (str): The path to the XML file.
         """
 
-        tree = ET.parse(path)
-        root = tree.getroot()
-
-        # Load nodes
-        for node in root.find("nodes"):
-            node_id = int(node.get("id"))
-            x = float(node.get("x"))
-            y = float(node.get("y"))
-            self.G.add_node(node_id)
-            self.node_positions[node_id] = (x, y)
-
-        # Load links
-        for link in root.find("links"):
-            link_id = int(link.get("id"))
-            from_node = int(link.get("from"))
-            to_node = int(link.get("to"))
-            length = float(link.get("length"))
-            capacity = float(link.get("capacity"))
-            freespeed = float(link.get("freespeed"))
-            permlanes = int(link.get("permlanes"))
-            self.G.add_edge(
-                from_node,
-                to_node,
-                id=link_id,
-                length=length,
-                flow_capacity=capacity / 3600,
-                freespeed=freespeed,
-                lanes=permlanes,
-            )
+        for element in iter_elements(path, ("node", "link")):
+            if element.tag == "node":
+                node_id = int(element.get("id"))
+                x = float(element.get("x"))
+                y = float(element.get("y"))
+                self.G.add_node(node_id)
+                self.node_positions[node_id] = (x, y)
+            else:
+                link_id = int(element.get("id"))
+                from_node = int(element.get("from"))
+                to_node = int(element.get("to"))
+                length = float(element.get("length"))
+                capacity = float(element.get("capacity"))
+                freespeed = float(element.get("freespeed"))
+                permlanes = int(element.get("permlanes"))
+                self.G.add_edge(
+                    from_node,
+                    to_node,
+                    id=link_id,
+                    length=length,
+                    flow_capacity=capacity / 3600,
+                    freespeed=freespeed,
+                    lanes=permlanes,
+                )
 
     def minimum_durations(self) -> dict:
         """Get the minimum durations for all edges in the network.
@@ -1,8 +1,10 @@
 from typing import Dict, Hashable
 
 from mobslim.agents import Plan
+from mobslim.listener import AggregatingListener
 from mobslim.planners.core import BasePlanner
 from mobslim.processs_events import (
+    analyse_events,
     expected_link_durations,
     trip_durations,
     trip_lengths,
@@ -18,37 +20,69 @@ class Optimizer:
         self.plans = plans
         self.planner = planner
 
-    def run(self, max_runs: int = 100, verbose: bool = False):
+    def run(self, max_runs: int = 100, verbose: bool = True):
+        """Simulate the plans, then replan and simulate again max_runs - 1 times.
 
-        print("--- Initial simulation ---")
+        Args:
+            max_runs (int): The number of simulations.
+            verbose (bool): Print progress and statistics of each simulation.
+
+        Returns:
+            list: The events of the last simulation.
+        """
+        if verbose:
+            print("--- Initial simulation ---")
         self.sim.set(plans=self.plans)
         events = self.sim.run()
-        self.report(0, events)
+        if verbose:
+            self.report(0, events)
+            print("--- Starting optimization ---")
+        try:
+            for i in range(1, max_runs):
 
-        print("--- Starting optimization ---")
-        for i in range(1, max_runs):
-            
-            self.planner.update(events)
-            self.planner.replan()
+                self.planner.update(self.observations(events))
+                self.planner.replan()
 
-            self.sim.set(plans=self.planner.plans)
-            events = self.sim.run()
+                self.sim.set(plans=self.planner.plans)
+                events = self.sim.run()
 
-            self.report(i ,events)
+                if verbose:
+                    self.report(i ,events)
+        finally:
+            # stop any worker processes the planner started
+            self.planner.close()
 
-        print("--- Optimization complete ---")
+        if verbose:
+            print("--- Optimization complete ---")
         return events
     
+    def observations(self, events):
+        """Get what the planner updates from, the listener itself if it kept
+        statistics as events arrived, as it may keep no log, else the events.
+        """
+        if isinstance(self.sim.event_listener, AggregatingListener):
+            return self.sim.event_listener
+        return events
+
     def report(self, i, events):
-        durations = trip_durations(events)
+        if isinstance(self.sim.event_listener, AggregatingListener):
+            # statistics were kept as events arrived
+            events = self.sim.event_listener
+            durations = trip_durations(events)
+            distances = trip_lengths(self.sim.network, events)
+            link_durations = expected_link_durations(self.plans, self.sim.network, events)
+        else:
+            stats = analyse_events(self.sim.network, events)
+            durations = stats["trip_durations"]
+            distances = stats["trip_lengths"]
+            link_durations = stats["expected_link_durations"]
+
         avg_trip_duration = sum(durations) / len(durations)
 
         # calculate average trip distances
-        distances = trip_lengths(self.sim.network, events)
         avg_trip_length = sum(distances) / len(distances)
 
         # calculate average link durations
-        link_durations = expected_link_durations(self.plans, self.sim.network, events)
         avg_link_duration = sum(link_durations.values()) / len(link_durations)
 
         print(
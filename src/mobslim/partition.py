@@ -0,0 +1,449 @@
+import heapq
+import multiprocessing
+import warnings
+from typing import Dict, Hashable, Sequence, Union
+
+import numpy as np
+
+from mobslim.agents import Plan
+from mobslim.links import SimLinks
+from mobslim.listener import EventListener, Listeners
+from mobslim.network import Network
+from mobslim.schedulers import HeapScheduler
+from mobslim.sim import VEH_SIZE, Sim
+from mobslim.tapes import (
+    ENTER_ACTIVITY,
+    ENTER_LINK,
+    EXIT_ACTIVITY,
+    EXIT_LINK,
+    Tapes,
+    compile_plans,
+)
+
+
+def partition_network(network: Network, regions: int) -> Dict[Hashable, int]:
+    """Split the nodes of a network into regions of equal size by x coordinate.
+
+    Args:
+        network (Network): The network to partition.
+        regions (int): The number of regions.
+
+    Returns:
+        dict: A dictionary with nodes as keys and region numbers as values.
+    """
+    nodes = sorted(
+        network.G.nodes,
+        key=lambda node: (*network.node_positions[node], str(node)),
+    )
+    return {node: i * regions // len(nodes) for i, node in enumerate(nodes)}
+
+
+class PartitionedSim:
+    """Simulate a network split into regions, each run by its own Sim.
+
+    Each region runs the instructions of agents at its nodes, and owns the
+    vehicle queues of links ending at its nodes. Agents entering a link that
+    ends in another region are handed over to that region. Regions advance
+    together in time windows no longer than the shortest planned duration on
+    such boundary links, so that handed over agents always arrive in a later
+    window, then swap handovers and the exits that free boundary link storage.
+
+    Events are the same as from a single Sim, as long as boundary links do
+    not run out of storage. A region only learns of exits from its outgoing
+    boundary links at the end of a window, when it wakes agents held back
+    from entering them, so a warning is given if an agent is held back, as
+    events may then differ.
+    """
+
+    def __init__(
+        self,
+        network: Network,
+        listener: Union[EventListener, Sequence[EventListener]],
+        regions: Union[int, Dict[Hashable, int]] = 2,
+        links: type = SimLinks,
+        scheduler: type = HeapScheduler,
+        flow_capacity_factor: float = 1.0,
+        storage_capacity_factor: float = 1.0,
+        processes: bool = True,
+    ):
+        """
+        Initialize the simulation with a network split into regions.
+
+        :param network: The network to simulate, with directed links.
+        :param listener: An event listener to handle events from all regions,
+            or a list of listeners.
+        :param regions: A number of regions to split the network into by node
+            position, or a dictionary of the region of each node.
+        :param links: The link store to hold link state, SimLinks or ArrayLinks.
+        :param scheduler: The scheduler of agent instructions.
+        :param flow_capacity_factor: Scale of link flow capacities.
+        :param storage_capacity_factor: Scale of link storage capacities.
+        :param processes: Run each region in its own worker process, or all in
+            this process if False.
+        """
+        if not network.G.is_directed():
+            raise ValueError("Partitioned simulation needs a directed network.")
+        if isinstance(regions, int):
+            regions = partition_network(network, regions)
+        if isinstance(listener, (list, tuple)):
+            listener = Listeners(listener)
+        self.network = network
+        self.event_listener = listener
+        self.regions = regions
+        self.link_store = links
+        self.scheduler = scheduler
+        self.flow_capacity_factor = flow_capacity_factor
+        self.storage_capacity_factor = storage_capacity_factor
+        self.processes = processes
+        self.workers = []
+
+    def set(self, plans: Union[Dict[Hashable, Plan], Tapes]):
+        """Compile plans and hand each region its tapes.
+
+        :param plans: A dictionary of plans for each agent, or compiled tapes.
+        """
+        if not isinstance(plans, Tapes):
+            plans = compile_plans(plans, self.network)
+        self.tapes = plans
+        self.rank = {agent_id: i for i, agent_id in enumerate(plans.agent_ids)}
+
+        self.tails, self.heads = link_regions(self.network, self.regions)
+        boundary = self.tails != self.heads
+        rows = np.flatnonzero(plans.opcodes == ENTER_LINK)
+        rows = rows[boundary[plans.indices[rows]]]
+        self.lookahead = (
+            float(plans.durations[rows].min()) if len(rows) else np.inf
+        )
+        if not self.lookahead > 0:
+            raise ValueError("Agents must take time to cross boundary links.")
+
+        self.close()
+        self.workers = [
+            (Worker if self.processes else Local)(
+                RegionSim(
+                    self.network,
+                    EventListener(self.event_listener.subscriptions),
+                    region=region,
+                    tails=self.tails,
+                    heads=self.heads,
+                    regions=self.regions,
+                    links=self.link_store,
+                    scheduler=self.scheduler,
+                    flow_capacity_factor=self.flow_capacity_factor,
+                    storage_capacity_factor=self.storage_capacity_factor,
+                )
+            )
+            for region in range(max(self.regions.values()) + 1)
+        ]
+        broadcast(self.workers, "set", plans)
+        self.event_listener.reset()
+        self.event_listener.bind(plans)
+
+    def run(self, steps: int = 86400):
+        start = 0
+        while start < steps:
+            end = min(start + self.lookahead, steps)
+            results = broadcast(self.workers, "advance", end)
+            handovers = [[] for _ in self.workers]
+            exits = [[] for _ in self.workers]
+            for sent, exited, _, _ in results:
+                for handover in sent:
+                    handovers[self.heads[handover[-1]]].append(handover)
+                for exit in exited:
+                    exits[self.tails[exit[-1]]].append(exit)
+            # send to every region before waiting on any, so they run together
+            for i, worker in enumerate(self.workers):
+                worker.send("receive", handovers[i], exits[i], end)
+            nexts = [worker.result() for worker in self.workers]
+            if any(blocked for _, _, blocked, _ in results):
+                warnings.warn(
+                    "Agents were held back from full boundary links, events may "
+                    "differ from an unpartitioned simulation."
+                )
+            # skip windows without instructions
+            start = max(end, min(nexts))
+
+        # the single run ends with the first instruction at or past steps,
+        # unless a blocked agent would retry first
+        finals = broadcast(self.workers, "final", steps)
+        heads = [(head, i) for i, (head, _) in enumerate(finals) if head]
+        retries = [retry for _, retry in finals if retry]
+        if heads:
+            head, i = min(heads)
+            if not retries or head <= min(retries):
+                self.workers[i].call("step_instruction")
+
+        logs = broadcast(self.workers, "log")
+        rank = self.rank
+        for event in heapq.merge(*logs, key=lambda e: (e[0], rank[e[1]])):
+            self.event_listener.add(*event)
+        return self.event_listener.log
+
+    def close(self):
+        """Stop the region workers."""
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
+
+
+def broadcast(workers: list, method: str, *args) -> list:
+    """Call a method of every region, sending all calls before waiting on
+    any, so that regions in worker processes run in parallel.
+    """
+    for worker in workers:
+        worker.send(method, *args)
+    return [worker.result() for worker in workers]
+
+
+def link_regions(network: Network, regions: Dict[Hashable, int]) -> tuple:
+    """Get the regions of the start and end nodes of each link, by link id."""
+    ends = np.array(
+        [(regions[u], regions[v]) for u, v in network.G.edges], dtype=np.int64
+    ).reshape(-1, 2)
+    return ends[:, 0], ends[:, 1]
+
+
+class RegionSim(Sim):
+    """Sim of the agents and links of one region of a partitioned network."""
+
+    def __init__(
+        self,
+        network: Network,
+        listener: EventListener,
+        region: int,
+        tails: np.ndarray,
+        heads: np.ndarray,
+        regions: Dict[Hashable, int],
+        links: type = SimLinks,
+        scheduler: type = HeapScheduler,
+        flow_capacity_factor: float = 1.0,
+        storage_capacity_factor: float = 1.0,
+    ):
+        super().__init__(
+            network,
+            listener,
+            links=links,
+            scheduler=scheduler,
+            flow_capacity_factor=flow_capacity_factor,
+            storage_capacity_factor=storage_capacity_factor,
+        )
+        self.region = region
+        self.tails = tails
+        self.heads = heads
+        self.regions = regions
+
+    def set(self, plans: Tapes):
+        super().set(plans)
+        tapes = self.tapes
+        self.agent_numbers = {
+            agent_id: agent for agent, agent_id in enumerate(self.agent_ids)
+        }
+        incoming = (self.heads == self.region) & (self.tails != self.region)
+        outgoing = (self.tails == self.region) & (self.heads != self.region)
+        self.links = BoundaryLinks(
+            self.links,
+            incoming=set(np.flatnonzero(incoming).tolist()),
+            outgoing=set(np.flatnonzero(outgoing).tolist()),
+        )
+        entries = [
+            (tapes.durations.item(row), agent)
+            for agent, row in enumerate(self.cursor.tolist())
+            if self.node_region(row) == self.region
+        ]
+        self.queue = HandoverQueue(self.scheduler(entries), self)
+
+    def node_region(self, row: int) -> int:
+        """Get the region of the node at which an instruction pair happens."""
+        tapes = self.tapes
+        for i in (row + 1, row):
+            opcode = tapes.opcodes.item(i)
+            index = tapes.indices.item(i)
+            if opcode == ENTER_LINK:
+                return self.tails.item(index)
+            if opcode == EXIT_LINK:
+                return self.heads.item(index)
+            if opcode == ENTER_ACTIVITY or opcode == EXIT_ACTIVITY:
+                return self.regions[tapes.facilities[index][1]]
+        raise ValueError(f"Instruction pair at row {row} has no location.")
+
+    def advance(self, end: float) -> tuple:
+        """Run instructions before end.
+
+        Returns:
+            tuple: Handovers (entered, time, agent, row, link) and boundary
+                link exits (time, agent id, link) since the last call, whether
+                agents were held back from boundary links and the next
+                instruction time.
+        """
+        while self.queue and self.queue.peek()[0] < end:
+            self.step_instruction()
+        sent, self.queue.sent = self.queue.sent, []
+        exits, self.links.exits = self.links.exits, []
+        blocked, self.links.blocked = self.links.blocked, False
+        return sent, exits, blocked, self.next_time()
+
+    def receive(self, handovers: list, exits: list, end: float) -> float:
+        """Take in agents handed over, and exits from links to other regions.
+
+        Exits are applied in order, each waking an agent held back from
+        entering the link, as Sim.step_instruction does. Other regions have
+        run up to end, so woken agents retry from end rather than the exit
+        time, and their handovers still arrive in a later window.
+
+        Returns:
+            float: The next instruction time.
+        """
+        for entered, time, agent, row, link in handovers:
+            self.links.store.enter(
+                link, self.agent_ids[agent], VEH_SIZE, entered
+            )
+            self.cursor[agent] = row
+            self.queue.scheduler.push(time, agent)
+        exits = sorted(
+            (time, self.agent_numbers[agent_id], link)
+            for time, agent_id, link in exits
+        )
+        if exits:
+            self.time = end
+        for time, agent, link in exits:
+            self.links.store.exit(link, self.agent_ids[agent], time)
+            self.wake_entry(link, agent)
+        return self.next_time()
+
+    def next_time(self) -> float:
+        entry = self.queue.peek()
+        return entry[0] if entry else np.inf
+
+    def final(self, steps: int) -> tuple:
+        """Get the next queued entry and first blocked retry at or past steps."""
+        return self.queue.peek(), self.first_blocked_retry(steps)
+
+    def log(self) -> list:
+        return self.event_listener.log
+
+
+class HandoverQueue:
+    """Scheduler of a region, holding back agents entering boundary links."""
+
+    def __init__(self, scheduler, sim: RegionSim):
+        self.scheduler = scheduler
+        self.sim = sim
+        self.sent = []  # (entered, time, agent, row, link)
+        self.pop = scheduler.pop
+        self.peek = scheduler.peek
+
+    def __len__(self):
+        return len(self.scheduler)
+
+    def push(self, time: float, agent: int):
+        sim = self.sim
+        row = sim.cursor.item(agent)
+        if sim.tapes.opcodes.item(row) == EXIT_LINK:
+            link = sim.tapes.indices.item(row)
+            if link in sim.links.outgoing:
+                self.sent.append((sim.time, time, agent, row, link))
+                return
+        self.scheduler.push(time, agent)
+
+
+class BoundaryLinks:
+    """Link store of a region, noting exits from boundary links into it."""
+
+    def __init__(self, store, incoming: set, outgoing: set):
+        self.store = store
+        self.incoming = incoming
+        self.outgoing = outgoing
+        self.exits = []  # (time, agent id, link)
+        self.blocked = False
+        self.can_exit = store.can_exit
+        self.next_exit_time = store.next_exit_time
+        self.enter = store.enter
+        self.reset = store.reset
+
+    def __len__(self):
+        return len(self.store)
+
+    def exit(self, link: int, agent_id: Hashable, time: float):
+        self.store.exit(link, agent_id, time)
+        if link in self.incoming:
+            self.exits.append((time, agent_id, link))
+
+    def can_enter(self, link: int, size: int, time: float) -> bool:
+        if self.store.can_enter(link, size, time):
+            return True
+        if link in self.outgoing:
+            self.blocked = True
+        return False
+
+
+class Local:
+    """Run a region in this process."""
+
+    def __init__(self, sim: RegionSim):
+        self.sim = sim
+
+    def send(self, method: str, *args):
+        try:
+            self.reply = (True, getattr(self.sim, method)(*args))
+        except Exception as error:  # raised when the result is taken
+            self.reply = (False, error)
+
+    def result(self):
+        ok, result = self.reply
+        if not ok:
+            raise result
+        return result
+
+    def call(self, method: str, *args):
+        self.send(method, *args)
+        return self.result()
+
+    def close(self):
+        pass
+
+
+class Worker:
+    """Run a region in a worker process, calling its methods through a pipe."""
+
+    def __init__(self, sim: RegionSim):
+        # spawn rather than fork, which can deadlock if this process has threads
+        context = multiprocessing.get_context("spawn")
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=serve, args=(child, sim), daemon=True
+        )
+        self.process.start()
+        child.close()
+
+    def send(self, method: str, *args):
+        """Start a method call, without waiting for its result."""
+        self.conn.send((method, args))
+
+    def result(self):
+        """Wait for the result of the last call sent."""
+        ok, result = self.conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def call(self, method: str, *args):
+        self.send(method, *args)
+        return self.result()
+
+    def close(self):
+        self.conn.send(None)
+        self.process.join()
+        self.conn.close()
+
+
+def serve(conn, sim: RegionSim):
+    """Answer method calls on a region sim until sent None."""
+    while True:
+        message = conn.recv()
+        if message is None:
+            return
+        method, args = message
+        try:
+            conn.send((True, getattr(sim, method)(*args)))
+        except Exception as error:  # hand errors back to the caller
+            conn.send((False, error))
@@ -9,4 +9,8 @@ class BasePlanner:
         raise NotImplementedError
     
     def replan(self) -> dict:
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    def close(self):
+        """Release anything the planner holds between iterations."""
+        pass
\ No newline at end of file
@@ -1,9 +1,15 @@
-from random import random
+import multiprocessing
+import random
+from collections import defaultdict
+from typing import Hashable, Optional
 
 from mobslim.agents import Activity, Trip
+from mobslim.listener import AggregatingListener
 from mobslim.network import Network
 from mobslim.planners.core import BasePlanner
+from mobslim.planners.rerouters.cached_router import CachedRouter
 from mobslim.planners.rerouters.simple_rerouter import BaseRouter
+from mobslim.population import Population
 from mobslim.processs_events import events_to_plans
 
 
@@ -12,7 +18,24 @@ class GreedyTripPlanner(BasePlanner):
     Assumes start of day at 0 and end at 86400 (24 hours)
     """
 
-    def __init__(self, plans, router: BaseRouter, network: Network, p: float = 0.2, max_duration: int = 86400):
+    def __init__(self, plans, router: BaseRouter, network: Network, p: float = 0.2, max_duration: int = 86400, seed: Optional[int] = None, processes: Optional[int] = None):
+        """
+        Args:
+            plans (dict): A dictionary of plans for each agent.
+            router (BaseRouter): The router to route trips with.
+            network (Network): The network to plan on.
+            p (float): The probability of an agent replanning each iteration.
+            max_duration (int): The end of the day, in seconds.
+            seed (int): The seed of the planner's generator, or None to draw
+                from the global one.
+            processes (int): The number of worker processes to replan with,
+                or None to replan in this process. Workers are sent the router
+                each iteration, and each agent draws from its own stream, so
+                plans do not depend on the number of workers. A CachedRouter
+                is sent with its cache, which workers only read; the routes
+                they find are cached once all have replanned, so neither
+                plans nor hit counts depend on the number of workers.
+        """
         self.plans = plans
         self.router = router
         self.network = network
@@ -20,22 +43,143 @@ class GreedyTripPlanner(BasePlanner):
         self.max_duration = max_duration
         if self.p < 0 or self.p > 1:
             raise ValueError("Probability p must be between 0 and 1.")
+        # seeded planners draw from their own generator, otherwise the global one
+        self.random = random if seed is None else random.Random(seed)
+        self.processes = processes
+        self.pool = None
+        if processes is not None:
+            # agent streams are seeded from this and the iteration
+            self.seed = seed if seed is not None else self.random.getrandbits(64)
+            self.iteration = 0
 
     def update(self, events):
-        # parse events into plans and overwrite previous
-        self.plans = events_to_plans(events)
+        """Take the plans as simulated and update the router's expected
+        durations from events, a log or an AggregatingListener. Without a
+        log, the listener's link statistics are used and plans stay as planned.
+        Plans as simulated replace a dictionary of plans, and are written into
+        a Population in place.
+        """
+        if isinstance(events, AggregatingListener):
+            if events.keep_log:
+                self.take(events_to_plans(events.log))
+        else:
+            # parse events into plans and overwrite previous
+            self.take(events_to_plans(events))
         # update router
         self.router.update(plans = self.plans, network = self.network, events = events)
 
+    def take(self, plans: dict):
+        """Take plans as simulated in place of those planned."""
+        if isinstance(self.plans, Population):
+            for agent_id, plan in plans.items():
+                self.plans[agent_id] = plan
+        else:
+            self.plans = plans
+
     def plan(self):
         self.replan(p = 1.0)
         
     def replan(self, p: float = None):
         if p is None:
             p = self.p
-        for plan in self.plans.values():
-            if random() <= p:
-                self.replan_plan(plan)
+        if self.processes is not None:
+            return self.replan_parallel(p)
+        self.replan_plans(
+            [plan for plan in self.plans.values() if self.random.random() <= p]
+        )
+
+    def stream(self, agent_id: Hashable) -> random.Random:
+        """Get an agent's generator for this iteration, the same whichever
+        process draws from it.
+        """
+        return random.Random(f"{self.seed}/{self.iteration}/{agent_id!r}")
+
+    def replan_parallel(self, p: float):
+        """Replan agents on a pool of worker processes.
+
+        Agents are chosen with their own streams, then shared among the
+        workers, which are sent the router and replan their share as
+        replan_plans does. Replanned plans replace those in self.plans.
+        """
+        self.iteration += 1
+        chosen = [
+            (agent_id, plan) for agent_id, plan in self.plans.items()
+            if self.stream(agent_id).random() <= p
+        ]
+        shares = [chosen[i::self.processes] for i in range(self.processes)]
+        tasks = [(self.router, share, self.max_duration) for share in shares if share]
+        if not tasks:
+            return
+        if self.pool is None:
+            # spawn rather than fork, as forking a process running threads can
+            # deadlock
+            context = multiprocessing.get_context("spawn")
+            self.pool = context.Pool(self.processes)
+        found = {}  # key: (departure time, cache entry)
+        for share, cached in self.pool.starmap(_replan_share, tasks):
+            self.plans.update(share)
+            if cached is not None:
+                counts, routes = cached
+                self.router.hits += counts[0]
+                self.router.misses += counts[1]
+                self.router.invalidated += counts[2]
+                for key, (time, entry) in routes.items():
+                    # the earliest departure, whichever worker routed it
+                    if key not in found or time < found[key][0]:
+                        found[key] = (time, entry)
+        if found:
+            self.router.cache.update(
+                (key, entry) for key, (_, entry) in found.items()
+            )
+
+    def close(self):
+        """Stop the worker processes, if any were started."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def replan_plans(self, plans: list):
+        """Replan many plans, routing trips from the same origin together.
+
+        Trips are routed in rounds, the first trip of every plan, then the
+        second and so on, so that each trip departs at the time its plan has
+        reached, as in replan_plan. Each round asks the router for the routes
+        from each origin in one call.
+        """
+        # plan, next component, time reached
+        states = [(plan, 0, 0) for plan in plans]
+        while states:
+            requests = defaultdict(list)  # origin: [(state number, trip, time)]
+            for i, (plan, start, time) in enumerate(states):
+                for j in range(start, len(plan.components)):
+                    component = plan.components[j]
+                    if isinstance(component, Trip):
+                        requests[component.origin].append((i, component, time))
+                        states[i] = (plan, j + 1, time)
+                        break
+                    if isinstance(component, Activity):
+                        if component.duration is None:  # if duration is None, set to max possible
+                            component.duration = self.max_duration - time
+                        time += component.duration
+                else:
+                    states[i] = None  # no more trips
+
+            for origin, trips in requests.items():
+                routes = self.router.get_routes(
+                    origin, [(trip.destination, time) for _, trip, time in trips]
+                )
+                for (i, trip, time), (route, duration) in zip(trips, routes):
+                    trip.route, trip.expected_duration = route, duration
+                    plan, start, _ = states[i]
+                    states[i] = (plan, start, time + duration)
+            states = [state for state in states if state is not None]
 
     def replan_plan(self, plan):
         time = 0
@@ -53,3 +197,18 @@ class GreedyTripPlanner(BasePlanner):
                 time += component.duration
 
 
+
+
+def _replan_share(router: BaseRouter, share: list, max_duration: int) -> tuple:
+    cached = isinstance(router, CachedRouter)
+    if cached:
+        # read the cache as sent, and keep the routes found apart, so each
+        # trip is routed the same whichever agents share the worker
+        router.found = {}
+        router.hits = router.misses = router.invalidated = 0
+    planner = GreedyTripPlanner(dict(share), router, None, max_duration=max_duration)
+    planner.replan_plans([plan for _, plan in share])
+    if not cached:
+        return share, None
+    counts = (router.hits, router.misses, router.invalidated)
+    return share, (counts, router.found)
@@ -0,0 +1,224 @@
+import numpy as np
+from networkx import single_source_dijkstra_path_length
+
+from mobslim.network import Network
+from mobslim.planners.rerouters.core import BaseRouter
+
+
+class CachedRouter(BaseRouter):
+    def __init__(
+        self,
+        router: BaseRouter,
+        network: Network,
+        tolerance: float = 1.0,
+        bin_size: int = 900,
+    ):
+        """Cache the routes of another router across updates.
+
+        Routes are cached by (origin, destination, departure bin). A cached
+        route is used, priced at the current expected durations, while it
+        could be no more than tolerance slower than the best route. A route
+        that is now faster was no faster when the cached route was found, so
+        it has gained at most the falls in expected duration, since, of the
+        links it takes. Only links on some route no longer than the cached
+        one, at the lowest durations seen, could be on such a route, so only
+        the falls of those links count.
+
+        While found is a dict, the cache is only read, and routes found are
+        kept in found by key, with the earliest departure of each, for the
+        owner to cache, as replanning workers do.
+        Args:
+            router (BaseRouter): The router to find routes missing from the
+                cache.
+            network (Network): The network to route through.
+            tolerance (float): Seconds a cached route may drift from the best.
+            bin_size (int): Seconds of each departure time bin.
+        """
+        self.router = router
+        self.graph = network.G
+        self.link_ids = network.link_index()
+        self.tolerance = tolerance
+        self.bin_size = bin_size
+        # key: (links, expected duration, candidate link ids, their falls)
+        self.cache = {}
+        # key: (departure time, entry) of routes found by a read only cache
+        self.found = None
+        # the lowest expected duration of each link, from its minimum in
+        # whole seconds, as the simulation traverses links
+        minimums = network.minimum_durations()
+        lowest = [minimums[edge] for edge in self.link_ids]
+        self.lowest = np.maximum(np.floor(lowest), 0.0)
+        self.lowest = np.fmin(self.lowest, self.least(self.durations()))
+        # the sum of the falls in expected duration of each link
+        self.fallen = np.zeros(len(self.link_ids))
+        self.from_source = {}  # node: lowest duration from it to each link
+        self.to_target = {}  # node: lowest duration from each link to it
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    @property
+    def expectations(self):
+        return self.router.expectations
+
+    def update(
+        self, plans: dict, network: Network, events: list, alpha: float = 1.0
+    ):
+        before = self.durations()
+        self.router.update(plans, network, events, alpha=alpha)
+        after = self.durations()
+        with np.errstate(invalid="ignore"):
+            falls = before - after
+        if falls.ndim > 1:  # the largest fall of any time bin
+            falls = np.nanmax(falls, axis=1, initial=0.0)
+        self.fallen += np.where(falls > 0, falls, 0.0)
+        least = self.least(after)
+        if (least < self.lowest).any():
+            # routes may now be shorter than any bound was made for
+            self.lowest = np.fmin(self.lowest, least)
+            self.from_source.clear()
+            self.to_target.clear()
+            self.invalidated += len(self.cache)
+            self.cache.clear()
+
+    def durations(self) -> np.ndarray:
+        """Get the expected durations of each link, NaN if untraversable."""
+        durations = getattr(self.expectations, "durations", None)
+        if isinstance(durations, np.ndarray):  # held by link id
+            return durations.astype(np.float64)
+        durations = [
+            self.expectations.get(edge, None) for edge in self.link_ids
+        ]
+        return np.array(
+            [np.nan if d is None else d for d in durations], dtype=np.float64
+        )
+
+    def least(self, durations: np.ndarray) -> np.ndarray:
+        """Get the least duration of each link, of any time bin."""
+        if durations.ndim > 1:
+            durations = np.nanmin(durations, axis=1, initial=np.inf)
+        return np.where(np.isnan(durations), np.inf, durations)
+
+    def get_route(self, source, target, time):
+        """Find the shortest path between source and target nodes, from the
+        cache if it holds a route still within tolerance of the best.
+        """
+        key = self.key(source, target, time)
+        route = self.lookup(key)
+        if route is None:
+            route = self.router.get_route(source, target, time)
+            self.store(key, route, time)
+        return route
+
+    def get_routes(self, source, requests: list) -> list:
+        """Find shortest paths from a source to many targets, routing only
+        those missing from the cache together, and each of them once, unless
+        the cache is read only.
+        """
+        keys = [self.key(source, target, time) for target, time in requests]
+        # routes of a key are shared in the batch only if they are cached
+        names = keys if self.found is None else range(len(keys))
+        routes = {}  # name: route, looked up once in the batch
+        missing = []
+        for key, name, request in zip(keys, names, requests):
+            if name in routes:  # served by the first request of the key
+                self.hits += 1
+                continue
+            routes[name] = self.lookup(key)
+            if routes[name] is None:
+                missing.append((key, name, request))
+        if missing:
+            found = self.router.get_routes(
+                source, [request for _, _, request in missing]
+            )
+            for (key, name, (_, time)), route in zip(missing, found):
+                self.store(key, route, time)
+                routes[name] = route
+        return [(list(routes[name][0]), routes[name][1]) for name in names]
+
+    def key(self, source, target, time) -> tuple:
+        return source, target, int((time or 0) // self.bin_size)
+
+    def lookup(self, key: tuple):
+        """Get a cached route priced at current durations, or None if there
+        is none within tolerance.
+        """
+        entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        links, duration, candidates, fallen = entry
+        get = self.expectations.get
+        expected_durations = [get(edge, None) for edge, _ in links]
+        if None in expected_durations:  # a link can no longer be used
+            drift = np.inf
+        else:
+            drift = sum(expected_durations) - duration
+        gain = float(self.fallen[candidates].sum()) - fallen
+        if drift + gain > self.tolerance:
+            if self.found is None:
+                del self.cache[key]
+            self.invalidated += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        route = [
+            (edge, expected, minimum)
+            for (edge, minimum), expected in zip(links, expected_durations)
+        ]
+        return route, sum(expected_durations)
+
+    def store(self, key: tuple, route: tuple, time=None):
+        links, duration = route
+        source, target, _ = key
+        reach = self.reach(source, target)
+        # with a little slack, so rounding keeps the route's own links
+        candidates = np.flatnonzero(reach <= duration + 1e-6)
+        candidates = candidates.astype(np.int32)
+        entry = (
+            [(edge, minimum) for edge, _, minimum in links],
+            duration,
+            candidates,
+            float(self.fallen[candidates].sum()),
+        )
+        if self.found is None:
+            self.cache[key] = entry
+            return
+        time = time or 0
+        if key not in self.found or time < self.found[key][0]:
+            self.found[key] = (time, entry)
+
+    def reach(self, source, target) -> np.ndarray:
+        """Get the lowest duration of a route from source to target through
+        each link.
+        """
+        if source not in self.from_source:
+            self.from_source[source] = self.distances(self.graph, source, 0)
+        if target not in self.to_target:
+            reverse = self.graph.reverse(copy=False)
+            self.to_target[target] = self.distances(reverse, target, 1)
+        return self.from_source[source] + self.lowest + self.to_target[target]
+
+    def distances(self, graph, node, end: int) -> np.ndarray:
+        """Get the lowest duration between a node and an end of each link."""
+        lowest, link_ids = self.lowest, self.link_ids
+        if end:  # links of the reversed graph
+
+            def weight(u, v, _):
+                return lowest[link_ids[v, u]]
+
+        else:
+
+            def weight(u, v, _):
+                return lowest[link_ids[u, v]]
+
+        lengths = single_source_dijkstra_path_length(graph, node, weight=weight)
+        return np.array(
+            [lengths.get(edge[end], np.inf) for edge in link_ids],
+            dtype=np.float64,
+        )
+
+    def hit_rate(self) -> float:
+        """Get the share of lookups found in the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,453 @@
+from heapq import heapify, heappop, heappush
+
+import numpy as np
+from networkx import NetworkXNoPath, NodeNotFound
+
+from mobslim.expected import ExpectedLinkDurations
+from mobslim.network import Network
+from mobslim.planners.rerouters.core import BaseRouter
+
+
+class ContractionHierarchy:
+    """A contraction order of a network's nodes and the shortcuts it needs.
+
+    The order depends only on the network's topology, so is found once, and
+    link weights are then set by customize, which is quick enough to repeat
+    after each update. Nodes are ordered by nested dissection of their
+    positions, or by minimum degree where nodes have no positions, and every
+    pair of a contracted node's remaining neighbours is joined by an edge, so
+    no shortest path needs a search to find its shortcuts.
+
+    Edges join a lower ranked node to a higher one, each with a weight up
+    from low to high and down from high to low. Shortest paths between any
+    two nodes climb from each to a highest node along these edges, so are
+    found by two upward searches along the elimination tree.
+    """
+
+    def __init__(self, network: Network):
+        G = network.G
+        self.nodes = list(G.nodes)
+        self.node_ids = {node: i for i, node in enumerate(self.nodes)}
+        n = len(self.nodes)
+        adjacency = [set() for _ in range(n)]
+        for u, v in G.edges:
+            i, j = self.node_ids[u], self.node_ids[v]
+            if i != j:
+                adjacency[i].add(j)
+                adjacency[j].add(i)
+
+        positions = network.node_positions
+        if all(node in positions for node in self.nodes):
+            points = np.array(
+                [positions[node] for node in self.nodes], dtype=np.float64
+            ).reshape(-1, 2)
+            order = dissection_order(adjacency, points)
+        else:
+            order = minimum_degree_order(adjacency)
+
+        # contract nodes in order, joining their remaining neighbours
+        rank = [-1] * n
+        for i, x in enumerate(order):
+            rank[x] = i
+        uppers = [None] * n
+        for x in order:
+            upper = adjacency[x]
+            uppers[x] = upper
+            for u in upper:
+                neighbours = adjacency[u]
+                neighbours.discard(x)
+                neighbours.update(upper)
+                neighbours.discard(u)
+
+        # edges from each node to its higher neighbours, numbered in rank
+        # order of both ends, and the tree of the lowest higher neighbour of
+        # each node, along which searches climb
+        uppers = [sorted(upper, key=rank.__getitem__) for upper in uppers]
+        counts = np.array([len(upper) for upper in uppers], dtype=np.int64)
+        order = np.array(order, dtype=np.int64)
+        self.ranks = np.array(rank, dtype=np.int64)
+        self.first = np.empty(n, dtype=np.int64)
+        self.first[order] = np.cumsum(counts[order]) - counts[order]
+        # the rows of each node's edges, as python ints for searches
+        self.spans = list(
+            zip(self.first.tolist(), (self.first + counts).tolist())
+        )
+        self.low = np.repeat(order, counts[order])
+        self.high = np.array(
+            [u for x in order.tolist() for u in uppers[x]], dtype=np.int64
+        )
+        self.parent = [upper[0] if upper else -1 for upper in uppers]
+        # the edges from lower nodes of each node
+        self.below = [[] for _ in range(n)]
+        for edge, u in enumerate(self.high.tolist()):
+            self.below[u].append(edge)
+        self.keys = self.ranks[self.low] * n + self.ranks[self.high]
+
+        # the links each edge stands for, up and down, -1 where there is none
+        self.up_links = np.full(len(self.low), -1, dtype=np.int64)
+        self.down_links = np.full(len(self.low), -1, dtype=np.int64)
+        link_ids = network.link_index()
+        ends = np.array(
+            [(self.node_ids[u], self.node_ids[v]) for u, v in link_ids],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        links = np.arange(len(ends))
+        keep = ends[:, 0] != ends[:, 1]
+        ends, links = ends[keep], links[keep]
+        if not G.is_directed():
+            ends = np.concatenate((ends, ends[:, ::-1]))
+            links = np.concatenate((links, links))
+        up = self.ranks[ends[:, 0]] < self.ranks[ends[:, 1]]
+        self.up_links[self.edge(*ends[up].T)] = links[up]
+        self.down_links[self.edge(*ends[~up][:, ::-1].T)] = links[~up]
+
+        # triangles of each edge with a node below both its ends, by the
+        # level of that node in the tree, so triangles of a level only use
+        # edges finished at lower levels
+        level = [0] * n
+        levels = {}
+        for x in order.tolist():
+            upper = uppers[x]
+            for u in upper:
+                level[u] = max(level[u], level[x] + 1)
+            if len(upper) < 2:
+                continue
+            i, j = np.triu_indices(len(upper), 1)
+            heads = np.array(upper, dtype=np.int64)
+            rows = np.empty((len(i), 3), dtype=np.int32)
+            rows[:, 0] = self.first[x] + i
+            rows[:, 1] = self.first[x] + j
+            rows[:, 2] = self.edge(heads[i], heads[j])
+            levels.setdefault(level[x], []).append(rows)
+        groups = [np.concatenate(levels[k]) for k in sorted(levels)]
+        self.triangles = (
+            np.concatenate(groups) if groups else np.empty((0, 3), np.int32)
+        )
+        self.level_offsets = np.cumsum([0] + [len(group) for group in groups])
+
+    def edge(self, lows: np.ndarray, highs: np.ndarray) -> np.ndarray:
+        """Get the edge numbers from lower to higher nodes."""
+        return np.searchsorted(
+            self.keys, self.ranks[lows] * len(self.nodes) + self.ranks[highs]
+        )
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def customize(self, weights: np.ndarray) -> tuple:
+        """Get the up and down weights of each edge from link weights, and
+        the triangle each weight was found through.
+
+        Args:
+            weights (np.ndarray): The weight of each link by link id, inf or
+                NaN for untraversable links.
+
+        Returns:
+            tuple: Arrays of the up and down weights of each edge, and of the
+                rows of the triangles they go through, -1 for a link.
+        """
+        weights = np.where(np.isnan(weights), np.inf, weights)
+        weights = np.append(weights, np.inf)  # for edges without a link
+        up = weights[self.up_links]
+        down = weights[self.down_links]
+        up_rows = np.full(len(up), -1, dtype=np.int64)
+        down_rows = np.full(len(down), -1, dtype=np.int64)
+        offsets = self.level_offsets
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            xu, xv, uv = self.triangles[start:end].T
+            rows = np.arange(start, end)
+            # u to v through x, down to x then up from it, and back
+            for found_weights, found_rows, through in (
+                (up, up_rows, down[xu] + up[xv]),
+                (down, down_rows, down[xv] + up[xu]),
+            ):
+                better = through < found_weights[uv]
+                np.minimum.at(found_weights, uv[better], through[better])
+                best = better & (through == found_weights[uv])
+                found_rows[uv[best]] = rows[best]
+        return up, down, up_rows, down_rows
+
+
+class ContractionRouter(BaseRouter):
+    def __init__(
+        self,
+        network: Network,
+        expectations: ExpectedLinkDurations,
+        hierarchy: ContractionHierarchy = None,
+    ):
+        """Static router answering queries from a contraction hierarchy.
+
+        The hierarchy is built once for the network, and customized with the
+        expected durations on each update. Routes are shortest paths, as
+        from StaticRouter, but may take another of tied paths.
+        Args:
+            network (Network): The network to route through.
+            expectations (ExpectedLinkDurations): The expected durations for
+                the links in the network.
+            hierarchy (ContractionHierarchy): A hierarchy of the network to
+                share, or None to build one.
+        """
+        if hierarchy is None:
+            hierarchy = ContractionHierarchy(network)
+        self.hierarchy = hierarchy
+        self.expectations = expectations
+        self.links = list(network.G.edges)
+        self.minimums = [
+            network.G[u][v]["length"] / network.G[u][v]["freespeed"]
+            for u, v in self.links
+        ]
+        # search distances, reset after each search
+        self.dists = np.full(len(hierarchy), np.inf)
+        self.set_weights()
+
+    def set_weights(self):
+        """Customize the hierarchy with the expected durations."""
+        self.costs = [self.expectations.get(link, None) for link in self.links]
+        self.weights = np.array(
+            [np.nan if d is None else d for d in self.costs], dtype=np.float64
+        )
+        self.up, self.down, up_rows, down_rows = self.hierarchy.customize(
+            self.weights
+        )
+        # as lists, for quick lookups while unpacking routes
+        self.up_rows, self.down_rows = up_rows.tolist(), down_rows.tolist()
+
+    def update(
+        self, plans: dict, network: Network, events: list, alpha: float = 1.0
+    ):
+        self.expectations.update(plans, network, events, alpha=alpha)
+        self.set_weights()
+
+    def get_route(self, source, target, time):
+        """Find the shortest path between source and target nodes.
+        Args:
+            source: The starting node.
+            target: The destination node.
+        Returns:
+            tuple: A list of edges representing the shortest path and expected duration.
+        """
+        return self.get_routes(source, [(target, time)])[0]
+
+    def get_routes(self, source, requests: list) -> list:
+        """Find shortest paths from a source to many targets, searching up
+        from the source once. Each target is still searched up from, so for
+        very many targets of one source, a shortest path tree, as from
+        CSRRouter.get_routes, is quicker.
+        Args:
+            source: The starting node.
+            requests (list): (target, time) pairs.
+        Returns:
+            list: (route, expected duration) for each request, as get_route.
+        """
+        node_ids = self.hierarchy.node_ids
+        if source not in node_ids:
+            raise NodeNotFound(f"Source {source} is not in G")
+        forward = self.climb(node_ids[source], self.up)
+        routes = {}
+        for target, _ in requests:
+            if target in routes:
+                continue
+            if target not in node_ids:
+                raise NodeNotFound(f"Target {target} is not in G")
+            backward = self.climb(node_ids[target], self.down)
+            path = self.join(forward, backward)
+            if path is None:
+                raise NetworkXNoPath(f"No path between {source} and {target}.")
+            routes[target] = self.path_route(path)
+        return [routes[target] for target, _ in requests]
+
+    def climb(self, s: int, weights: np.ndarray) -> tuple:
+        """Find the shortest distances from node s up to each of its
+        ancestors in the elimination tree, which are all the nodes a search
+        up from s can reach.
+
+        Returns:
+            tuple: The ancestors, from s to the root, and an array of their
+                distances, inf where not reached.
+        """
+        hierarchy = self.hierarchy
+        spans, high, parent = hierarchy.spans, hierarchy.high, hierarchy.parent
+        dists = self.dists
+        dists[s] = 0.0
+        chain = []
+        x = s
+        while x >= 0:
+            chain.append(x)
+            start, end = spans[x]
+            heads = high[start:end]
+            dists[heads] = np.minimum(
+                dists[heads], dists[x] + weights[start:end]
+            )
+            x = parent[x]
+        found = chain, dists[chain]
+        # reset for the next search, which only reaches its own ancestors
+        dists[chain] = np.inf
+        return found
+
+    def join(self, forward: tuple, backward: tuple):
+        """Join the upward searches from a source and a target where they
+        meet with the shortest total distance.
+
+        Returns:
+            list: The path as (node, node, link) steps, or None if there is
+                none.
+        """
+        # common ancestors are the same last nodes of both chains
+        chain = forward[0]
+        common = min(len(chain), len(backward[0]))
+        while common and chain[-common] != backward[0][-common]:
+            common -= 1
+        if not common:
+            return None
+        totals = forward[1][-common:] + backward[1][-common:]
+        i = int(np.argmin(totals))
+        if totals[i] == np.inf:
+            return None
+        meet = chain[len(chain) - common + i]
+
+        forward_steps = self.descend(meet, *forward, self.up)
+        backward_steps = self.descend(meet, *backward, self.down)
+        path = []
+        for x, node, edge in forward_steps[::-1]:
+            self.unpack(x, node, edge, path)
+        for x, node, edge in backward_steps:
+            self.unpack(node, x, edge, path)
+        return path
+
+    def descend(
+        self, node: int, chain: list, dists: np.ndarray, weights: np.ndarray
+    ) -> list:
+        """Trace a search up from the first node of a chain back down from
+        node, along edges the distances were found through.
+
+        Returns:
+            list: (lower node, higher node, edge) steps, from node down.
+        """
+        hierarchy = self.hierarchy
+        low, below = hierarchy.low, hierarchy.below
+        found = dict(zip(chain, dists.tolist()))
+        steps = []
+        while node != chain[0]:
+            dist = found[node]
+            for edge in below[node]:
+                x = low[edge]
+                other = found.get(x)
+                if other is not None and other + weights[edge] == dist:
+                    steps.append((int(x), node, edge))
+                    node = int(x)
+                    break
+        return steps
+
+    def unpack(self, a: int, b: int, edge: int, path: list):
+        """Add the (node, node, link) steps of the path along an edge from
+        node a to node b.
+        """
+        hierarchy = self.hierarchy
+        low, triangles = hierarchy.low, hierarchy.triangles
+        stack = [(a, b, edge)]
+        while stack:
+            a, b, edge = stack.pop()
+            climbing = low[edge] == a
+            row = self.up_rows[edge] if climbing else self.down_rows[edge]
+            if row < 0:
+                link = hierarchy.up_links if climbing else hierarchy.down_links
+                path.append((a, b, int(link[edge])))
+                continue
+            # down from a to the triangle's lower node x, then up to b
+            lower, higher, _ = triangles[row].tolist()
+            first, second = (lower, higher) if climbing else (higher, lower)
+            x = int(low[first])
+            stack.append((x, b, second))
+            stack.append((a, x, first))
+
+    def path_route(self, steps: list) -> tuple:
+        """Get the route and expected duration of a path of (node, node,
+        link) steps.
+        """
+        nodes = self.hierarchy.nodes
+        edges = [(nodes[a], nodes[b]) for a, b, _ in steps]
+        links = [link for _, _, link in steps]
+        expected_durations = [self.costs[link] for link in links]
+        minimum_durations = [self.minimums[link] for link in links]
+        return list(zip(edges, expected_durations, minimum_durations)), sum(
+            expected_durations
+        )
+
+
+def dissection_order(
+    adjacency: list, points: np.ndarray, leaf: int = 16
+) -> list:
+    """Order nodes by nested dissection, splitting by position.
+
+    Nodes are split in two at the median of their widest coordinate, and the
+    nodes of the smaller side with neighbours on the other side separate the
+    halves. Each half is ordered the same way, before the separator.
+
+    Args:
+        adjacency (list): The set of neighbours of each node.
+        points (np.ndarray): The position of each node.
+        leaf (int): The number of nodes below which nodes are not split.
+
+    Returns:
+        list: The node numbers in order.
+    """
+    order = []
+    # parts to order, and separators to follow them, last first
+    stack = [np.arange(len(adjacency))]
+    while stack:
+        part = stack.pop()
+        if isinstance(part, list):  # a separator
+            order.extend(part)
+            continue
+        if len(part) <= leaf:
+            order.extend(minimum_degree_order(adjacency, part.tolist()))
+            continue
+        coords = points[part]
+        axis = int(np.argmax(np.ptp(coords, axis=0)))
+        by_axis = part[np.argsort(coords[:, axis], kind="stable")]
+        halves = by_axis[: len(part) // 2], by_axis[len(part) // 2 :]
+        inside = set(halves[0].tolist())
+        boundaries = [
+            [x for x in halves[0].tolist() if not adjacency[x] <= inside],
+            [x for x in halves[1].tolist() if adjacency[x] & inside],
+        ]
+        side = 0 if len(boundaries[0]) <= len(boundaries[1]) else 1
+        separator = boundaries[side]
+        split = set(separator)
+        stack.append(separator)
+        for half in halves:
+            stack.append(np.array([x for x in half.tolist() if x not in split]))
+    return order
+
+
+def minimum_degree_order(adjacency: list, nodes: list = None) -> list:
+    """Order nodes by the fewest neighbours among the nodes not yet ordered,
+    as if each ordered node joined its neighbours.
+
+    Args:
+        adjacency (list): The set of neighbours of each node.
+        nodes (list): The node numbers to order, or None for all.
+
+    Returns:
+        list: The node numbers in order.
+    """
+    if nodes is None:
+        nodes = range(len(adjacency))
+    members = set(nodes)
+    remaining = {x: adjacency[x] & members for x in nodes}
+    heap = [(len(neighbours), x) for x, neighbours in remaining.items()]
+    heapify(heap)
+    order = []
+    while heap:
+        degree, x = heappop(heap)
+        if x not in remaining or degree != len(remaining[x]):
+            continue
+        upper = remaining.pop(x)
+        order.append(x)
+        for u in upper:
+            neighbours = remaining[u]
+            neighbours.discard(x)
+            neighbours.update(upper)
+            neighbours.discard(u)
+            heappush(heap, (len(neighbours), u))
+    return order
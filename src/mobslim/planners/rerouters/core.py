@@ -22,6 +22,17 @@ class BaseRouter:
         """
         raise NotImplementedError("This method is not implemented yet.")
 
+    def get_routes(self, source, requests: list) -> list:
+        """Find shortest paths from a source to many targets.
+        Routers that can route many targets at once override this.
+        Args:
+            source: The starting node.
+            requests (list): (target, time) pairs.
+        Returns:
+            list: (route, expected duration) for each request, as get_route.
+        """
+        return [self.get_route(source, target, time) for target, time in requests]
+
     def update(self, events: list):
         """Update the router's expected durations based on simulation events.
         Args:
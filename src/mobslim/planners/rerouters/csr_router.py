@@ -0,0 +1,344 @@
+from heapq import heappop, heappush
+from itertools import count
+
+import numpy as np
+from networkx import NetworkXNoPath, NodeNotFound
+
+from mobslim.expected import ExpectedLinkDurations
+from mobslim.network import Network
+from mobslim.planners.rerouters.core import BaseRouter
+
+
+class CSRGraph:
+    """Adjacency of a network as compressed sparse rows, with links by id.
+
+    Node i's outgoing arcs are rows out_offsets[i] to out_offsets[i + 1] of
+    out_nodes and out_links, and its incoming arcs likewise of the in_
+    arrays, each in the adjacency order of the networkx graph. Links are
+    numbered in edge order, as Network.link_index. An undirected graph has
+    arcs both ways along each link.
+    """
+
+    def __init__(self, network: Network):
+        G = network.G
+        self.nodes = list(G.nodes)
+        self.node_ids = {node: i for i, node in enumerate(self.nodes)}
+        self.links = list(G.edges)
+        self.link_ids = network.link_index()
+        if not G.is_directed():
+            self.link_ids.update(
+                {(v, u): i for (u, v), i in self.link_ids.items()}
+            )
+
+        if G.is_directed():
+            outgoing, incoming = G._succ, G._pred
+        else:
+            outgoing = incoming = G._adj
+        self.out_offsets, self.out_nodes, self.out_links = self.rows(
+            outgoing, lambda u, v: (u, v)
+        )
+        self.in_offsets, self.in_nodes, self.in_links = self.rows(
+            incoming, lambda v, u: (u, v)
+        )
+
+    def rows(self, adjacency: dict, link) -> tuple:
+        offsets = np.zeros(len(self.nodes) + 1, dtype=np.int64)
+        nodes, links = [], []
+        for i, node in enumerate(self.nodes):
+            for other in adjacency[node]:
+                nodes.append(self.node_ids[other])
+                links.append(self.link_ids[link(node, other)])
+            offsets[i + 1] = len(nodes)
+        return (
+            offsets,
+            np.array(nodes, dtype=np.int64),
+            np.array(links, dtype=np.int64),
+        )
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+class CSRRouter(BaseRouter):
+    def __init__(
+        self,
+        network: Network,
+        expectations: ExpectedLinkDurations,
+        heuristic: bool = False,
+    ):
+        """Static router searching a CSR graph with link weight arrays.
+
+        Routes are the same as from StaticRouter. With heuristic, get_route
+        searches with A* instead, guided by the straight line distance to the
+        target at the fastest speed of any link. Routes are then shortest
+        paths, but may differ from StaticRouter's where paths tie.
+        Args:
+            network (Network): The network to route through.
+            expectations (ExpectedLinkDurations): The expected durations for
+                the links in the network.
+            heuristic (bool): Search with A* rather than bidirectional
+                Dijkstra.
+        """
+        self.graph = CSRGraph(network)
+        self.expectations = expectations
+        self.heuristic = heuristic
+        self.minimums = [
+            network.G[u][v]["length"] / network.G[u][v]["freespeed"]
+            for u, v in self.graph.links
+        ]
+        positions = np.array(
+            [
+                network.node_positions.get(node, (np.nan, np.nan))
+                for node in self.graph.nodes
+            ],
+            dtype=np.float64,
+        ).reshape(-1, 2)
+        self.positions = positions
+        # straight line length of each link
+        ends = np.array(
+            [
+                (self.graph.node_ids[u], self.graph.node_ids[v])
+                for u, v in self.graph.links
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        self.chords = np.hypot(
+            *(positions[ends[:, 1]] - positions[ends[:, 0]]).T
+        )
+        self.set_weights()
+
+    def set_weights(self):
+        """Take link weights from the expectations, NaN for untraversable."""
+        durations = [
+            self.expectations.get(link, None) for link in self.graph.links
+        ]
+        self.weights = np.array(
+            [np.nan if d is None else d for d in durations], dtype=np.float64
+        )
+        self.costs = durations  # as given, None for untraversable
+        # (node, cost) arcs out of and into each node, for searching
+        graph = self.graph
+        self.arcs = [
+            arcs(
+                graph.out_offsets, graph.out_nodes, graph.out_links, durations
+            ),
+            arcs(graph.in_offsets, graph.in_nodes, graph.in_links, durations),
+        ]
+        # fastest speed over any link, so straight line times never overestimate
+        with np.errstate(divide="ignore", invalid="ignore"):
+            speeds = self.chords / self.weights
+        speeds = speeds[np.isfinite(speeds)]
+        self.speed = float(speeds.max()) if len(speeds) else 0.0
+
+    def update(
+        self, plans: dict, network: Network, events: list, alpha: float = 1.0
+    ):
+        self.expectations.update(plans, network, events, alpha=alpha)
+        self.set_weights()
+
+    def get_route(self, source, target, time):
+        """Find the shortest path between source and target nodes.
+        Args:
+            source: The starting node.
+            target: The destination node.
+        Returns:
+            tuple: A list of edges representing the shortest path and expected duration.
+        """
+        node_ids = self.graph.node_ids
+        if source not in node_ids:
+            raise NodeNotFound(f"Source {source} is not in G")
+        if target not in node_ids:
+            raise NodeNotFound(f"Target {target} is not in G")
+        s, t = node_ids[source], node_ids[target]
+        if s == t:
+            path = [s]
+        elif self.heuristic and self.speed > 0:
+            path = self.astar(s, t)
+        else:
+            path = self.bidirectional_dijkstra(s, t)
+        if path is None:
+            raise NetworkXNoPath(f"No path between {source} and {target}.")
+        return self.path_route(path)
+
+    def get_routes(self, source, requests: list) -> list:
+        """Find shortest paths from a source to many targets with one search.
+
+        As StaticRouter.get_routes, reading each route from one shortest path
+        tree of the source.
+        Args:
+            source: The starting node.
+            requests (list): (target, time) pairs.
+        Returns:
+            list: (route, expected duration) for each request, as get_route.
+        """
+        node_ids = self.graph.node_ids
+        s = node_ids[source]
+        preds = self.dijkstra(s)
+        routes = {}
+        for target, _ in requests:
+            if target in routes:
+                continue
+            t = node_ids[target]
+            if t != s and preds[t] < 0:
+                raise NetworkXNoPath(f"No path between {source} and {target}.")
+            path = [t]
+            while path[-1] != s:
+                path.append(preds[path[-1]])
+            routes[target] = self.path_route(path[::-1])
+        return [routes[target] for target, _ in requests]
+
+    def path_route(self, path: list) -> tuple:
+        """Get the route and expected duration of a path of node numbers."""
+        nodes, link_ids, costs, minimums = (
+            self.graph.nodes,
+            self.graph.link_ids,
+            self.costs,
+            self.minimums,
+        )
+        edges = [(nodes[u], nodes[v]) for u, v in zip(path[:-1], path[1:])]
+        links = [link_ids[edge] for edge in edges]
+        expected_durations = [costs[link] for link in links]
+        minimum_durations = [minimums[link] for link in links]
+        return list(zip(edges, expected_durations, minimum_durations)), sum(
+            expected_durations
+        )
+
+    def dijkstra(self, s: int) -> list:
+        """Grow a shortest path tree from node s, as networkx's Dijkstra.
+
+        Returns:
+            list: The predecessor of each node, -1 if not reached.
+        """
+        outgoing = self.arcs[0]
+        n = len(outgoing)
+        preds = [-1] * n
+        final = [None] * n
+        seen = [None] * n
+        seen[s] = 0
+        c = count()
+        fringe = [(0, next(c), s)]
+        while fringe:
+            dist, _, v = heappop(fringe)
+            if final[v] is not None:
+                continue
+            final[v] = dist
+            for w, cost in outgoing[v]:
+                if cost is None or final[w] is not None:
+                    continue
+                length = dist + cost
+                best = seen[w]
+                if best is None or length < best:
+                    seen[w] = length
+                    heappush(fringe, (length, next(c), w))
+                    preds[w] = v
+        return preds
+
+    def bidirectional_dijkstra(self, s: int, t: int):
+        """Find a shortest path from s to t, as networkx.shortest_path does.
+
+        Searches forward from s and back from t in turn, with the same ties
+        as networkx, so paths are the same.
+
+        Returns:
+            list: The path as node numbers, or None if there is none.
+        """
+        n = len(self.arcs[0])
+        dists = [[None] * n, [None] * n]
+        seen = [[None] * n, [None] * n]
+        preds = [[-1] * n, [-1] * n]
+        seen[0][s] = 0
+        seen[1][t] = 0
+        c = count()
+        fringe = [[(0, next(c), s)], [(0, next(c), t)]]
+        finaldist = None
+        meet = -1
+        direction = 1
+        while fringe[0] and fringe[1]:
+            direction = 1 - direction
+            dist, _, v = heappop(fringe[direction])
+            final = dists[direction]
+            if final[v] is not None:
+                continue
+            final[v] = dist
+            if dists[1 - direction][v] is not None:
+                forward = [meet]
+                while forward[-1] != s:
+                    forward.append(preds[0][forward[-1]])
+                backward = []
+                node = meet
+                while node != t:
+                    node = preds[1][node]
+                    backward.append(node)
+                return forward[::-1] + backward
+
+            heap, pred = fringe[direction], preds[direction]
+            best, other_best = seen[direction], seen[1 - direction]
+            for w, cost in self.arcs[direction][v]:
+                if cost is None or final[w] is not None:
+                    continue
+                length = dist + cost
+                known = best[w]
+                if known is None or length < known:
+                    best[w] = length
+                    heappush(heap, (length, next(c), w))
+                    pred[w] = v
+                    other = other_best[w]
+                    if other is not None:
+                        total = length + other
+                        if finaldist is None or finaldist > total:
+                            finaldist, meet = total, w
+        return None
+
+    def astar(self, s: int, t: int):
+        """Find a shortest path from s to t with A*.
+
+        The heuristic is the straight line distance to t over the fastest
+        link speed, which never overestimates the remaining duration.
+
+        Returns:
+            list: The path as node numbers, or None if there is none.
+        """
+        outgoing = self.arcs[0]
+        x, y = self.positions[t]
+        heuristic = (
+            np.hypot(self.positions[:, 0] - x, self.positions[:, 1] - y)
+            / self.speed
+        ).tolist()
+        n = len(outgoing)
+        preds = [-1] * n
+        done = [False] * n
+        seen = [None] * n
+        seen[s] = 0
+        c = count()
+        fringe = [(0, next(c), s)]
+        while fringe:
+            _, _, v = heappop(fringe)
+            if v == t:
+                path = [t]
+                while v != s:
+                    v = preds[v]
+                    path.append(v)
+                return path[::-1]
+            if done[v]:
+                continue
+            done[v] = True
+            dist = seen[v]
+            for w, cost in outgoing[v]:
+                if cost is None or done[w]:
+                    continue
+                length = dist + cost
+                known = seen[w]
+                if known is None or length < known:
+                    seen[w] = length
+                    heappush(fringe, (length + heuristic[w], next(c), w))
+                    preds[w] = v
+        return None
+
+
+def arcs(offsets, nodes, links, costs: list) -> list:
+    """Get the (node, cost) arcs of each row of a CSR adjacency."""
+    offsets, nodes, links = offsets.tolist(), nodes.tolist(), links.tolist()
+    return [
+        [(nodes[k], costs[links[k]]) for k in range(offsets[i], offsets[i + 1])]
+        for i in range(len(offsets) - 1)
+    ]
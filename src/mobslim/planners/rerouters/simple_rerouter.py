@@ -1,6 +1,10 @@
-from networkx import shortest_path
+from networkx import (
+    NetworkXNoPath,
+    dijkstra_predecessor_and_distance,
+    shortest_path,
+)
 
-from mobslim.expected import ExpectedLinkDurations
+from mobslim.expected import ExpectedLinkDurations, SimpleExpectedDurations
 from mobslim.network import Network
 from mobslim.planners.rerouters.core import BaseRouter
 
@@ -18,21 +22,38 @@ class StaticRouter(BaseRouter):
         """
         self.G = network.G.copy()
         # calc minimum durations based on length and freespeed
-        for edge in self.G.edges:
+        for link, edge in enumerate(self.G.edges):
             length = self.G[edge[0]][edge[1]]["length"]
             freespeed = self.G[edge[0]][edge[1]]["freespeed"]
             minduration = length / freespeed
             self.G[edge[0]][edge[1]]["minimum_duration"] = minduration
+            self.G[edge[0]][edge[1]]["link"] = link
         self.expectations = expectations
-        for edge in self.G.edges:
-            self.G[edge[0]][edge[1]]["expected_duration"] = expectations.get(edge, None)
+        self.set_weights()
+
+    def set_weights(self):
+        """Share the expectations' link-indexed durations, or else copy them."""
+        if isinstance(self.expectations, SimpleExpectedDurations):
+            # updated in place, so there is nothing to copy after an update
+            self.durations = self.expectations.cells
+        else:
+            self.durations = [self.expectations.get(edge, None) for edge in self.G.edges]
+        durations = self.durations
+        self.weight = lambda u, v, data: durations[data["link"]]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["weight"], state["durations"]  # set again when unpickled
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.set_weights()
 
     def update(self, plans: dict, network: Network, events: list, alpha: float = 1.0):
         self.expectations.update(plans, network, events, alpha=alpha)
-        for edge in self.G.edges:
-            self.G[edge[0]][edge[1]]["expected_duration"] = self.expectations.get(
-                edge, None
-            )
+        if not isinstance(self.expectations, SimpleExpectedDurations):
+            self.set_weights()
 
     def get_route(self, source, target, time):
         """Find the shortest path between source and target nodes.
@@ -44,10 +65,40 @@ class StaticRouter(BaseRouter):
         """
 
         path = shortest_path(
-            self.G, source=source, target=target, weight="expected_duration"
+            self.G, source=source, target=target, weight=self.weight
         )
+        return self.path_route(path)
+
+    def get_routes(self, source, requests: list) -> list:
+        """Find shortest paths from a source to many targets with one search.
+
+        A single shortest path tree is grown from the source, and each route
+        is read from it. Where paths tie, the route may differ from get_route.
+        Args:
+            source: The starting node.
+            requests (list): (target, time) pairs.
+        Returns:
+            list: (route, expected duration) for each request, as get_route.
+        """
+        pred, _ = dijkstra_predecessor_and_distance(
+            self.G, source, weight=self.weight
+        )
+        routes = {}
+        for target, _ in requests:
+            if target in routes:
+                continue
+            if target not in pred:
+                raise NetworkXNoPath(f"No path between {source} and {target}.")
+            path = [target]
+            while path[-1] != source:
+                path.append(pred[path[-1]][0])
+            routes[target] = self.path_route(path[::-1])
+        return [routes[target] for target, _ in requests]
+
+    def path_route(self, path: list) -> tuple:
+        """Get the route and expected duration of a path of nodes."""
         link_ids = [(u, v) for u, v in zip(path[:-1], path[1:])]
-        expected_durations = [self.G[u][v]["expected_duration"] for u, v in link_ids]
+        expected_durations = [self.durations[self.G[u][v]["link"]] for u, v in link_ids]
         minimum_durations = [self.G[u][v]["minimum_duration"] for u, v in link_ids]
 
         return list(zip(link_ids, expected_durations, minimum_durations)), sum(
@@ -0,0 +1,143 @@
+from heapq import heappop, heappush
+from itertools import count
+
+from networkx import NetworkXNoPath, NodeNotFound
+
+from mobslim.expected import BinnedExpectedDurations
+from mobslim.network import Network
+from mobslim.planners.rerouters.core import BaseRouter
+from mobslim.planners.rerouters.csr_router import CSRGraph
+
+
+class TimeDependentRouter(BaseRouter):
+    def __init__(self, network: Network, expectations: BinnedExpectedDurations):
+        """Router for durations that depend on the time a link is entered.
+
+        Searches a CSR graph with Dijkstra from the departure time, each link
+        costing its expected duration in the bin of the time it is entered.
+        Agents do not wait, so where a later bin is much faster than an
+        earlier one, a route may arrive a little after the earliest possible.
+        Args:
+            network (Network): The network to route through.
+            expectations (BinnedExpectedDurations): The expected durations of
+                the links in each time bin.
+        """
+        self.graph = CSRGraph(network)
+        self.expectations = expectations
+        self.minimums = [
+            network.G[u][v]["length"] / network.G[u][v]["freespeed"]
+            for u, v in self.graph.links
+        ]
+        graph = self.graph
+        offsets = graph.out_offsets.tolist()
+        nodes, links = graph.out_nodes.tolist(), graph.out_links.tolist()
+        # (node, link) arcs out of each node
+        self.arcs = [
+            list(zip(nodes[start:end], links[start:end]))
+            for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+
+    def update(
+        self, plans: dict, network: Network, events: list, alpha: float = 1.0
+    ):
+        self.expectations.update(plans, network, events, alpha=alpha)
+
+    def get_route(self, source, target, time):
+        """Find the fastest path between source and target nodes, departing
+        at time.
+        Args:
+            source: The starting node.
+            target: The destination node.
+            time: The departure time, None for the start of the day.
+        Returns:
+            tuple: A list of edges representing the fastest path and expected duration.
+        """
+        node_ids = self.graph.node_ids
+        if source not in node_ids:
+            raise NodeNotFound(f"Source {source} is not in G")
+        if target not in node_ids:
+            raise NodeNotFound(f"Target {target} is not in G")
+        return self.get_routes(source, [(target, time)])[0]
+
+    def get_routes(self, source, requests: list) -> list:
+        """Find fastest paths from a source to many targets, with one search
+        for each departure time.
+        Args:
+            source: The starting node.
+            requests (list): (target, time) pairs.
+        Returns:
+            list: (route, expected duration) for each request, as get_route.
+        """
+        node_ids = self.graph.node_ids
+        s = node_ids[source]
+        departures = {}
+        for target, time in requests:
+            departures.setdefault(time or 0, set()).add(node_ids[target])
+        routes = {}
+        for time, targets in departures.items():
+            preds = self.search(s, time, targets)
+            for t in targets:
+                if t != s and preds[t] < 0:
+                    raise NetworkXNoPath(
+                        f"No path between {source} and {self.graph.nodes[t]}."
+                    )
+                path = [t]
+                while path[-1] != s:
+                    path.append(preds[path[-1]])
+                routes[(t, time)] = self.path_route(path[::-1], time)
+        return [
+            routes[(node_ids[target], time or 0)] for target, time in requests
+        ]
+
+    def search(self, s: int, time: float, targets: set) -> list:
+        """Grow a fastest path tree from node s departing at time, until all
+        targets are reached.
+
+        Returns:
+            list: The predecessor of each node, -1 if not reached.
+        """
+        expectations = self.expectations
+        cells, n_bins = expectations.cells, expectations.n_bins
+        bin_size, last = expectations.bin_size, n_bins - 1
+        outgoing = self.arcs
+        n = len(outgoing)
+        preds = [-1] * n
+        done = [False] * n
+        seen = [None] * n
+        seen[s] = time
+        remaining = len(targets - {s})
+        c = count()
+        fringe = [(time, next(c), s)]
+        while fringe and remaining:
+            arrival, _, v = heappop(fringe)
+            if done[v]:
+                continue
+            done[v] = True
+            if v in targets and v != s:
+                remaining -= 1
+            b = min(max(int(arrival // bin_size), 0), last)
+            for w, link in outgoing[v]:
+                if done[w]:
+                    continue
+                at = arrival + cells[link * n_bins + b]
+                known = seen[w]
+                if known is None or at < known:
+                    seen[w] = at
+                    heappush(fringe, (at, next(c), w))
+                    preds[w] = v
+        return preds
+
+    def path_route(self, path: list, time: float) -> tuple:
+        """Get the route and expected duration of a path of node numbers,
+        entering each link when the last is expected to be left.
+        """
+        nodes, link_ids = self.graph.nodes, self.graph.link_ids
+        get, minimums = self.expectations.get, self.minimums
+        route = []
+        for u, v in zip(path[:-1], path[1:]):
+            edge = (nodes[u], nodes[v])
+            link = link_ids[edge]
+            expected = get(self.graph.links[link], time)
+            route.append((edge, expected, minimums[link]))
+            time += expected
+        return route, sum(expected for _, expected, _ in route)
@@ -0,0 +1,417 @@
+from collections.abc import MutableMapping
+from typing import Dict, Hashable
+
+import numpy as np
+
+from mobslim.agents import EOS, SOS, Activity, Plan, Trip
+from mobslim.network import Network
+
+# component kinds
+SOS_KIND, ACTIVITY_KIND, TRIP_KIND, EOS_KIND = range(4)
+
+
+class Column:
+    """A typed array that grows by doubling as rows are appended."""
+
+    def __init__(self, dtype, capacity: int = 16):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values) -> int:
+        """Append values, returning the row of the first."""
+        values = np.asarray(values, dtype=self.data.dtype)
+        start, end = self.size, self.size + len(values)
+        if end > len(self.data):
+            data = np.empty(max(end, 2 * len(self.data)), dtype=self.data.dtype)
+            data[:start] = self.data[:start]
+            self.data = data
+        self.data[start:end] = values
+        self.size = end
+        return start
+
+    @property
+    def array(self) -> np.ndarray:
+        return self.data[: self.size]
+
+    def __getitem__(self, row):
+        return self.data[: self.size][row]
+
+    def __setitem__(self, row, value):
+        self.data[: self.size][row] = value
+
+    def __len__(self):
+        return self.size
+
+
+class Population(MutableMapping):
+    """
+    Plans of many agents, held in flat typed arrays.
+
+    The components of agent i are rows starts[i] to ends[i] of the component
+    arrays, and the route of a trip is rows route_starts[row] to
+    route_ends[row] of the route arrays, as link ids in the edge order of
+    the network and their expected durations. A route not yet planned starts
+    at -1. Nodes and activity types are numbered in tables, and durations
+    not set are NaN.
+
+    Plans are read and written through PlanView objects, which planners and
+    compile_plans use as Plans. Routes of another length, and plans of
+    another shape, are written to new rows, leaving the old rows unused
+    until compact.
+    """
+
+    def __init__(self, network: Network):
+        """
+        Args:
+            network (Network): The network the routes are planned on.
+        """
+        self.link_ids = network.link_index()
+        self.links = list(self.link_ids)
+        min_durations = network.minimum_durations()
+        self.minimums = [min_durations[edge] for edge in self.links]
+
+        self.agent_ids = []
+        self.agent_numbers = {}
+        self.starts = Column(np.int64)
+        self.ends = Column(np.int64)
+
+        self.kinds = Column(np.int8)
+        self.types = Column(np.int16)  # activity type number
+        self.locations = Column(np.int32)  # activity location or trip origin
+        self.destinations = Column(np.int32)
+        self.durations = Column(np.float64)  # activity or expected trip
+        self.route_starts = Column(np.int64)
+        self.route_ends = Column(np.int64)
+
+        self.route_links = Column(np.int32)
+        self.route_durations = Column(np.float64)
+
+        self.nodes = []
+        self.node_numbers = {}
+        self.activity_types = []
+        self.type_numbers = {}
+
+    @classmethod
+    def from_plans(
+        cls, plans: Dict[Hashable, Plan], network: Network
+    ) -> "Population":
+        """Copy a dictionary of plans into a population."""
+        population = cls(network)
+        for agent_id, plan in plans.items():
+            population[agent_id] = plan
+        return population
+
+    def to_plans(self) -> Dict[Hashable, Plan]:
+        """Copy the population into a dictionary of plans."""
+        return {agent_id: self[agent_id].copy() for agent_id in self}
+
+    def __getitem__(self, agent_id: Hashable) -> "PlanView":
+        return PlanView(self, self.agent_numbers[agent_id])
+
+    def __setitem__(self, agent_id: Hashable, plan: Plan):
+        """Write a plan, in place if the agent's plan has the same shape."""
+        components = plan.components
+        kinds = [component_kind(component) for component in components]
+        agent = self.agent_numbers.get(agent_id)
+        if agent is None:
+            agent = len(self.agent_ids)
+            self.agent_ids.append(agent_id)
+            self.agent_numbers[agent_id] = agent
+            self.starts.extend([0])
+            self.ends.extend([0])
+        else:
+            start, end = self.starts[agent], self.ends[agent]
+            if self.kinds[start:end].tolist() == kinds:
+                for row, component in zip(range(start, end), components):
+                    self.write(row, component)
+                return
+
+        n = len(components)
+        start = self.kinds.extend(kinds)
+        self.types.extend(np.full(n, -1))
+        self.locations.extend(np.full(n, -1))
+        self.destinations.extend(np.full(n, -1))
+        self.durations.extend(np.full(n, np.nan))
+        self.route_starts.extend(np.full(n, -1))
+        self.route_ends.extend(np.full(n, -1))
+        for row, component in enumerate(components, start):
+            self.write(row, component)
+        self.starts[agent] = start
+        self.ends[agent] = start + n
+
+    def __delitem__(self, agent_id: Hashable):
+        raise TypeError("Agents cannot be removed.")
+
+    def __iter__(self):
+        return iter(self.agent_ids)
+
+    def __len__(self):
+        return len(self.agent_ids)
+
+    def write(self, row: int, component):
+        """Write the fields of a component to a row of its kind."""
+        if isinstance(component, Activity):
+            ActivityView.write(self, row, component)
+        elif isinstance(component, Trip):
+            TripView.write(self, row, component)
+
+    def node(self, number: int) -> Hashable:
+        return None if number < 0 else self.nodes[number]
+
+    def node_number(self, node: Hashable) -> int:
+        if node is None:
+            return -1
+        if node not in self.node_numbers:
+            self.node_numbers[node] = len(self.nodes)
+            self.nodes.append(node)
+        return self.node_numbers[node]
+
+    def type_number(self, type) -> int:
+        if type not in self.type_numbers:
+            self.type_numbers[type] = len(self.activity_types)
+            self.activity_types.append(type)
+        return self.type_numbers[type]
+
+    def write_route(self, row: int, route):
+        """Write a list of (edge, expected, minimum) tuples as a trip's route,
+        over its last route if of the same length.
+        """
+        if route is None:
+            self.route_starts[row] = self.route_ends[row] = -1
+            return
+        links = [self.link_ids[edge] for edge, _, _ in route]
+        durations = [expected for _, expected, _ in route]
+        start, end = self.route_starts[row], self.route_ends[row]
+        if start >= 0 and end - start == len(links):
+            self.route_links[start:end] = links
+            self.route_durations[start:end] = durations
+            return
+        start = self.route_links.extend(links)
+        self.route_durations.extend(durations)
+        self.route_starts[row] = start
+        self.route_ends[row] = start + len(links)
+
+    def compact(self):
+        """Drop rows no longer used by any plan or route, in agent order."""
+        starts, ends = self.starts.array, self.ends.array
+        rows = runs(starts, ends)
+        for name in COMPONENT_COLUMNS:
+            setattr(self, name, column_of(getattr(self, name).array[rows]))
+        lengths = ends - starts
+        starts = np.cumsum(lengths) - lengths
+        self.starts, self.ends = column_of(starts), column_of(starts + lengths)
+
+        route_starts, route_ends = (
+            self.route_starts.array,
+            self.route_ends.array,
+        )
+        planned = np.flatnonzero(route_starts >= 0)
+        route_rows = runs(route_starts[planned], route_ends[planned])
+        self.route_links = column_of(self.route_links.array[route_rows])
+        self.route_durations = column_of(self.route_durations.array[route_rows])
+        lengths = route_ends[planned] - route_starts[planned]
+        route_starts[planned] = np.cumsum(lengths) - lengths
+        route_ends[planned] = route_starts[planned] + lengths
+
+    @property
+    def nbytes(self) -> int:
+        """The bytes of the arrays in use."""
+        return sum(
+            column.array.nbytes
+            for column in vars(self).values()
+            if isinstance(column, Column)
+        )
+
+
+class PlanView(Plan):
+    """An agent's plan in a population, read and written through its views.
+
+    Components are views of the population's rows, made on each access, so
+    changes to the list itself, as by add, are not kept. Write a Plan to the
+    population to change its shape.
+    """
+
+    __slots__ = ("population", "agent")
+
+    def __init__(self, population: Population, agent: int):
+        self.population = population
+        self.agent = agent
+
+    @property
+    def components(self) -> list:
+        population = self.population
+        start, end = population.starts[self.agent], population.ends[self.agent]
+        kinds = population.kinds[start:end].tolist()
+        return [
+            VIEWS[kind](population, row)
+            for row, kind in zip(range(start, end), kinds)
+        ]
+
+    def __reduce__(self):
+        # pickle as a detached plan, not the whole population
+        return plan_of, (self.copy().components,)
+
+
+class SOSView(SOS):
+    __slots__ = ()
+
+    def __init__(self, population: Population, row: int):
+        pass
+
+
+class EOSView(EOS):
+    __slots__ = ()
+
+    def __init__(self, population: Population, row: int):
+        pass
+
+
+class ActivityView(Activity):
+    """An activity in a population."""
+
+    __slots__ = ("population", "row")
+
+    def __init__(self, population: Population, row: int):
+        self.population = population
+        self.row = row
+
+    @staticmethod
+    def write(population: Population, row: int, activity: Activity):
+        population.types[row] = population.type_number(activity.type)
+        population.locations[row] = population.node_number(activity.location)
+        population.durations[row] = (
+            np.nan if activity.duration is None else activity.duration
+        )
+
+    @property
+    def type(self):
+        return self.population.activity_types[
+            self.population.types.data.item(self.row)
+        ]
+
+    @property
+    def location(self):
+        return self.population.node(
+            self.population.locations.data.item(self.row)
+        )
+
+    @property
+    def duration(self):
+        duration = self.population.durations.data.item(self.row)
+        return None if duration != duration else duration
+
+    @duration.setter
+    def duration(self, duration):
+        self.population.durations[self.row] = (
+            np.nan if duration is None else duration
+        )
+
+
+class TripView(Trip):
+    """A trip in a population."""
+
+    __slots__ = ("population", "row")
+
+    def __init__(self, population: Population, row: int):
+        self.population = population
+        self.row = row
+
+    @staticmethod
+    def write(population: Population, row: int, trip: Trip):
+        population.locations[row] = population.node_number(trip.origin)
+        population.destinations[row] = population.node_number(trip.destination)
+        population.durations[row] = (
+            np.nan if trip.expected_duration is None else trip.expected_duration
+        )
+        population.write_route(row, trip.route)
+
+    @property
+    def origin(self):
+        return self.population.node(
+            self.population.locations.data.item(self.row)
+        )
+
+    @property
+    def destination(self):
+        return self.population.node(
+            self.population.destinations.data.item(self.row)
+        )
+
+    @property
+    def expected_duration(self):
+        duration = self.population.durations.data.item(self.row)
+        return None if duration != duration else duration
+
+    @expected_duration.setter
+    def expected_duration(self, duration):
+        self.population.durations[self.row] = (
+            np.nan if duration is None else duration
+        )
+
+    @property
+    def route(self):
+        population = self.population
+        start = population.route_starts.data.item(self.row)
+        if start < 0:
+            return None
+        end = population.route_ends.data.item(self.row)
+        links = population.route_links.data[start:end].tolist()
+        durations = population.route_durations.data[start:end].tolist()
+        edges, minimums = population.links, population.minimums
+        return [
+            (edges[link], duration, minimums[link])
+            for link, duration in zip(links, durations)
+        ]
+
+    @route.setter
+    def route(self, route):
+        self.population.write_route(self.row, route)
+
+
+COMPONENT_COLUMNS = (
+    "kinds",
+    "types",
+    "locations",
+    "destinations",
+    "durations",
+    "route_starts",
+    "route_ends",
+)
+
+VIEWS = {
+    SOS_KIND: SOSView,
+    ACTIVITY_KIND: ActivityView,
+    TRIP_KIND: TripView,
+    EOS_KIND: EOSView,
+}
+
+
+def component_kind(component) -> int:
+    if isinstance(component, Activity):
+        return ACTIVITY_KIND
+    if isinstance(component, Trip):
+        return TRIP_KIND
+    if isinstance(component, SOS):
+        return SOS_KIND
+    if isinstance(component, EOS):
+        return EOS_KIND
+    raise TypeError(f"Unknown plan component {component!r}.")
+
+
+def column_of(values: np.ndarray) -> Column:
+    column = Column(values.dtype, max(len(values), 1))
+    column.extend(values)
+    return column
+
+
+def runs(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Get the rows of runs from starts up to ends, one run after another."""
+    lengths = ends - starts
+    firsts = np.cumsum(lengths) - lengths
+    return np.repeat(starts - firsts, lengths) + np.arange(lengths.sum())
+
+
+def plan_of(components: list) -> Plan:
+    plan = Plan()
+    plan.components = components
+    return plan
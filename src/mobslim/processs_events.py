@@ -1,6 +1,13 @@
 from typing import Hashable
 
+import numpy as np
+
 from mobslim.agents import Activity, InstructionType, Plan, Trip
+from mobslim.listener import AggregatingListener, ColumnarLog
+from mobslim.store import EventStore
+from mobslim.tapes import ENTER_ACTIVITY, ENTER_LINK, EXIT_ACTIVITY, EXIT_LINK
+
+CODES = {instruction: instruction.value for instruction in InstructionType}
 
 
 def events_to_plans(events: list) -> dict:
@@ -54,6 +61,8 @@ def events_to_plans(events: list) -> dict:
 
 def trip_durations(events: list) -> list:
     """Calculate the lengths of trips based on events."""
+    if isinstance(events, AggregatingListener):
+        return events.trip_durations()
     trip_monitor = {}
     durations = []
     for time, idx, instruction in events:
@@ -68,6 +77,8 @@ def trip_durations(events: list) -> list:
 
 
 def trip_lengths(network, events: list) -> list:
+    if isinstance(events, AggregatingListener):
+        return events.trip_lengths()
     link_distances = {(u, v): network.G[u][v]["length"] for (u, v) in network.G.edges}
     trip_lengths = []
     trip_monitor = {}
@@ -85,6 +96,8 @@ def trip_lengths(network, events: list) -> list:
 
 def av_link_durations(plans, network, events: list) -> dict:
     """Calculate the average link durations based on events."""
+    if isinstance(events, AggregatingListener):
+        return events.av_link_durations()
     idx_monitor = {idx: None for idx in plans.keys()}
     link_durations = {link: [] for link in network.G.edges}
     for time, idx, instruction in events:
@@ -106,6 +119,8 @@ def av_link_durations(plans, network, events: list) -> dict:
 
 def expected_link_durations(plans, network, events: list) -> dict:
     """Calculate the expected link durations based on events."""
+    if isinstance(events, AggregatingListener):
+        return events.expected_link_durations()
     idx_monitor = {idx: None for idx in plans.keys()}
     link_durations = {link: [] for link in network.G.edges}
     for time, idx, instruction in events:
@@ -157,5 +172,159 @@ def av_link_speeds(plans, network, events: list) -> dict:
 
 
 def filter_agent(events: list, agent_id: Hashable) -> list:
-    """Filter events for a specific agent."""
+    """Filter events for a specific agent, looked up if events are an EventStore."""
+    if isinstance(events, EventStore):
+        return list(events.agent(agent_id))
     return [event for event in events if event[1] == agent_id]
+
+
+def analyse_events(network, events) -> dict:
+    """Calculate trip and link statistics in a single pass over the events.
+
+    The events are read once into columns, then trips and link traversals are
+    matched up with numpy. Results are the same as from trip_durations,
+    trip_lengths, av_link_durations, expected_link_durations and
+    av_link_speeds.
+
+    Args:
+        network (Network): The simulated network.
+        events (list): Events from an EventListener, or a ColumnarLog.
+
+    Returns:
+        dict: The statistics, with keys trip_durations, trip_lengths,
+            av_link_durations, expected_link_durations and av_link_speeds.
+    """
+    times, agents, codes, links = event_columns(network, events)
+    edges = list(network.G.edges)
+    lengths = np.array([network.G[u][v]["length"] for u, v in edges], dtype=float)
+
+    # each agent's events in log order
+    order = np.argsort(agents, kind="stable")
+
+    # a trip is an exit from an activity followed by an entry to the next one
+    starts, ends = follows(order, agents, codes, EXIT_ACTIVITY, ENTER_ACTIVITY)
+    durations = times[ends] - times[starts]
+
+    # trip lengths add up in event order, as the entries are summed one by one
+    trip_ids = np.empty(len(codes), dtype=np.int64)
+    trip_ids[order] = np.cumsum(codes[order] == EXIT_ACTIVITY)
+    entries = np.flatnonzero(codes == ENTER_LINK)
+    distances = np.zeros(len(codes) + 1)
+    np.add.at(distances, trip_ids[entries], lengths[links[entries]])
+
+    # a link traversal is an exit from the link last entered
+    enters, exits = follows(order, agents, codes, ENTER_LINK, EXIT_LINK)
+    traversed = links[enters]
+    link_durations = times[exits] - times[enters]
+
+    by_link = np.argsort(traversed, kind="stable")
+    counts = np.bincount(traversed, minlength=len(edges))
+    grouped = np.split(link_durations[by_link], np.cumsum(counts)[:-1])
+
+    min_durations = network.minimum_durations()
+    av_durations = {}
+    expected_durations = {}
+    speeds = {}
+    for link, (edge, group) in enumerate(zip(edges, grouped)):
+        if not len(group):
+            av_durations[edge] = None
+            expected_durations[edge] = min_durations[edge]
+            continue
+        # the builtin sum, for the same rounding as the event loops
+        mean = sum(group.tolist()) / len(group)
+        av_durations[edge] = mean
+        expected_durations[edge] = mean
+        length = lengths.item(link)
+        speeds[edge] = length / (sum((length / group).tolist()) / len(group))
+
+    return {
+        "trip_durations": durations.tolist(),
+        "trip_lengths": distances[trip_ids[ends]].tolist(),
+        "av_link_durations": av_durations,
+        "expected_link_durations": expected_durations,
+        "av_link_speeds": speeds,
+    }
+
+
+def follows(order, agents, codes, first: int, second: int) -> tuple:
+    """Pair events with the previous event of the same agent.
+
+    Only events with either opcode are considered, and pairs are an event
+    with the first opcode followed by one with the second.
+
+    Returns:
+        tuple: Rows of the first and second events of each pair, in the log
+            order of the second events.
+    """
+    rows = order[(codes[order] == first) | (codes[order] == second)]
+    found = (
+        (codes[rows[:-1]] == first)
+        & (codes[rows[1:]] == second)
+        & (agents[rows[:-1]] == agents[rows[1:]])
+    )
+    previous = np.full(len(codes), -1, dtype=np.int64)
+    previous[rows[1:][found]] = rows[:-1][found]
+    seconds = np.flatnonzero(previous >= 0)
+    return previous[seconds], seconds
+
+
+def observed_link_durations(network, events, link_ids: dict = None) -> tuple:
+    """Get the average duration on each link traversed in the events.
+
+    Only traversed links are looked at, so the cost is of the events, not of
+    the network. Averages are as from expected_link_durations.
+
+    Args:
+        network (Network): The simulated network.
+        events (list): Events from an EventListener, a ColumnarLog, or an
+            AggregatingListener.
+        link_ids (dict): The network's link index, to save building it.
+
+    Returns:
+        tuple: Arrays of the ids of the traversed links, in order, and of
+            their average durations.
+    """
+    if isinstance(events, AggregatingListener):
+        links = np.flatnonzero(events.link_counts)
+        means = (events.link_sums[links] + events.link_errors[links]) / events.link_counts[links]
+        return links, means
+    times, agents, codes, links = event_columns(network, events, link_ids)
+    order = np.argsort(agents, kind="stable")
+    enters, exits = follows(order, agents, codes, ENTER_LINK, EXIT_LINK)
+    traversed = links[enters]
+    by_link = np.argsort(traversed, kind="stable")
+    observed, starts = np.unique(traversed[by_link], return_index=True)
+    groups = np.split((times[exits] - times[enters])[by_link], starts[1:])
+    # the builtin sum, for the same rounding as the event loops
+    means = [sum(group.tolist()) / len(group) for group in groups if len(group)]
+    return observed, np.array(means, dtype=float)
+
+
+def event_columns(network, events, link_ids: dict = None) -> tuple:
+    """Read events into time, agent number, opcode and link id arrays.
+
+    Link ids are the edge order of the network, and -1 for events not on a
+    link. A ColumnarLog is used without decoding its events.
+    """
+    if link_ids is None:
+        link_ids = network.link_index()
+    if isinstance(events, ColumnarLog):
+        times, agents = events.times, events.agents
+        codes = np.asarray(events.codes, dtype=np.int64)
+        on_link = (codes == ENTER_LINK) | (codes == EXIT_LINK)
+        # the last entry maps the -1 index of events not on a link
+        links = np.array([link_ids[uv] for uv in events.links] + [-1])
+        links = links[np.where(on_link, events.indices, -1)]
+    else:
+        numbers = {}
+        times, idxs, instructions = zip(*events) if events else ((), (), ())
+        agents = [numbers.setdefault(idx, len(numbers)) for idx in idxs]
+        codes = np.array([CODES[instruction[0]] for instruction in instructions], dtype=np.int64)
+        links = np.array([link_ids.get(instruction[2], -1) for instruction in instructions])
+    links = np.where((codes == ENTER_LINK) | (codes == EXIT_LINK), links, -1)
+    return (
+        np.asarray(times, dtype=float),
+        np.asarray(agents, dtype=np.int64),
+        codes,
+        links.astype(np.int64),
+    )
@@ -0,0 +1,111 @@
+import heapq
+from typing import Iterable, Optional, Tuple
+
+Entry = Tuple[float, int]  # (time, agent)
+
+
+class HeapScheduler:
+    """Schedule of agent instructions as a binary heap of (time, agent).
+
+    Entries are popped in (time, agent) order, so ties in time are broken by
+    agent number.
+    """
+
+    def __init__(self, entries: Iterable[Entry] = ()):
+        self.heap = list(entries)
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, time: float, agent: int):
+        heapq.heappush(self.heap, (time, agent))
+
+    def pop(self) -> Entry:
+        return heapq.heappop(self.heap)
+
+    def peek(self) -> Optional[Entry]:
+        """Get the next entry without removing it, or None if empty."""
+        return self.heap[0] if self.heap else None
+
+
+class CalendarScheduler:
+    """Schedule of agent instructions as a calendar queue of one second buckets.
+
+    Buckets form a wheel covering the next horizon seconds from the current
+    second, entries further ahead wait in an overflow heap until the wheel
+    reaches them. Each bucket is a small heap, so entries are popped in the
+    same (time, agent) order as HeapScheduler. Times must not be scheduled
+    before the second of the last popped entry.
+    """
+
+    def __init__(self, entries: Iterable[Entry] = (), horizon: int = 4096):
+        self.horizon = horizon
+        self.wheel = [[] for _ in range(horizon)]
+        self.second = 0  # second of the current bucket
+        self.size = 0  # entries in the wheel
+        self.overflow = []
+        entries = list(entries)
+        if entries:
+            self.second = int(min(entries)[0])
+        for time, agent in entries:
+            self.push(time, agent)
+
+    def __len__(self):
+        return self.size + len(self.overflow)
+
+    def push(self, time: float, agent: int):
+        second = int(time)
+        if second < self.second:
+            raise ValueError(
+                f"Cannot schedule at {time}, before the current second."
+            )
+        if second - self.second >= self.horizon:
+            heapq.heappush(self.overflow, (time, agent))
+            return
+        heapq.heappush(self.wheel[second % self.horizon], (time, agent))
+        self.size += 1
+
+    def pop(self) -> Entry:
+        bucket = self.wheel[self.second % self.horizon]
+        if not bucket:
+            bucket = self.next_bucket()
+        self.size -= 1
+        return heapq.heappop(bucket)
+
+    def peek(self) -> Optional[Entry]:
+        """Get the next entry without removing it, or None if empty.
+
+        The wheel is not advanced, so entries may still be pushed at any time
+        from the second of the last popped entry.
+        """
+        if not self.size:
+            return self.overflow[0] if self.overflow else None
+        second = self.second
+        while not self.wheel[second % self.horizon]:
+            second += 1
+        return self.wheel[second % self.horizon][0]
+
+    def next_bucket(self) -> list:
+        """Advance the wheel to the first non-empty bucket and return it."""
+        bucket = self.wheel[self.second % self.horizon]
+        while not bucket:
+            if not self.size:
+                if not self.overflow:
+                    raise IndexError("pop from an empty scheduler")
+                # skip empty seconds up to the next overflow entry
+                self.second = int(self.overflow[0][0])
+            else:
+                self.second += 1
+            self.fill()
+            bucket = self.wheel[self.second % self.horizon]
+        return bucket
+
+    def fill(self):
+        """Move overflow entries that are now within the horizon onto the wheel."""
+        end = self.second + self.horizon
+        overflow = self.overflow
+        while overflow and overflow[0][0] < end:
+            time, agent = heapq.heappop(overflow)
+            heapq.heappush(self.wheel[int(time) % self.horizon], (time, agent))
+            self.size += 1
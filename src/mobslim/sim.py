@@ -1,162 +1,387 @@
-import heapq
-from typing import Dict, Hashable
-
-from mobslim.agents import InstructionType, Plan
-from mobslim.listener import EventListener
+import bisect
+import math
+import pickle
+from operator import itemgetter
+from typing import Dict, Hashable, Optional, Sequence, Union
+
+from mobslim.agents import Plan
+from mobslim.links import SimLinks
+from mobslim.listener import EventListener, Listeners, subscribed_opcodes
 from mobslim.network import Network
+from mobslim.schedulers import HeapScheduler
+from mobslim.tapes import ENTER_LINK, EOS_CODE, EXIT_LINK, Tapes, compile_plans
 
 VEH_SIZE = 4  # Size of the vehicle in meters
+SNAPSHOT_VERSION = 1
 
 
 class Sim:
     def __init__(
         self,
         network: Network,
-        listener: EventListener,
+        listener: Union[EventListener, Sequence[EventListener]],
+        links: type = SimLinks,
+        scheduler: type = HeapScheduler,
+        flow_capacity_factor: float = 1.0,
+        storage_capacity_factor: float = 1.0,
     ):
         """
         Initialize the simulation with a network and expected link durations.
 
         :param network: The network to simulate.
         :param plans: A dictionary of plans for each agent.
-        :param listener: An event listener to handle events during the simulation.
+        :param listener: An event listener to handle events during the simulation,
+            or a list of listeners, in which case the run returns their logs.
+        :param links: The link store to hold link state, SimLinks or ArrayLinks.
+        :param scheduler: The scheduler of agent instructions, HeapScheduler or
+            CalendarScheduler.
+        :param flow_capacity_factor: Scale of link flow capacities, set to the
+            sample rate when simulating a sample of the population.
+        :param storage_capacity_factor: Scale of link storage capacities, also
+            set to the sample rate, or somewhat above for small samples.
         """
+        if isinstance(listener, (list, tuple)):
+            listener = Listeners(listener)
         self.network = network
         self.event_listener = listener
+        self.link_store = links
+        self.scheduler = scheduler
+        self.flow_capacity_factor = flow_capacity_factor
+        self.storage_capacity_factor = storage_capacity_factor
 
-    def set(self, plans: Dict[Hashable, Plan]):
-
-        self.instructions = {
-            agent_id: plan.get_instructions() for agent_id, plan in plans.items()
-        }
+    def set(self, plans: Union[Dict[Hashable, Plan], Tapes]):
+        """Compile plans into instruction tapes and reset the simulation.
 
-        self.queue = []
-        for agent_id, instruction_q in self.instructions.items():
-            instruction_a, instruction_b = next(instruction_q)
-            min_duration = instruction_a[3]
-            heapq.heappush(
-                self.queue, (min_duration, agent_id, (instruction_a, instruction_b))
-            )
+        :param plans: A dictionary of plans for each agent, or compiled tapes.
+        """
+        if not isinstance(plans, Tapes):
+            plans = compile_plans(plans, self.network)
+        self.tapes = plans
+        self.agent_ids = self.tapes.agent_ids
+        # next instruction pair of each agent, as a row in its tape
+        self.cursor = self.tapes.offsets[:-1].copy()
+
+        starts = self.tapes.durations[self.cursor]
+        self.queue = self.scheduler(
+            zip(starts.tolist(), range(len(self.tapes)))
+        )
 
         self.time = 0
 
-        self.sim_links = {
-            edge: SimLink(attributes)
-            for edge, attributes in self.network.G.edges.items()
-        }
+        self.links = self.link_store(
+            self.network,
+            VEH_SIZE,
+            flow_capacity_factor=self.flow_capacity_factor,
+            storage_capacity_factor=self.storage_capacity_factor,
+        )
+        # agents blocked from entering or exiting links, by link, made only
+        # for links that agents block on
+        self.entry_blocked = {}
+        self.exit_blocked = {}
+        self.woken = {}  # agent: Blocked it was woken from
         self.event_listener.reset()
+        self.event_listener.bind(self.tapes)
+        # whether the listener takes each opcode, so others are not sent
+        self.subscribed = subscribed_opcodes(self.event_listener)
 
     def run(self, steps: int = 86400):
         while self.queue and self.time < steps:
+            if self.queue.peek()[0] >= steps and self.stop_blocked(steps):
+                break
             self.step_instruction()
+        if self.time < steps:
+            self.stop_blocked(steps)
         return self.event_listener.log
 
-    def can_exit(self, agent_id, instruction_a):
-        if instruction_a[0] == InstructionType.ExitLink:
-            _, _, uv, _ = instruction_a
-            if self.sim_links[uv].can_exit(self.time):
-                return True
-            return False
-        return True
+    def save(self, path: str):
+        """Save the state of the simulation to resume it later.
+
+        The snapshot holds the network, compiled tapes and agent cursors, the
+        scheduler queue, link and blocked agent state, and the event listener
+        with its events so far. Snapshots are pickles, only load trusted ones.
+
+        :param path: The path of the snapshot file.
+        """
+        with open(path, "wb") as f:
+            pickle.dump(
+                {"version": SNAPSHOT_VERSION, "sim": self},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+
+    @classmethod
+    def load(cls, path: str, listener: Optional[EventListener] = None) -> "Sim":
+        """Load a simulation saved with save, to continue with run.
 
-    def can_enter(self, agent_id, instruction_b):
-        if instruction_b[0] == InstructionType.EnterLink:
-            _, _, uv, _ = instruction_b
-            if self.sim_links[uv].can_enter(VEH_SIZE, self.time):
-                return True
+        :param path: The path of the snapshot file.
+        :param listener: An event listener to take events from the snapshot
+            time on, in place of the saved listener and its events.
+        """
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version in {path}.")
+        sim = snapshot["sim"]
+        if not isinstance(sim, cls):
+            raise TypeError(
+                f"Snapshot holds a {type(sim).__name__}, not a {cls.__name__}."
+            )
+        if listener is not None:
+            listener.bind(sim.tapes)
+            sim.event_listener = listener
+        sim.subscribed = subscribed_opcodes(sim.event_listener)
+        return sim
+
+    def stop_blocked(self, steps: int) -> bool:
+        """Advance the clock to the first retry of a blocked agent at or past steps.
+
+        Blocked agents are not queued, so this stands in for the failed retry
+        that would otherwise end the run. Returns True if such a retry comes
+        before the next queued instruction.
+        """
+        retry = self.first_blocked_retry(steps)
+        if retry is None:
+            return False
+        if self.queue and self.queue.peek() <= retry:
             return False
+        self.time = retry[0]
         return True
 
-    def step_instruction(self):
+    def first_blocked_retry(self, time: float) -> Optional[tuple]:
+        """Get the first (retry, agent) of blocked agents at or past time, if any."""
+        retries = [
+            (retry_time(since, time), agent)
+            for blocked_links in (self.entry_blocked, self.exit_blocked)
+            for blocked in blocked_links.values()
+            for since, agent in blocked.since()
+        ]
+        return min(retries, default=None)
 
-        self.time, agent_id, (instruction_a, instruction_b) = heapq.heappop(self.queue)
+    def step_instruction(self):
 
-        if not self.can_exit(agent_id, instruction_a):
-            # cannot exit, requeue with a small delay
-            heapq.heappush(
-                self.queue, (self.time + 1, agent_id, (instruction_a, instruction_b))
-            )
+        self.time, agent = self.queue.pop()
+
+        woken = self.woken.pop(agent, None)
+        if woken is not None:
+            del woken.pending[agent]
+
+        tapes = self.tapes
+        row = self.cursor.item(agent)
+        opcode_a = tapes.opcodes.item(row)
+        opcode_b = tapes.opcodes.item(row + 1)
+
+        # links being exited and entered, if any
+        a = tapes.indices.item(row) if opcode_a == EXIT_LINK else None
+        b = tapes.indices.item(row + 1) if opcode_b == ENTER_LINK else None
+
+        if a is not None and not self.links.can_exit(a, self.time):
+            # cannot exit, wait for the link to release a vehicle
+            blocked = block(self.exit_blocked, a)
+            blocked.add(self.time, agent)
+            self.wake_exit(a, agent)
+            if woken is not None and woken is not blocked:
+                # pass the free space on to the next blocked agent
+                self.wake_entry(b, agent)
             return
 
-        if not self.can_enter(agent_id, instruction_b):
-            # cannot enter, requeue with a small delay
-            heapq.heappush(
-                self.queue, (self.time + 1, agent_id, (instruction_a, instruction_b))
-            )
+        if b is not None and not self.links.can_enter(b, VEH_SIZE, self.time):
+            # cannot enter, wait for a vehicle to leave the link
+            blocked = block(self.entry_blocked, b)
+            blocked.add(self.time, agent)
+            if woken is not None and woken is not blocked:
+                # pass the exit on to the next blocked agent
+                self.wake_exit(a, agent)
             return
 
         # do link exit and entry
-        if instruction_a[0] == InstructionType.ExitLink:
-            _, _, uv, _ = instruction_a
-            self.sim_links[uv].exit(agent_id, self.time)
-
-        if instruction_b[0] == InstructionType.EnterLink:
-            _, _, uv, _ = instruction_b
-            self.sim_links[uv].enter(agent_id, VEH_SIZE, self.time)
-
-        self.event_listener.add(self.time, agent_id, instruction_a)
-        self.event_listener.add(self.time, agent_id, instruction_b)
+        agent_id = self.agent_ids[agent]
+        if a is not None:
+            self.links.exit(a, agent_id, self.time)
+            self.wake_exit(a, agent)
+            self.wake_entry(a, agent)
+
+        if b is not None:
+            self.links.enter(b, agent_id, VEH_SIZE, self.time)
+            if woken is not None and woken is self.entry_blocked.get(b):
+                # there may be space for more
+                self.wake_entry(b, agent)
+
+        if self.subscribed[opcode_a]:
+            self.event_listener.add_instruction(self.time, agent, tapes, row)
+        if self.subscribed[opcode_b]:
+            self.event_listener.add_instruction(
+                self.time, agent, tapes, row + 1
+            )
 
-        if instruction_b[0] == InstructionType.EOS:
+        if opcode_b == EOS_CODE:
             # end of simulation for this agent
             return
 
         # schedule next instruction after activity duration
-        next_instruction = next(self.instructions[agent_id])
-        min_duration = next_instruction[0][3]
-        heapq.heappush(
-            self.queue, (self.time + min_duration, agent_id, next_instruction)
-        )
+        row += 2
+        self.cursor[agent] = row
+        min_duration = tapes.durations.item(row)
+        if min_duration != min_duration:
+            raise ValueError(
+                f"Agent {agent_id} has an activity without a duration."
+            )
+        self.queue.push(self.time + min_duration, agent)
 
         return
 
-
-class SimLink:
-    def __init__(self, attributes: dict):
+    def wake_exit(self, link: int, agent: int):
+        """Wake the next agent blocked from exiting a link, at its next exit time."""
+        blocked = self.exit_blocked.get(link)
+        if blocked is not None and blocked.agents:
+            self.wake(blocked, self.links.next_exit_time(link), agent)
+
+    def wake_entry(self, link: int, agent: int):
+        """Wake the next agent blocked from entering a link, if it has space."""
+        blocked = self.entry_blocked.get(link)
+        if (
+            blocked is not None
+            and blocked.agents
+            and self.links.can_enter(link, VEH_SIZE, self.time)
+        ):
+            self.wake(blocked, self.time, agent)
+
+    def wake(self, blocked: "Blocked", ready: float, agent: int):
+        """Requeue the blocked agent that would retry first once ready.
+
+        Blocked agents are woken in the same order as if each had retried
+        once a second since it was blocked, so wakes are placed after the
+        current instruction of agent. Nothing is requeued if an agent woken
+        earlier is already due to retry first.
         """
-        Initialize a simulated link
-
-        :param attributes: A dictionary containing the attributes of the link, including 'length'.
-        """
-        length = attributes["length"]  # Distance of the link
-        lanes = attributes["lanes"]  # Number of lanes on the link
-        freespeed = attributes["freespeed"]  # Free speed on the link
-        flow_capacity = attributes["flow_capacity"]  # Flow capacity of the link
-
-        self.storage_capacity = length * lanes  # meters
-        self.flow_capacity = int(1 / (flow_capacity * lanes))  # seconds per vehicle
-        self.min_duration = int(length / freespeed)  # seconds
-
-        self.queue = []
-        self.earliest_next_exit = 0
-
-    def reset(self):
-        self.queue = []
-        self.earliest_next_exit = 0
-
-    def can_exit(self, time: int) -> bool:
-        _, _, earliest_exit = self.queue[
-            0
-        ]  # todo: this is a duplicate check in sim loop
-        return earliest_exit <= time and self.has_flow_capacity(time)
-
-    def exit(self, agent_id: Hashable, time: int) -> tuple:
-        self.earliest_next_exit = time + self.flow_capacity
-        return self.queue.pop(0)
-
-    def can_enter(self, size: int, time: int) -> bool:
-        return self.has_storage_capacity(size)
-
-    def enter(self, agent_id: Hashable, size: int, time: int):
-        self.add_to_queue(agent_id, size, time)
-
-    def has_storage_capacity(self, size: int) -> bool:
-        request_size = sum([m for _, m, _ in self.queue]) + size
-        return request_size <= self.storage_capacity
+        ready = max(ready, self.time)
+        first = None
+        for i in blocked.candidates(ready, agent):
+            _, waiter, since = blocked.agents[i]
+            retry = retry_time(since, ready)
+            if retry == self.time and waiter < agent:
+                retry += 1
+            if first is None or (retry, waiter) < first[1]:
+                first = i, (retry, waiter)
+        i, retry = first
+        if blocked.pending and blocked.next_pending() <= retry:
+            return
+        _, waiter, since = blocked.agents.pop(i)
+        self.queue.push(*retry)
+        blocked.pending[waiter] = (retry[0], since)
+        self.woken[waiter] = blocked
+
+
+class Blocked:
+    """Agents blocked on one side of a link.
+
+    Agents are kept as (phase, agent, since), sorted by the fraction of a
+    second at which they were blocked. Retrying once a second, agents retry
+    in phase order from any time, and agents with the same phase retry
+    together, so the next agent to retry can be found without checking all.
+    """
+
+    # phases closer than this may retry out of phase order due to rounding
+    TOLERANCE = 1e-6
+
+    def __init__(self):
+        self.agents = []
+        self.pending = {}  # agent: (retry, since) of woken agents
+
+    def add(self, since: float, agent: int):
+        bisect.insort(self.agents, (since % 1, agent, since))
+
+    def candidates(self, ready: float, agent: int) -> set:
+        """Get indices of the agents that may be first to retry once ready."""
+        if len(self.agents) <= 16:
+            return range(len(self.agents))
+        phase = ready % 1
+        # agents retrying around ready, which may be a second late
+        low, high = phase - self.TOLERANCE, phase + self.TOLERANCE
+        candidates = self.firsts(low, high, ready, agent)
+        # and the agents next in phase order
+        i = bisect.bisect_right(self.agents, high % 1, key=itemgetter(0))
+        if i == len(self.agents):
+            i = 0
+        after = self.agents[i][0]
+        candidates.update(
+            self.firsts(after, after + self.TOLERANCE, ready, agent)
+        )
+        return candidates
 
-    def has_flow_capacity(self, time: int) -> bool:
-        return time >= self.earliest_next_exit
+    def firsts(self, low: float, high: float, ready: float, agent: int) -> set:
+        """Get indices of the first agents of each phase from low to high.
 
-    def add_to_queue(self, agent_id: Hashable, size: int, time: int):
-        earliest_exit = time + self.min_duration
-        self.queue.append((agent_id, size, earliest_exit))
+        Agents with the same phase retry at the same times, so only the
+        lowest agent of each phase can be first. Unless it was blocked at
+        ready itself, or is placed after agent when retrying now, in which
+        case it waits a second longer. Phases wrap at one.
+        """
+        ranges = [(max(low, 0), min(high, 1))]
+        if low < 0:
+            ranges.append((low + 1, 1))
+        if high >= 1:
+            ranges.append((0, high - 1))
+        indices = set()
+        for low, high in ranges:
+            i = bisect.bisect_left(self.agents, low, key=itemgetter(0))
+            end = bisect.bisect_right(self.agents, high, key=itemgetter(0))
+            while i < end:
+                phase, _, since = self.agents[i]
+                indices.add(i)
+                if since >= ready:
+                    i += 1
+                    continue
+                group_end = bisect.bisect_right(
+                    self.agents, phase, lo=i, hi=end, key=itemgetter(0)
+                )
+                after = bisect.bisect_right(
+                    self.agents, (phase, agent, math.inf), lo=i, hi=group_end
+                )
+                if after < group_end:
+                    indices.add(after)
+                i = group_end
+        return indices
+
+    def next_pending(self) -> tuple:
+        """Get the (retry, agent) of the woken agent due first."""
+        return min((retry, agent) for agent, (retry, _) in self.pending.items())
+
+    def since(self):
+        """Yield (since, agent) for blocked and woken agents."""
+        for _, agent, since in self.agents:
+            yield since, agent
+        for agent, (_, since) in self.pending.items():
+            yield since, agent
+
+
+def block(blocked_links: dict, link: int) -> Blocked:
+    """Get the agents blocked on a side of a link, made on first use."""
+    blocked = blocked_links.get(link)
+    if blocked is None:
+        blocked = blocked_links[link] = Blocked()
+    return blocked
+
+
+def retry_time(since: float, time: float) -> float:
+    """Get the first of since + 1, since + 2, ... that is not earlier than time.
+
+    This is when an agent retrying every second since it was blocked would
+    next try again.
+    """
+    retry = add_seconds(since, max(1, math.ceil(time - since) - 1))
+    while retry < time:
+        retry += 1
+    return retry
+
+
+def add_seconds(time: float, seconds: int) -> float:
+    """Add whole seconds to time, rounding as if adding one second at a time."""
+    while seconds:
+        # seconds that add exactly before crossing the next power of two
+        exact = math.ceil(2.0 ** math.frexp(time)[1] - time) - 1
+        if exact >= seconds:
+            return time + seconds
+        time += exact
+        time += 1
+        seconds -= exact + 1
+    return time
@@ -0,0 +1,434 @@
+import bz2
+import gzip
+import json
+import lzma
+import queue
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from mobslim.agents import ActivityType, InstructionType
+from mobslim.listener import ColumnarListener, ColumnarLog
+from mobslim.tapes import (
+    ENTER_ACTIVITY,
+    ENTER_LINK,
+    EXIT_ACTIVITY,
+    EXIT_LINK,
+    Tapes,
+)
+
+COLUMNS = ("times", "agents", "codes", "indices", "durations")
+
+MAGIC = b"MOBSLIM\x01"
+# fixed width record of a binary event file, little endian and packed
+RECORD = np.dtype(
+    [
+        ("time", "<f8"),
+        ("agent", "<i4"),
+        ("code", "i1"),
+        ("index", "<i4"),
+        ("duration", "<f8"),
+    ]
+)
+
+
+class StreamingListener(ColumnarListener):
+    """
+    Event listener streaming batches of events to a file as a simulation runs.
+
+    Events are collected in columns of batch_size rows. Full batches are
+    written by a background thread, with at most queue_size batches waiting,
+    so memory stays bounded however long the run. The file is opened when
+    the first batch is written, or when the listener is closed, so a reset
+    before a run does not write an empty file. The log is the path of the
+    file, which is complete once the listener is closed.
+    """
+
+    def __init__(self, path, batch_size: int = 100_000, queue_size: int = 4):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.thread = None
+        super().__init__(capacity=batch_size)
+
+    def reset(self) -> None:
+        """Close any stream written to, and start a new one."""
+        if self.thread is not None:
+            self.close()
+        super().reset()
+        self.written = 0
+        self.error = None
+        self.due = True  # a stream to write, not yet opened
+
+    def start(self) -> None:
+        """Start the writer thread, if not yet started."""
+        if self.thread is None:
+            self.batches = queue.Queue(maxsize=self.queue_size)
+            self.thread = threading.Thread(target=self.drain, daemon=True)
+            self.thread.start()
+
+    def add_instruction(self, time, agent: int, tapes: Tapes, row: int) -> None:
+        super().add_instruction(time, agent, tapes, row)
+        if self.size == self.batch_size:
+            self.flush()
+
+    def add(self, time, a, b) -> None:
+        super().add(time, a, b)
+        if self.size == self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Hand the collected events to the writer and start a new batch."""
+        if self.error is not None:
+            raise self.error
+        if not self.size:
+            return
+        self.start()
+        batch = {name: getattr(self, name)[: self.size] for name in COLUMNS}
+        self.batches.put(batch)  # waits while the writer is behind
+        self.written += self.size
+        self.size = 0
+        for name in COLUMNS:
+            column = getattr(self, name)
+            setattr(self, name, np.empty(self.batch_size, dtype=column.dtype))
+
+    def close(self) -> None:
+        """Write the remaining events and close the file."""
+        if not self.due:
+            return
+        self.due = False
+        self.start()
+        self.flush()
+        self.batches.put(None)
+        self.thread.join()
+        self.thread = None
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.written + self.size
+
+    @property
+    def log(self) -> Path:
+        """Get the path of the event file."""
+        return self.path
+
+    def drain(self) -> None:
+        """Write batches until sent None, then close the file."""
+        writer = None
+        try:
+            while (batch := self.batches.get()) is not None:
+                if writer is None:
+                    writer = self.open()
+                self.write(writer, batch)
+            if writer is None:  # no events, write an empty file
+                writer = self.open()
+            self.finish(writer)
+        except Exception as error:  # raised in the simulating thread
+            self.error = error
+            # keep taking batches so the simulation is not blocked
+            while self.batches.get() is not None:
+                pass
+
+    def tables(self) -> dict:
+        """Get the tables decoding agent numbers and link and facility ids."""
+        return {
+            "agent_ids": self.agent_ids,
+            "links": self.links,
+            "facilities": [(act.value, loc) for act, loc in self.facilities],
+        }
+
+    def open(self):
+        raise NotImplementedError
+
+    def write(self, writer, batch: dict) -> None:
+        raise NotImplementedError
+
+    def finish(self, writer) -> None:
+        writer.close()
+
+
+class ArrowListener(StreamingListener):
+    """
+    Stream events to an Arrow IPC file, one record batch per batch of events.
+
+    Columns are time, agent, code, index and duration, as in ColumnarLog,
+    with the decode tables as JSON schema metadata. Needs pyarrow.
+    """
+
+    def schema(self):
+        pa = import_pyarrow()
+        return pa.schema(
+            [
+                ("time", pa.float64()),
+                ("agent", pa.int32()),
+                ("code", pa.int8()),
+                ("index", pa.int32()),
+                ("duration", pa.float64()),
+            ],
+            metadata={"mobslim": encode_tables(self.tables())},
+        )
+
+    def record_batch(self, batch: dict):
+        pa = import_pyarrow()
+        return pa.record_batch(
+            [pa.array(batch[name]) for name in COLUMNS],
+            schema=self.arrow_schema,
+        )
+
+    def open(self):
+        pa = import_pyarrow()
+        self.arrow_schema = self.schema()
+        return pa.ipc.new_file(self.path, self.arrow_schema)
+
+    def write(self, writer, batch: dict) -> None:
+        writer.write_batch(self.record_batch(batch))
+
+
+class ParquetListener(ArrowListener):
+    """
+    Stream events to a Parquet file, one row group per batch of events.
+
+    Columns are as for ArrowListener. Needs pyarrow.
+    """
+
+    def __init__(
+        self,
+        path,
+        batch_size: int = 100_000,
+        queue_size: int = 4,
+        compression: str = "snappy",
+    ):
+        self.compression = compression
+        super().__init__(path, batch_size=batch_size, queue_size=queue_size)
+
+    def open(self):
+        import_pyarrow()
+        import pyarrow.parquet as pq
+
+        self.arrow_schema = self.schema()
+        return pq.ParquetWriter(
+            self.path, self.arrow_schema, compression=self.compression
+        )
+
+
+class CSVListener(StreamingListener):
+    """
+    Stream events to a CSV file, compressed by gzip, bz2 or xz if the path
+    ends .gz, .bz2 or .xz.
+
+    Rows are decoded to time, agent_id, event, activity, location and
+    duration, where the location of a link event is its (u, v) link.
+    """
+
+    OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+    def open(self):
+        opener = self.OPENERS.get(self.path.suffix, open)
+        handle = opener(self.path, "wt", newline="")
+        self.header = True
+        return handle
+
+    def write(self, handle, batch: dict) -> None:
+        self.decoded(batch).to_csv(handle, header=self.header, index=False)
+        self.header = False
+
+    def finish(self, handle) -> None:
+        if self.header:
+            self.decoded({name: [] for name in COLUMNS}).to_csv(
+                handle, index=False
+            )
+        handle.close()
+
+    def decoded(self, batch: dict) -> pd.DataFrame:
+        codes = np.asarray(batch["codes"], dtype=np.int8)
+        indices = np.asarray(batch["indices"], dtype=np.int64)
+        links = codes_in(codes, (ENTER_LINK, EXIT_LINK))
+        facilities = codes_in(codes, (ENTER_ACTIVITY, EXIT_ACTIVITY))
+
+        activity = np.full(len(codes), None, dtype=object)
+        location = np.full(len(codes), None, dtype=object)
+        if len(self.facilities):
+            acts = object_array([act.value for act, _ in self.facilities])
+            locations = object_array([loc for _, loc in self.facilities])
+            activity[facilities] = acts[indices[facilities]]
+            location[facilities] = locations[indices[facilities]]
+        if len(self.links):
+            location[links] = object_array(self.links)[indices[links]]
+
+        names = object_array(
+            [instruction.name for instruction in InstructionType]
+        )
+        return pd.DataFrame(
+            {
+                "time": batch["times"],
+                "agent_id": object_array(self.agent_ids)[
+                    np.asarray(batch["agents"], dtype=np.int64)
+                ],
+                "event": names[codes],
+                "activity": activity,
+                "location": location,
+                "duration": batch["durations"],
+            }
+        )
+
+
+class BinaryListener(StreamingListener):
+    """
+    Stream events to a binary file of fixed width records.
+
+    The file starts with MAGIC, the length of a JSON header of the decode
+    tables as a little endian uint64 and the header, padded to 8 bytes. Then
+    each event is a RECORD. The file can be memory mapped with read_binary,
+    with no dependencies beyond numpy.
+    """
+
+    def open(self):
+        handle = open(self.path, "wb")
+        header = encode_tables(self.tables()).encode()
+        header += b" " * (-(len(MAGIC) + 8 + len(header)) % 8)
+        handle.write(MAGIC)
+        handle.write(np.uint64(len(header)).astype("<u8").tobytes())
+        handle.write(header)
+        return handle
+
+    def write(self, handle, batch: dict) -> None:
+        records = np.empty(len(batch["times"]), dtype=RECORD)
+        for field, name in zip(RECORD.names, COLUMNS):
+            records[field] = batch[name]
+        handle.write(records.tobytes())
+
+
+def read_binary(path) -> ColumnarLog:
+    """Memory map an event file written by BinaryListener.
+
+    Columns are views of the mapped file, so events are read from disk as
+    they are used, such as when iterating or taking a time window.
+
+    Args:
+        path (str): The path of the binary event file.
+
+    Returns:
+        ColumnarLog: The events, which can be iterated as event tuples.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a binary event file.")
+        size = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+        tables = json.loads(f.read(size))
+        offset = f.tell()
+        f.seek(0, 2)
+        count = (f.tell() - offset) // RECORD.itemsize
+    if count:
+        records = np.memmap(
+            path, dtype=RECORD, mode="r", offset=offset, shape=(count,)
+        )
+    else:  # an empty file cannot be mapped
+        records = np.empty(0, dtype=RECORD)
+    return ColumnarLog(
+        times=records["time"],
+        agents=records["agent"],
+        codes=records["code"],
+        indices=records["index"],
+        durations=records["duration"],
+        **decode_tables(tables),
+    )
+
+
+def read_log(path) -> ColumnarLog:
+    """Read an event file written by BinaryListener, ArrowListener or
+    ParquetListener.
+
+    Args:
+        path (str): The path of the binary, Arrow IPC or Parquet file.
+
+    Returns:
+        ColumnarLog: The events, which can be iterated as event tuples.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) == MAGIC:
+            return read_binary(path)
+    import_pyarrow()
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+
+    try:
+        table = pq.read_table(path)
+    except pyarrow.ArrowInvalid:  # not parquet, so an ipc file
+        with pyarrow.ipc.open_file(path) as reader:
+            table = reader.read_all()
+    tables = json.loads(table.schema.metadata[b"mobslim"])
+    return ColumnarLog(
+        times=table.column("time").to_numpy(),
+        agents=table.column("agent").to_numpy(),
+        codes=table.column("code").to_numpy(),
+        indices=table.column("index").to_numpy(),
+        durations=table.column("duration").to_numpy(),
+        **decode_tables(tables),
+    )
+
+
+def encode_tables(tables: dict) -> str:
+    """Write the decode tables of an event file as JSON.
+
+    Agent and node ids must be strings, numbers, or tuples of them, which
+    decode_tables restores, so that ids read back are the ids simulated.
+    """
+    try:
+        return json.dumps(tables, allow_nan=False)
+    except (TypeError, ValueError) as error:
+        raise TypeError(
+            "Event files need agent and node ids of strings, numbers or "
+            f"tuples of them: {error}"
+        ) from error
+
+
+def decode_tables(tables: dict) -> dict:
+    """Restore the decode tables of an event file from their JSON."""
+    return {
+        "agent_ids": [untuple(agent_id) for agent_id in tables["agent_ids"]],
+        "facilities": [
+            (ActivityType(act), untuple(loc))
+            for act, loc in tables["facilities"]
+        ],
+        "links": [
+            tuple(untuple(node) for node in link) for link in tables["links"]
+        ],
+    }
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as error:
+        raise ImportError(
+            "Arrow and Parquet event files need pyarrow: pip install pyarrow"
+        ) from error
+    return pyarrow
+
+
+def codes_in(codes: np.ndarray, values: tuple) -> np.ndarray:
+    return np.isin(codes, np.array(values, dtype=codes.dtype))
+
+
+def object_array(values: list) -> np.ndarray:
+    """Make a 1d object array, keeping tuples as single values."""
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+def untuple(value):
+    """Restore tuples, such as grid node ids, that JSON stored as lists."""
+    if isinstance(value, list):
+        return tuple(untuple(v) for v in value)
+    return value
@@ -0,0 +1,136 @@
+from pathlib import Path
+from typing import Hashable, Optional
+
+import numpy as np
+
+from mobslim.listener import ColumnarLog
+from mobslim.sinks import read_log
+from mobslim.tapes import ENTER_LINK, EXIT_LINK
+
+INDEX_SUFFIX = ".index.npz"
+
+
+class EventStore:
+    """
+    A finished event log, indexed to look up events by agent, link and time.
+
+    Rows of each agent's events, and of each link's enter and exit events,
+    are sorted once into contiguous runs with offsets, so the events of one
+    agent or link are found without scanning the log. Events must be in time
+    order, as from a simulation.
+    """
+
+    def __init__(self, log, index: Optional[dict] = None):
+        """
+        :param log: Events as a ColumnarLog, or a list of event tuples.
+        :param index: Index arrays from a saved index, or None to build them.
+        """
+        if not isinstance(log, ColumnarLog):
+            log = ColumnarLog.from_events(log)
+        self.log = log
+        self.agent_numbers = {a: i for i, a in enumerate(log.agent_ids)}
+        self.link_numbers = {link: i for i, link in enumerate(log.links)}
+        if index is None:
+            index = build_index(log)
+        elif int(index["size"]) != len(log):
+            raise ValueError("The index is not of this event log.")
+        self.agent_rows = index["agent_rows"]
+        self.agent_offsets = index["agent_offsets"]
+        self.link_rows = index["link_rows"]
+        self.link_offsets = index["link_offsets"]
+
+    def __len__(self):
+        return len(self.log)
+
+    def agent(
+        self, agent_id: Hashable, start: float = -np.inf, end: float = np.inf
+    ) -> ColumnarLog:
+        """Get the events of an agent from start up to end."""
+        i = self.agent_numbers.get(agent_id)
+        if i is None:
+            return self.log.take(np.empty(0, dtype=np.int64))
+        rows = self.agent_rows[
+            self.agent_offsets[i] : self.agent_offsets[i + 1]
+        ]
+        return self.log.take(self.between(rows, start, end))
+
+    def link(
+        self, link: tuple, start: float = -np.inf, end: float = np.inf
+    ) -> ColumnarLog:
+        """Get the enter and exit events of a (u, v) link from start up to end."""
+        i = self.link_numbers.get(link)
+        if i is None:
+            return self.log.take(np.empty(0, dtype=np.int64))
+        rows = self.link_rows[self.link_offsets[i] : self.link_offsets[i + 1]]
+        return self.log.take(self.between(rows, start, end))
+
+    def window(self, start: float, end: float) -> ColumnarLog:
+        """Get all events from start up to end."""
+        return self.log.window(start, end)
+
+    def between(self, rows: np.ndarray, start: float, end: float) -> np.ndarray:
+        """Get the rows, in time order, with times from start up to end."""
+        first, last = np.searchsorted(self.log.times[rows], (start, end))
+        return rows[first:last]
+
+    def save_index(self, path) -> Path:
+        """Save the index next to the events file at path.
+
+        Returns:
+            Path: The path of the index file.
+        """
+        index_path = Path(str(path) + INDEX_SUFFIX)
+        with open(index_path, "wb") as f:
+            np.savez(
+                f,
+                size=len(self.log),
+                agent_rows=self.agent_rows,
+                agent_offsets=self.agent_offsets,
+                link_rows=self.link_rows,
+                link_offsets=self.link_offsets,
+            )
+        return index_path
+
+    @classmethod
+    def open(cls, path) -> "EventStore":
+        """Open an events file, with its saved index if there is one.
+
+        :param path: A binary, Arrow or Parquet events file, as read by
+            read_log.
+        """
+        log = read_log(path)
+        index_path = Path(str(path) + INDEX_SUFFIX)
+        if not index_path.exists():
+            return cls(log)
+        with np.load(index_path) as index:
+            return cls(log, index=dict(index))
+
+
+def build_index(log: ColumnarLog) -> dict:
+    """Sort the rows of a log by agent and by link, keeping time order.
+
+    Returns:
+        dict: The rows of each agent and link in runs, and the offsets of the
+            runs, by agent number and link id.
+    """
+    agents = np.asarray(log.agents, dtype=np.int64)
+    agent_rows = np.argsort(agents, kind="stable")
+    agent_counts = np.bincount(agents, minlength=len(log.agent_ids))
+
+    codes = np.asarray(log.codes)
+    on_link = np.flatnonzero((codes == ENTER_LINK) | (codes == EXIT_LINK))
+    links = np.asarray(log.indices, dtype=np.int64)[on_link]
+    link_rows = on_link[np.argsort(links, kind="stable")]
+    link_counts = np.bincount(links, minlength=len(log.links))
+
+    return {
+        "size": len(log),
+        "agent_rows": agent_rows,
+        "agent_offsets": offsets(agent_counts),
+        "link_rows": link_rows,
+        "link_offsets": offsets(link_counts),
+    }
+
+
+def offsets(counts: np.ndarray) -> np.ndarray:
+    return np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
@@ -0,0 +1,298 @@
+from typing import Dict, Hashable
+
+import numpy as np
+
+from mobslim.agents import EOS, SOS, Activity, InstructionType, Plan, Trip
+from mobslim.network import Network
+from mobslim.population import (
+    ACTIVITY_KIND,
+    EOS_KIND,
+    SOS_KIND,
+    TRIP_KIND,
+    Population,
+    runs,
+)
+
+INSTRUCTIONS = list(InstructionType)  # opcode: InstructionType
+SOS_CODE = InstructionType.SOS.value
+ENTER_ACTIVITY = InstructionType.EnterActivity.value
+EXIT_ACTIVITY = InstructionType.ExitActivity.value
+ENTER_LINK = InstructionType.EnterLink.value
+EXIT_LINK = InstructionType.ExitLink.value
+EOS_CODE = InstructionType.EOS.value
+
+
+class Tapes:
+    """Compiled instructions for a population, as one flat tape per agent.
+
+    The instructions of agent i are rows offsets[i] to offsets[i + 1] of the
+    opcode, index and duration arrays. Opcodes are InstructionType values.
+    Indices are link ids for link instructions, facility ids for activity
+    instructions and -1 otherwise. Agents are numbered in sorted agent id
+    order, so that agent numbers break ties in the same order as agent ids.
+    """
+
+    def __init__(
+        self,
+        agent_ids: list,
+        offsets: np.ndarray,
+        opcodes: np.ndarray,
+        indices: np.ndarray,
+        durations: np.ndarray,
+        facilities: list,
+        links: list,
+    ):
+        self.agent_ids = agent_ids
+        self.offsets = offsets
+        self.opcodes = opcodes
+        self.indices = indices
+        self.durations = durations  # seconds, NaN if not yet planned
+        self.facilities = facilities  # facility id: (ActivityType, location)
+        self.links = links  # link id: (u, v)
+
+    def __len__(self):
+        return len(self.agent_ids)
+
+    def instruction(self, row: int) -> tuple:
+        """Decode a tape row into an (InstructionType, ..., duration) tuple."""
+        return decode(
+            self.opcodes.item(row),
+            self.indices.item(row),
+            self.durations.item(row),
+            self.facilities,
+            self.links,
+        )
+
+    def instructions(self, agent: int) -> list:
+        """Decode the full tape of an agent."""
+        start, end = self.offsets.item(agent), self.offsets.item(agent + 1)
+        return [self.instruction(row) for row in range(start, end)]
+
+
+def decode(
+    opcode: int, index: int, duration: float, facilities: list, links: list
+) -> tuple:
+    """Decode an instruction into an (InstructionType, ..., duration) tuple.
+
+    Args:
+        opcode (int): The InstructionType value.
+        index (int): The link or facility id, if any.
+        duration (float): The duration, NaN if not yet planned.
+        facilities (list): (ActivityType, location) by facility id.
+        links (list): (u, v) by link id.
+
+    Returns:
+        tuple: The instruction, as from Plan.get_instructions.
+    """
+    if duration != duration:
+        duration = None
+    if opcode == ENTER_LINK or opcode == EXIT_LINK:
+        return (INSTRUCTIONS[opcode], None, links[index], duration)
+    if opcode == ENTER_ACTIVITY or opcode == EXIT_ACTIVITY:
+        act, location = facilities[index]
+        return (INSTRUCTIONS[opcode], act, location, duration)
+    return (INSTRUCTIONS[opcode], None, None, 0)
+
+
+def compile_plans(plans: Dict[Hashable, Plan], network: Network) -> Tapes:
+    """Compile plans into instruction tapes for simulation.
+
+    Gives the same instructions as Plan.get_instructions, without building a
+    tuple per instruction or changing the plans.
+
+    Args:
+        plans (dict): A dictionary of plans for each agent.
+        network (Network): The network the routes are planned on.
+
+    Returns:
+        Tapes: The compiled instructions.
+    """
+    if isinstance(plans, Population):
+        return compile_population(plans, network)
+    try:
+        agent_ids = sorted(plans)
+    except TypeError:  # agent ids cannot be ordered, keep the given order
+        agent_ids = list(plans)
+    link_ids = network.link_index()
+    facility_ids = {}
+
+    offsets = [0]
+    opcodes = []
+    indices = []
+    durations = []
+    for agent_id in agent_ids:
+        components = plans[agent_id].components
+        if len(components) == 0:
+            raise ValueError("Plan has no components.")
+        for component in components:
+            if isinstance(component, Activity):
+                facility = (component.type, component.location)
+                index = facility_ids.setdefault(facility, len(facility_ids))
+                duration = component.duration
+                if duration is None:
+                    duration = np.nan
+                opcodes += [ENTER_ACTIVITY, EXIT_ACTIVITY]
+                indices += [index, index]
+                durations += [duration, duration]
+            elif isinstance(component, Trip):
+                if component.route is None:
+                    raise ValueError("Route has not been planned yet.")
+                for edge, _, minimum_duration in component.route:
+                    index = link_ids[edge]
+                    opcodes += [ENTER_LINK, EXIT_LINK]
+                    indices += [index, index]
+                    durations += [minimum_duration, minimum_duration]
+            elif isinstance(component, SOS):
+                opcodes.append(SOS_CODE)
+                indices.append(-1)
+                durations.append(0)
+            elif isinstance(component, EOS):
+                break
+        opcodes.append(EOS_CODE)
+        indices.append(-1)
+        durations.append(0)
+        offsets.append(len(opcodes))
+
+    return Tapes(
+        agent_ids=agent_ids,
+        offsets=np.array(offsets, dtype=np.int64),
+        opcodes=np.array(opcodes, dtype=np.int8),
+        indices=np.array(indices, dtype=np.int32),
+        durations=np.array(durations, dtype=np.float64),
+        facilities=list(facility_ids),
+        links=list(link_ids),
+    )
+
+
+def compile_population(population: Population, network: Network) -> Tapes:
+    """Compile a population into instruction tapes, as compile_plans, from
+    its arrays without viewing each plan.
+
+    Args:
+        population (Population): The plans of each agent.
+        network (Network): The network the routes are planned on.
+
+    Returns:
+        Tapes: The compiled instructions.
+    """
+    links = list(network.link_index())
+    if links != population.links:
+        raise ValueError("The population's routes are not of this network.")
+    try:
+        agent_ids = sorted(population)
+    except TypeError:  # agent ids cannot be ordered, keep the given order
+        agent_ids = list(population)
+    agents = np.array(
+        [population.agent_numbers[agent_id] for agent_id in agent_ids],
+        dtype=np.int64,
+    )
+    starts, ends = (
+        population.starts.array[agents],
+        population.ends.array[agents],
+    )
+    if (starts == ends).any():
+        raise ValueError("Plan has no components.")
+
+    # each agent's components, up to the first end of sequence
+    rows = runs(starts, ends)
+    owners = np.repeat(np.arange(len(agents)), ends - starts)
+    kinds = population.kinds.array[rows]
+    ended = np.cumsum(kinds == EOS_KIND)
+    before = np.concatenate(([0], ended))[
+        np.cumsum(ends - starts) - (ends - starts)
+    ]
+    keep = ended - before[owners] == 0
+    rows, owners, kinds = rows[keep], owners[keep], kinds[keep]
+
+    route_starts = population.route_starts.array[rows]
+    trips = kinds == TRIP_KIND
+    if (route_starts[trips] < 0).any():
+        raise ValueError("Route has not been planned yet.")
+
+    # facilities numbered as first met
+    activities = kinds == ACTIVITY_KIND
+    keys = (
+        population.types.array[rows].astype(np.int64)
+        * (len(population.nodes) + 1)
+        + population.locations.array[rows]
+    )
+    unique, first, inverse = np.unique(
+        keys[activities], return_index=True, return_inverse=True
+    )
+    numbers = np.empty(len(unique), dtype=np.int64)
+    numbers[np.argsort(first, kind="stable")] = np.arange(len(unique))
+    facility_ids = np.full(len(rows), -1, dtype=np.int64)
+    facility_ids[activities] = numbers[inverse.reshape(-1)]
+    facility_rows = rows[activities][np.sort(first)]
+    facilities = [
+        (
+            population.activity_types[population.types.data.item(row)],
+            population.node(population.locations.data.item(row)),
+        )
+        for row in facility_rows.tolist()
+    ]
+
+    # items are the kept components and an end of sequence for each agent
+    item_kinds = np.concatenate((kinds, np.full(len(agents), EOS_KIND)))
+    item_owners = np.concatenate((owners, np.arange(len(agents))))
+    item_rows = np.concatenate((rows, np.full(len(agents), -1)))
+    order = np.argsort(item_owners, kind="stable")
+    item_kinds, item_owners, item_rows = (
+        item_kinds[order],
+        item_owners[order],
+        item_rows[order],
+    )
+    item_facilities = np.concatenate((facility_ids, np.full(len(agents), -1)))[
+        order
+    ]
+    route_starts = np.concatenate(
+        (route_starts, np.zeros(len(agents), np.int64))
+    )[order]
+    route_lengths = np.where(
+        item_kinds == TRIP_KIND,
+        population.route_ends.array[item_rows] - route_starts,
+        0,
+    )
+    counts = np.select(
+        [item_kinds == ACTIVITY_KIND, item_kinds == TRIP_KIND],
+        [2, 2 * route_lengths],
+        1,
+    )
+
+    # instructions, with the item and position in it of each
+    items = np.repeat(np.arange(len(item_kinds)), counts)
+    positions = np.arange(len(items)) - np.repeat(
+        np.cumsum(counts) - counts, counts
+    )
+    kinds = item_kinds[items]
+    on_activity = kinds == ACTIVITY_KIND
+    on_link = kinds == TRIP_KIND
+    opcodes = np.select(
+        [kinds == SOS_KIND, on_activity, on_link],
+        [SOS_CODE, ENTER_ACTIVITY + positions % 2, ENTER_LINK + positions % 2],
+        EOS_CODE,
+    )
+    link_rows = route_starts[items] + positions // 2
+    route_links = population.route_links.array
+    indices = np.full(len(items), -1, dtype=np.int64)
+    indices[on_activity] = item_facilities[items[on_activity]]
+    indices[on_link] = route_links[link_rows[on_link]]
+    durations = np.zeros(len(items), dtype=np.float64)
+    durations[on_activity] = population.durations.array[
+        item_rows[items[on_activity]]
+    ]
+    minimums = np.array(population.minimums, dtype=np.float64)
+    durations[on_link] = minimums[indices[on_link]]
+
+    agent_counts = np.bincount(
+        item_owners, weights=counts, minlength=len(agents)
+    ).astype(np.int64)
+    return Tapes(
+        agent_ids=agent_ids,
+        offsets=np.concatenate(([0], np.cumsum(agent_counts))).astype(np.int64),
+        opcodes=opcodes.astype(np.int8),
+        indices=indices.astype(np.int32),
+        durations=durations,
+        facilities=facilities,
+        links=links,
+    )
@@ -0,0 +1,76 @@
+import random
+from pathlib import Path
+
+import pytest
+
+from mobslim.agents import ActivityType, Plan, load_from_xml
+from mobslim.expected import SimpleExpectedDurations
+from mobslim.network import Network
+from mobslim.planners.greedy_trip_planner import GreedyTripPlanner
+from mobslim.planners.rerouters.simple_rerouter import StaticRouter
+
+EQUIL = Path(__file__).parents[1] / "scenarios" / "equil"
+
+
+def make_ring_network(size=6, length=16):
+    network = Network()
+    for i in range(size):
+        network.node_positions[i] = (i, 0)
+        network.G.add_edge(
+            i,
+            (i + 1) % size,
+            length=length,
+            lanes=1,
+            freespeed=4,
+            flow_capacity=0.2,
+        )
+    return network
+
+
+def make_ring_plans(network, agents=60, size=6):
+    plans = {}
+    for i in range(agents):
+        o, d = i % size, (i + size // 2) % size
+        plan = Plan()
+        plan.add_activity(ActivityType.HOME, o, (i * 3) % 11)
+        plan.add_trip(o, d, 0)
+        plan.add_activity(ActivityType.WORK, d, 5)
+        plan.finish()
+        plans[i] = plan
+    router = StaticRouter(network, SimpleExpectedDurations(network))
+    GreedyTripPlanner(plans, router, network).plan()
+    return plans
+
+
+def make_equil():
+    random.seed(0)
+    network = Network()
+    network.load_xml(EQUIL / "network.xml")
+    plans = load_from_xml(EQUIL / "plans100.xml")
+    router = StaticRouter(network, SimpleExpectedDurations(network))
+    GreedyTripPlanner(plans, router, network).plan()
+    return network, plans
+
+
+@pytest.fixture
+def ring_network():
+    """Make a one way ring of short links, as make_ring_network."""
+    return make_ring_network
+
+
+@pytest.fixture
+def ring_plans():
+    """Make routed plans of agents going half way around a ring."""
+    return make_ring_plans
+
+
+@pytest.fixture
+def equil():
+    """Make the routed network and 100 agent plans of the equil scenario."""
+    return make_equil
+
+
+@pytest.fixture
+def equil_path():
+    """The directory of the equil scenario files."""
+    return EQUIL
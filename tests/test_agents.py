@@ -0,0 +1,37 @@
+from mobslim.agents import (
+    iter_plan_chunks_xml,
+    iter_plans_xml,
+    load_from_xml,
+    sample_plans,
+)
+
+
+def test_sample_plans_is_reproducible(ring_network, ring_plans):
+    plans = ring_plans(ring_network(), agents=50)
+    sample = sample_plans(plans, 0.1, seed=3)
+    assert len(sample) == 5
+    assert sample == sample_plans(plans, 0.1, seed=3)
+    assert sample.keys() != sample_plans(plans, 0.1, seed=4).keys()
+    assert list(sample) == [i for i in plans if i in sample]
+
+
+def test_streamed_plans_match_loaded_plans(equil_path):
+    path = equil_path / "plans100.xml"
+    plans = load_from_xml(path)
+    streamed = list(iter_plans_xml(path))
+    assert [agent_id for agent_id, _ in streamed] == list(plans)
+    assert [repr(plan) for _, plan in streamed] == [
+        repr(plan) for plan in plans.values()
+    ]
+
+    chunks = list(iter_plan_chunks_xml(path, chunk_size=30))
+    assert [len(chunk) for chunk in chunks] == [30, 30, 30, 10]
+    assert [i for chunk in chunks for i in chunk] == list(plans)
+
+    kept = dict(iter_plans_xml(path, keep=lambda i: i < "5"))
+    assert list(kept) == [i for i in plans if i < "5"]
+    sample = dict(iter_plans_xml(path, fraction=0.3, seed=1))
+    assert 10 < len(sample) < 50
+    assert list(sample) == list(
+        dict(iter_plans_xml(path, fraction=0.3, seed=1))
+    )
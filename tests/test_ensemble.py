@@ -0,0 +1,42 @@
+import copy
+
+from mobslim.ensemble import replicate, replication_seeds, run_ensemble
+from mobslim.expected import SimpleExpectedDurations
+from mobslim.planners.rerouters.csr_router import CSRRouter
+
+
+def test_ensemble_is_reproducible_and_matches_in_process_runs(
+    ring_network, ring_plans
+):
+    network = ring_network(length=40)
+    plans = ring_plans(network, agents=30)
+    results = run_ensemble(
+        network, plans, replications=3, iterations=3, seed=7, processes=2
+    )
+    again = run_ensemble(
+        network, plans, replications=3, iterations=3, seed=7, processes=2
+    )
+    assert results == again
+    assert [r["replication"] for r in results] == [0, 1, 2]
+    assert [r["seed"] for r in results] == replication_seeds(7, 3)
+
+    seed = results[1]["seed"]
+    local = replicate(network, copy.deepcopy(plans), 1, seed, iterations=3)
+    assert local == results[1]
+    assert local["trips"] == 30
+
+
+def csr_router(network):
+    return CSRRouter(network, SimpleExpectedDurations(network))
+
+
+def test_replications_take_a_router_factory(capsys, ring_network, ring_plans):
+    network = ring_network(length=40)
+    plans = ring_plans(network, agents=30)
+    static = replicate(network, copy.deepcopy(plans), 0, 5, iterations=2)
+    csr = replicate(
+        network, copy.deepcopy(plans), 0, 5, iterations=2, router=csr_router
+    )
+    # the routers find the same routes on a ring
+    assert csr == static
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,95 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from mobslim.expected import BinnedExpectedDurations, SimpleExpectedDurations
+from mobslim.listener import EventListener
+from mobslim.planners.rerouters.simple_rerouter import StaticRouter
+from mobslim.sim import Sim
+
+
+def test_binned_durations_with_one_bin_match_simple_durations(equil):
+    network, plans = equil()
+    sim = Sim(network, EventListener())
+    sim.set(plans)
+    events = sim.run()
+
+    simple = SimpleExpectedDurations(network)
+    binned = BinnedExpectedDurations(network, bin_size=86400, dtype=np.float64)
+    for _ in range(2):
+        simple.update(plans, network, events, alpha=0.5)
+        binned.update(plans, network, events, alpha=0.5)
+    for edge, duration in simple.edge_durations.items():
+        assert binned.get(edge, 0) == pytest.approx(duration)
+        assert binned.get(edge, None) == pytest.approx(duration)
+
+
+def test_binned_durations_fill_the_bins_links_are_entered_in(equil):
+    network, plans = equil()
+    sim = Sim(network, EventListener())
+    sim.set(plans)
+    events = sim.run()
+
+    binned = BinnedExpectedDurations(network, bin_size=900, horizon=3600 * 30)
+    assert binned.durations.shape == (len(network.G.edges), 120)
+    assert binned.durations.nbytes == len(network.G.edges) * 120 * 4
+    binned.update(plans, network, events)
+
+    entered = {}
+    for time, idx, (event, _, uv, _) in events:
+        if event.name == "EnterLink":
+            entered[idx] = (time, uv)
+        elif event.name == "ExitLink":
+            start, uv = entered.pop(idx)
+            b = binned.bin(start)
+            entered.setdefault((uv, b), []).append(time - start)
+    minimums = network.minimum_durations()
+    for edge in network.G.edges:
+        for b in range(binned.n_bins):
+            durations = entered.get((edge, b))
+            expected = np.mean(durations) if durations else minimums[edge]
+            assert binned.get(edge, b * 900) == pytest.approx(expected)
+    # times past the horizon use the last bin
+    assert binned.bin(1e9) == binned.n_bins - 1
+
+
+def test_simple_durations_are_shared_with_the_static_router(equil):
+    network, plans = equil()
+    sim = Sim(network, EventListener())
+    sim.set(plans)
+    events = sim.run()
+
+    expectations = SimpleExpectedDurations(network)
+    router = StaticRouter(network, expectations)
+    router.update(plans, network, events, alpha=0.5)
+    traversed = {
+        uv for _, _, (event, _, uv, _) in events if event.name == "EnterLink"
+    }
+    minimums = network.minimum_durations()
+    for edge in network.G.edges:
+        if edge not in traversed:
+            assert expectations.get(edge, 0) == minimums[edge]
+    assert expectations.av_duration() > sum(minimums.values()) / len(minimums)
+    # only links away from their minimum are kept for the next update
+    links = expectations.link_ids
+    assert expectations.moved <= {links[edge] for edge in traversed}
+    router.update(plans, network, [], alpha=1.0)
+    assert not expectations.moved
+    assert expectations.durations.tolist() == [
+        minimums[edge] for edge in network.G.edges
+    ]
+    router.update(plans, network, events, alpha=0.5)
+
+    # the router reads changes to the expectations without copying them
+    route, duration = router.get_route(1, 15, 0)
+    edge, before, _ = route[0]
+    expectations.edge_durations[edge] += 100.0
+    assert router.get_route(1, 15, 0)[1] == pytest.approx(duration + 100)
+
+    copied = pickle.loads(pickle.dumps(router))
+    assert copied.get_route(1, 15, 0) == router.get_route(1, 15, 0)
+    # and a copy has its own
+    copied.expectations.update_link(edge, 0, before, alpha=1.0)
+    assert copied.get_route(1, 15, 0)[1] == pytest.approx(duration)
+    assert router.get_route(1, 15, 0)[1] == pytest.approx(duration + 100)
@@ -0,0 +1,135 @@
+import numpy as np
+
+from mobslim.agents import InstructionType
+from mobslim.animate import build_traces
+from mobslim.expected import SimpleExpectedDurations
+from mobslim.listener import (
+    LINK_INSTRUCTIONS,
+    AggregatingListener,
+    ColumnarListener,
+    EventListener,
+)
+from mobslim.optimizer import Optimizer
+from mobslim.partition import PartitionedSim
+from mobslim.planners.greedy_trip_planner import GreedyTripPlanner
+from mobslim.planners.rerouters.simple_rerouter import StaticRouter
+from mobslim.processs_events import (
+    av_link_durations,
+    events_to_plans,
+    expected_link_durations,
+    trip_durations,
+    trip_lengths,
+)
+from mobslim.sim import Sim
+
+
+def run(listener, network, plans):
+    sim = Sim(network=network, listener=listener)
+    sim.set(plans)
+    return sim.run()
+
+
+def test_columnar_log_gives_the_same_events(ring_network, ring_plans):
+    network = ring_network(length=100)
+    plans = ring_plans(network, agents=40)
+    events = run(EventListener(), network, plans)
+    listener = ColumnarListener(capacity=8)
+    log = run(listener, network, plans)
+
+    assert len(log) == len(events)
+    assert list(log) == events
+    assert log[5] == events[5]
+
+    frame = log.to_frame()
+    assert len(frame) == len(events)
+    assert np.shares_memory(frame["time"].to_numpy(), listener.times)
+
+    assert trip_durations(log) == trip_durations(events)
+    assert trip_lengths(network, log) == trip_lengths(network, events)
+    assert expected_link_durations(
+        plans, network, log
+    ) == expected_link_durations(plans, network, events)
+    assert repr(events_to_plans(log)) == repr(events_to_plans(events))
+    positions = network.node_positions
+    assert build_traces(log, positions) == build_traces(events, positions)
+
+
+def test_columnar_listener_takes_tuple_events(ring_network, ring_plans):
+    network = ring_network(length=100)
+    plans = ring_plans(network, agents=40)
+    events = run(EventListener(), network, plans)
+    partitioned = PartitionedSim(
+        network, ColumnarListener(), regions=2, processes=False
+    )
+    partitioned.set(plans)
+    assert list(partitioned.run()) == events
+
+
+def test_aggregating_listener_matches_processed_events(
+    ring_network, ring_plans
+):
+    network = ring_network(length=100)
+    plans = ring_plans(network, agents=40)
+    events = run(EventListener(), network, plans)
+    listener = AggregatingListener(network, keep_log=False)
+    assert run(listener, network, plans) == []
+
+    assert trip_durations(listener) == trip_durations(events)
+    assert trip_lengths(network, listener) == trip_lengths(network, events)
+    assert expected_link_durations(
+        plans, network, listener
+    ) == expected_link_durations(plans, network, events)
+    assert av_link_durations(plans, network, listener) == av_link_durations(
+        plans, network, events
+    )
+
+
+def test_listeners_only_get_subscribed_events(ring_network, ring_plans):
+    network = ring_network(length=100)
+    plans = ring_plans(network, agents=40)
+    events = run(EventListener(), network, plans)
+    links = [event for event in events if event[2][0] in LINK_INSTRUCTIONS]
+    bounds = (InstructionType.SOS, InstructionType.EOS)
+    ends = [event for event in events if event[2][0] in bounds]
+    aggregating = AggregatingListener(network, keep_log=False)
+
+    logs = run(
+        [
+            EventListener(LINK_INSTRUCTIONS),
+            EventListener(bounds),
+            ColumnarListener(),
+            aggregating,
+        ],
+        network,
+        plans,
+    )
+    assert logs[0] == links
+    assert logs[1] == ends
+    assert list(logs[2]) == events
+    assert trip_durations(aggregating) == trip_durations(events)
+
+    partitioned = PartitionedSim(
+        network,
+        [EventListener(LINK_INSTRUCTIONS), EventListener()],
+        regions=2,
+        processes=False,
+    )
+    partitioned.set(plans)
+    assert partitioned.run() == [links, events]
+
+
+def test_optimizer_updates_from_a_listener_without_a_log(
+    capsys, ring_network, ring_plans
+):
+    network = ring_network(length=100)
+    durations = []
+    for listener in (EventListener(), AggregatingListener(network, False)):
+        plans = ring_plans(network, agents=30)
+        router = StaticRouter(network, SimpleExpectedDurations(network))
+        planner = GreedyTripPlanner(plans, router, network, seed=0)
+        sim = Sim(network=network, listener=listener)
+        Optimizer(sim, plans, planner).run(max_runs=2, verbose=True)
+        durations.append(router.expectations.durations)
+    assert len(listener.durations) == 30
+    assert durations[0].tolist() == durations[1].tolist()
+    assert "1: Av. trip duration" in capsys.readouterr().out
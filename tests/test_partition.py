@@ -0,0 +1,94 @@
+import pytest
+
+from mobslim.agents import ActivityType, InstructionType, Plan
+from mobslim.expected import SimpleExpectedDurations
+from mobslim.links import ArrayLinks
+from mobslim.listener import EventListener
+from mobslim.network import Grid, Network
+from mobslim.partition import PartitionedSim
+from mobslim.planners.greedy_trip_planner import GreedyTripPlanner
+from mobslim.planners.rerouters.simple_rerouter import StaticRouter
+from mobslim.schedulers import CalendarScheduler, HeapScheduler
+from mobslim.sim import Sim
+
+
+@pytest.mark.parametrize("regions,processes", [(2, True), (5, False)])
+def test_partitioned_events_match_single_sim_on_equil(
+    regions, processes, equil
+):
+    network, plans = equil()
+    sim = Sim(network=network, listener=EventListener())
+    sim.set(plans)
+    events = sim.run()
+
+    partitioned = PartitionedSim(
+        network=network,
+        listener=EventListener(),
+        regions=regions,
+        links=ArrayLinks,
+        processes=processes,
+    )
+    partitioned.set(plans)
+    assert partitioned.run() == events
+    partitioned.close()
+
+
+def test_partitioned_sim_needs_directed_network():
+    with pytest.raises(ValueError):
+        PartitionedSim(network=Grid(size=3), listener=EventListener())
+
+
+def line():
+    """A line of three links, with a boundary link of one vehicle into a
+    slow link in the middle.
+    """
+    network = Network()
+    for i in range(4):
+        network.node_positions[i] = (i, 0)
+    for i, (length, flow_capacity) in enumerate([(40, 1), (4, 1), (40, 0.05)]):
+        network.G.add_edge(
+            i,
+            i + 1,
+            length=length,
+            lanes=1,
+            freespeed=4,
+            flow_capacity=flow_capacity,
+        )
+    plans = {}
+    for i in range(6):
+        plan = Plan()
+        plan.add_activity(ActivityType.HOME, 0, i)
+        plan.add_trip(0, 3, 0)
+        plan.add_activity(ActivityType.WORK, 3, 5)
+        plan.finish()
+        plans[i] = plan
+    router = StaticRouter(network, SimpleExpectedDurations(network))
+    GreedyTripPlanner(plans, router, network).plan()
+    return network, plans
+
+
+@pytest.mark.parametrize(
+    "scheduler,processes",
+    [
+        (HeapScheduler, False),
+        (CalendarScheduler, False),
+        (CalendarScheduler, True),
+    ],
+)
+def test_agents_held_back_at_a_full_boundary_link_all_arrive(
+    scheduler, processes
+):
+    network, plans = line()
+    partitioned = PartitionedSim(
+        network=network,
+        listener=EventListener(),
+        regions={0: 0, 1: 0, 2: 1, 3: 1},
+        scheduler=scheduler,
+        processes=processes,
+    )
+    partitioned.set(plans)
+    with pytest.warns(UserWarning):
+        events = partitioned.run()
+    partitioned.close()
+    arrivals = [e for e in events if e[2][0] == InstructionType.EOS]
+    assert len(arrivals) == len(plans)
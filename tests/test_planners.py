@@ -0,0 +1,312 @@
+import copy
+import random
+
+import numpy as np
+import pytest
+
+from mobslim.agents import Trip
+from mobslim.expected import BinnedExpectedDurations, SimpleExpectedDurations
+from mobslim.listener import EventListener
+from mobslim.network import Grid, Network
+from mobslim.optimizer import Optimizer
+from mobslim.planners.greedy_trip_planner import GreedyTripPlanner
+from mobslim.planners.rerouters.cached_router import CachedRouter
+from mobslim.planners.rerouters.contraction_router import ContractionRouter
+from mobslim.planners.rerouters.csr_router import CSRRouter
+from mobslim.planners.rerouters.simple_rerouter import StaticRouter
+from mobslim.planners.rerouters.time_dependent_router import TimeDependentRouter
+from mobslim.sim import Sim
+
+
+def test_batched_routing_matches_routing_each_trip(equil):
+    network, plans = equil()
+    router = StaticRouter(network, SimpleExpectedDurations(network))
+    batched = GreedyTripPlanner(copy.deepcopy(plans), router, network)
+    batched.plan()
+    single = GreedyTripPlanner(copy.deepcopy(plans), router, network)
+    for plan in single.plans.values():
+        single.replan_plan(plan)
+
+    # plans repr with their trip routes and durations
+    assert repr(batched.plans) == repr(single.plans)
+
+
+@pytest.mark.parametrize("directed", [True, False])
+def test_csr_router_matches_static_router(directed):
+    rng = random.Random(0)
+    network = Grid(size=6, length=100)
+    if directed:
+        network.G = network.G.to_directed()
+    expectations = SimpleExpectedDurations(network)
+    for edge in expectations.edge_durations:
+        # many ties, and some paths much faster
+        expectations.edge_durations[edge] *= rng.choice([1, 1, 1, 0.5])
+    static = StaticRouter(network, expectations)
+    csr = CSRRouter(network, expectations)
+    astar = CSRRouter(network, expectations, heuristic=True)
+
+    nodes = list(network.G.nodes)
+    for source in nodes:
+        requests = [(target, 0) for target in nodes]
+        assert csr.get_routes(source, requests) == static.get_routes(
+            source, requests
+        )
+        for target in nodes:
+            route = static.get_route(source, target, 0)
+            assert csr.get_route(source, target, 0) == route
+            assert astar.get_route(source, target, 0)[1] == route[1]
+
+
+def test_cached_router_reuses_routes_within_tolerance(equil):
+    network, plans = equil()
+    sim = Sim(network, EventListener())
+    sim.set(plans)
+    events = sim.run()
+
+    planners = {}
+    for tolerance in (None, 0.0, 1e9):
+        router = StaticRouter(network, SimpleExpectedDurations(network))
+        if tolerance is not None:
+            router = CachedRouter(router, network, tolerance=tolerance)
+        planner = GreedyTripPlanner(
+            copy.deepcopy(plans), router, network, seed=1
+        )
+        planner.plan()
+        planner.plan()
+        planner.update(events)
+        planner.replan(p=1.0)
+        planners[tolerance] = planner
+
+    exact, loose = planners[0.0].router, planners[1e9].router
+    trips = sum(
+        isinstance(component, Trip)
+        for plan in plans.values()
+        for component in plan.components
+    )
+    for router in (exact, loose):
+        assert router.hits + router.misses == 3 * trips
+    assert loose.invalidated == 0
+    assert 0 < exact.invalidated
+    # invalidated routes are found again, so plans are as without a cache
+    assert repr(planners[0.0].plans) == repr(planners[None].plans)
+
+
+def test_cached_route_is_dropped_when_a_longer_route_becomes_faster():
+    # a direct link of 100 s, and a chain of 11 links at 9.2 s, each of
+    # which falls 0.5 s to its minimum
+    network = Network()
+    chain = [0, *range(2, 12), 1]
+    network.G.add_edge(0, 1, length=100, freespeed=1)
+    for u, v in zip(chain, chain[1:]):
+        network.G.add_edge(u, v, length=8.7, freespeed=1)
+    expectations = SimpleExpectedDurations(network)
+    for edge in zip(chain, chain[1:]):
+        expectations.edge_durations[edge] = 9.2
+    router = CachedRouter(
+        StaticRouter(network, expectations), network, tolerance=1.0
+    )
+    assert router.get_route(0, 1, 0)[0][0][0] == (0, 1)
+
+    router.update({}, network, [])
+    route, duration = router.get_route(0, 1, 0)
+    assert [edge for edge, _, _ in route] == list(zip(chain, chain[1:]))
+    assert duration == pytest.approx(95.7)
+    assert router.invalidated == 1
+
+
+def test_cached_route_is_kept_when_links_off_its_way_fall():
+    # a link far from the cached route falls by 50 s
+    network = Network()
+    network.G.add_edge(0, 1, length=100, freespeed=1)
+    network.G.add_edge(1, 2, length=10, freespeed=1)
+    expectations = SimpleExpectedDurations(network)
+    expectations.edge_durations[1, 2] = 60
+    router = CachedRouter(
+        StaticRouter(network, expectations), network, tolerance=1.0
+    )
+    router.get_route(0, 1, 0)
+
+    router.update({}, network, [])
+    assert expectations.get((1, 2), 0) == 10
+    router.get_route(0, 1, 0)
+    assert (router.hits, router.invalidated) == (1, 0)
+
+
+def test_cached_routes_stay_within_tolerance_over_updates(equil):
+    network, plans = equil()
+    router = CachedRouter(
+        StaticRouter(network, SimpleExpectedDurations(network)),
+        network,
+        tolerance=1.0,
+    )
+    planner = GreedyTripPlanner(plans, router, network, seed=1)
+    planner.plan()
+    for _ in range(3):
+        sim = Sim(network, EventListener())
+        sim.set(planner.plans)
+        planner.update(sim.run())
+        planner.replan(p=1.0)
+        for plan in planner.plans.values():
+            for trip in plan.components:
+                if isinstance(trip, Trip):
+                    best = router.router.get_route(
+                        trip.origin, trip.destination, 0
+                    )[1]
+                    assert trip.expected_duration <= best + 1.0
+    assert router.invalidated > 0
+    assert router.hit_rate() > 0.5
+
+
+def test_time_dependent_router_with_one_bin_matches_static_router():
+    rng = random.Random(0)
+    network = Grid(size=6, length=100)
+    expectations = BinnedExpectedDurations(
+        network, bin_size=86400, dtype=np.float64
+    )
+    for edge in network.G.edges:
+        expectations.update_link(edge, 0, rng.choice([10, 10, 10, 5]), 1.0)
+    static = StaticRouter(network, expectations)
+    router = TimeDependentRouter(network, expectations)
+
+    nodes = list(network.G.nodes)
+    for source in nodes:
+        requests = [(target, 3600) for target in nodes]
+        routes = router.get_routes(source, requests)
+        for (target, _), (route, duration) in zip(requests, routes):
+            assert duration == static.get_route(source, target, 0)[1]
+            assert router.get_route(source, target, 3600) == (route, duration)
+
+
+def test_time_dependent_router_avoids_links_slow_at_departure():
+    network = Grid(size=3, length=100)
+    expectations = BinnedExpectedDurations(network, bin_size=3600)
+    router = TimeDependentRouter(network, expectations)
+    source, target = (0, 0), (0, 2)
+    direct, duration = router.get_route(source, target, 0)
+    assert len(direct) == 2
+
+    # the direct route is congested in the peak hour only
+    for edge, _, _ in direct:
+        expectations.update_link(edge, 8 * 3600, 1000.0, alpha=1.0)
+    off_peak, _ = router.get_route(source, target, 0)
+    peak, peak_duration = router.get_route(source, target, 8 * 3600)
+    assert off_peak == direct
+    assert len(peak) == 4 and peak_duration == pytest.approx(2 * duration)
+
+
+@pytest.mark.parametrize("directed", [True, False])
+def test_contraction_router_finds_shortest_paths(directed):
+    rng = random.Random(0)
+    network = Grid(size=6, length=100)
+    if directed:
+        network.G = network.G.to_directed()
+    expectations = SimpleExpectedDurations(network)
+    router = ContractionRouter(network, expectations)
+
+    nodes = list(network.G.nodes)
+    for _ in range(2):
+        for edge in expectations.edge_durations:
+            expectations.edge_durations[edge] *= rng.choice([1, 1, 0.5, 2])
+        static = StaticRouter(network, expectations)
+        router.set_weights()  # customized again, as after an update
+        for source in nodes:
+            requests = [(target, 0) for target in nodes]
+            routes = router.get_routes(source, requests)
+            for (target, _), (route, duration) in zip(requests, routes):
+                assert duration == pytest.approx(
+                    static.get_route(source, target, 0)[1]
+                )
+                # a connected path of links, priced as the static router
+                assert static.path_route(
+                    [source] + [v for (_, v), _, _ in route]
+                ) == (route, duration)
+
+
+def test_parallel_replanning_does_not_depend_on_workers(equil):
+    network, plans = equil()
+    sim = Sim(network, EventListener())
+    sim.set(plans)
+    events = sim.run()
+
+    serial = GreedyTripPlanner(
+        copy.deepcopy(plans),
+        StaticRouter(network, SimpleExpectedDurations(network)),
+        network,
+    )
+    serial.update(events)
+    serial.replan(p=1.0)
+
+    replanned = {}
+    for processes in (1, 2):
+        router = StaticRouter(network, SimpleExpectedDurations(network))
+        planner = GreedyTripPlanner(
+            copy.deepcopy(plans), router, network, seed=3, processes=processes
+        )
+        planner.update(events)
+        try:
+            planner.replan(p=1.0)
+            assert repr(planner.plans) == repr(serial.plans)
+            # new durations, so the agents replanning next take new routes
+            rng = random.Random(0)
+            durations = router.expectations.edge_durations
+            for edge in durations:
+                durations[edge] *= rng.choice([1, 0.5, 2])
+            planner.replan(p=0.5)
+            assert repr(planner.plans) != repr(serial.plans)
+            replanned[processes] = repr(planner.plans)
+        finally:
+            planner.close()
+    assert replanned[1] == replanned[2]
+
+
+def test_parallel_replanning_with_a_cache_does_not_depend_on_workers(equil):
+    network, plans = equil()
+    replanned = {}
+    for processes in (1, 2):
+        router = CachedRouter(
+            StaticRouter(network, SimpleExpectedDurations(network)),
+            network,
+            tolerance=1.0,
+        )
+        planner = GreedyTripPlanner(
+            copy.deepcopy(plans),
+            router,
+            network,
+            p=0.5,
+            seed=3,
+            processes=processes,
+        )
+        planner.plan()
+        optimizer = Optimizer(
+            Sim(network, EventListener()), planner.plans, planner
+        )
+        optimizer.run(max_runs=3, verbose=False)
+        assert planner.pool is None  # closed by the optimizer
+        assert router.hits > 0 and router.cache
+        replanned[processes] = (
+            repr(planner.plans),
+            (router.hits, router.misses, router.invalidated),
+        )
+    assert replanned[1] == replanned[2]
+
+
+def test_parallel_replanning_caches_routes_found_in_workers(equil):
+    network, plans = equil()
+    router = CachedRouter(
+        StaticRouter(network, SimpleExpectedDurations(network)),
+        network,
+        tolerance=1e9,
+    )
+    with GreedyTripPlanner(
+        plans, router, network, seed=3, processes=1
+    ) as planner:
+        planner.plan()
+        planner.replan(p=1.0)
+    assert planner.pool is None
+    trips = sum(
+        isinstance(component, Trip)
+        for plan in plans.values()
+        for component in plan.components
+    )
+    # every route of the second round was cached after the first
+    assert (router.hits, router.misses) == (trips, trips)
@@ -0,0 +1,94 @@
+import copy
+import pickle
+
+import numpy as np
+
+from mobslim.agents import Trip
+from mobslim.expected import SimpleExpectedDurations
+from mobslim.listener import EventListener
+from mobslim.planners.greedy_trip_planner import GreedyTripPlanner
+from mobslim.planners.rerouters.simple_rerouter import StaticRouter
+from mobslim.population import Population
+from mobslim.sim import Sim
+from mobslim.tapes import compile_plans
+
+
+def fields(plans) -> dict:
+    """Get the fields of each plan's components, durations as floats."""
+    return {
+        agent_id: [
+            (
+                type(component).__mro__[-2].__name__,
+                getattr(component, "location", None),
+                getattr(component, "duration", None),
+                getattr(component, "expected_duration", None),
+                getattr(component, "route", None),
+            )
+            for component in plan.components
+        ]
+        for agent_id, plan in plans.items()
+    }
+
+
+def test_population_compiles_and_simulates_as_plans(equil):
+    network, plans = equil()
+    population = Population.from_plans(plans, network)
+    assert fields(population) == fields(plans)
+    assert fields(population.to_plans()) == fields(plans)
+
+    expected, tapes = compile_plans(plans, network), compile_plans(
+        population, network
+    )
+    assert tapes.agent_ids == expected.agent_ids
+    assert tapes.facilities == expected.facilities
+    for name in ("offsets", "opcodes", "indices"):
+        assert np.array_equal(getattr(tapes, name), getattr(expected, name))
+    assert np.array_equal(tapes.durations, expected.durations, equal_nan=True)
+
+    sim = Sim(network, EventListener())
+    sim.set(plans)
+    events = sim.run()
+    sim.set(population)
+    assert sim.run() == events
+
+
+def test_planners_replan_through_population_views(equil):
+    network, plans = equil()
+    sim = Sim(network, EventListener())
+    sim.set(plans)
+    events = sim.run()
+
+    planners = []
+    for population in (
+        copy.deepcopy(plans),
+        Population.from_plans(plans, network),
+    ):
+        router = StaticRouter(network, SimpleExpectedDurations(network))
+        planner = GreedyTripPlanner(population, router, network)
+        planner.replan(p=1.0)
+        planner.update(events)
+        planner.replan(p=1.0)
+        planners.append(planner)
+    expected, population = planners[0].plans, planners[1].plans
+    # the plans as simulated are written into the population
+    assert isinstance(population, Population)
+    assert fields(population) == fields(expected)
+
+    # routes of another length are written to new rows, until compacted
+    for plans in (expected, population):
+        for plan in plans.values():
+            trip = plan.components[2]
+            trip.route = trip.route[:-1]
+    used = len(population.route_links)
+    population.compact()
+    assert len(population.route_links) < used
+    assert fields(population) == fields(expected)
+
+    # views pickle as plain plans
+    agent_id = next(iter(population))
+    copied = pickle.loads(pickle.dumps(population[agent_id]))
+    assert fields({agent_id: copied}) == fields(
+        {agent_id: population[agent_id]}
+    )
+    assert isinstance(copied.components[2], Trip)
+    assert type(copied.components[2]) is Trip
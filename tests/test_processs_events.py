@@ -0,0 +1,34 @@
+from mobslim.listener import ColumnarListener, EventListener
+from mobslim.processs_events import (
+    analyse_events,
+    av_link_durations,
+    av_link_speeds,
+    expected_link_durations,
+    trip_durations,
+    trip_lengths,
+)
+from mobslim.sim import Sim
+
+
+def test_analyse_events_matches_event_loops(equil):
+    network, plans = equil()
+    sim = Sim(network, EventListener())
+    sim.set(plans)
+    events = sim.run()
+    sim = Sim(network, ColumnarListener())
+    sim.set(plans)
+    log = sim.run()
+
+    expected = {
+        "trip_durations": trip_durations(events),
+        "trip_lengths": trip_lengths(network, events),
+        "av_link_durations": av_link_durations(plans, network, events),
+        "expected_link_durations": expected_link_durations(
+            plans, network, events
+        ),
+        "av_link_speeds": av_link_speeds(plans, network, events),
+    }
+    assert expected["trip_durations"]
+    assert None in expected["av_link_durations"].values()
+    assert analyse_events(network, events) == expected
+    assert analyse_events(network, log) == expected
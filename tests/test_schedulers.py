@@ -0,0 +1,23 @@
+import random
+
+from mobslim.schedulers import CalendarScheduler, HeapScheduler
+
+
+def test_calendar_pops_in_heap_order():
+    rng = random.Random(1)
+    entries = [
+        (rng.randrange(0, 100) + rng.choice([0, 0.5]), a) for a in range(200)
+    ]
+    heap = HeapScheduler(entries)
+    calendar = CalendarScheduler(entries, horizon=8)
+    while heap:
+        entry = heap.pop()
+        assert calendar.peek() == entry
+        assert calendar.pop() == entry
+        time, agent = entry
+        if agent % 3 and time < 500:
+            # reschedule some agents, some beyond the calendar horizon
+            heap.push(time + (agent % 5 + 1) * 9.5, agent)
+            calendar.push(time + (agent % 5 + 1) * 9.5, agent)
+    assert len(calendar) == 0
+    assert calendar.peek() is None
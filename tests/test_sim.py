@@ -0,0 +1,107 @@
+import pytest
+
+from mobslim.agents import InstructionType
+from mobslim.links import ArrayLinks, SimLinks
+from mobslim.listener import EventListener
+from mobslim.schedulers import CalendarScheduler, HeapScheduler
+from mobslim.sim import Sim
+
+
+def test_gridlock_does_not_requeue_blocked_agents(ring_network, ring_plans):
+    network = ring_network()
+    sim = Sim(network=network, listener=EventListener())
+    sim.set(ring_plans(network))
+    sim.run(steps=5000)
+    assert len(sim.queue) == 0
+    assert sim.time >= 5000
+
+
+def test_congested_link_respects_flow_capacity(ring_network, ring_plans):
+    network = ring_network(length=400)
+    sim = Sim(network=network, listener=EventListener())
+    sim.set(ring_plans(network, agents=30))
+    events = sim.run()
+    exits = {}
+    for time, _, instruction in events:
+        if instruction[0] == InstructionType.ExitLink:
+            exits.setdefault(instruction[2], []).append(time)
+    for times in exits.values():
+        assert all(b - a >= 5 for a, b in zip(times, times[1:]))
+    arrivals = [e for e in events if e[2][0] == InstructionType.EOS]
+    assert len(arrivals) == 30
+
+
+def test_link_stores_give_the_same_events(ring_network, ring_plans):
+    network = ring_network(length=40)
+    plans = ring_plans(network)
+    logs = []
+    for links in (SimLinks, ArrayLinks):
+        sim = Sim(network=network, listener=EventListener(), links=links)
+        sim.set(plans)
+        logs.append(sim.run())
+    assert logs[0] == logs[1]
+
+
+def test_schedulers_give_the_same_events(ring_network, ring_plans):
+    network = ring_network(length=40)
+    plans = ring_plans(network)
+    logs = []
+    for scheduler in (HeapScheduler, CalendarScheduler):
+        sim = Sim(
+            network=network, listener=EventListener(), scheduler=scheduler
+        )
+        sim.set(plans)
+        logs.append(sim.run())
+    assert logs[0] == logs[1]
+
+
+def test_resumed_sim_gives_the_same_events(tmp_path, ring_network, ring_plans):
+    network = ring_network(length=100)
+    plans = ring_plans(network, agents=40)
+    sim = Sim(network=network, listener=EventListener())
+    sim.set(plans)
+    events = list(sim.run())
+
+    for links, scheduler in (
+        (SimLinks, HeapScheduler),
+        (ArrayLinks, CalendarScheduler),
+    ):
+        sim = Sim(network, EventListener(), links=links, scheduler=scheduler)
+        sim.set(plans)
+        sim.run(steps=40)  # with agents blocked and woken
+        sim.save(tmp_path / "sim.pkl")
+        before = len(sim.event_listener.log)
+
+        resumed = Sim.load(tmp_path / "sim.pkl")
+        assert resumed.run() == events
+        fresh = Sim.load(tmp_path / "sim.pkl", listener=EventListener())
+        assert fresh.run() == events[before:]
+
+
+def test_capacity_factors_scale_link_capacities(ring_network, ring_plans):
+    network = ring_network(length=400)
+    sim = Sim(
+        network,
+        EventListener(),
+        flow_capacity_factor=0.1,
+        storage_capacity_factor=0.25,
+    )
+    sim.set(ring_plans(network, agents=3))
+    link = sim.links.links[0]
+    assert link.flow_capacity == 50
+    assert link.storage_capacity == 100
+
+
+@pytest.mark.parametrize("links", [SimLinks, ArrayLinks])
+def test_scaled_links_hold_at_least_one_vehicle(
+    links, ring_network, ring_plans
+):
+    network = ring_network(length=16)
+    plans = ring_plans(network, agents=5)
+    sim = Sim(
+        network, EventListener(), links=links, storage_capacity_factor=0.2
+    )
+    sim.set(plans)
+    events = sim.run()
+    arrivals = [e for e in events if e[2][0] == InstructionType.EOS]
+    assert len(arrivals) == 5
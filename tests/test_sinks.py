@@ -0,0 +1,143 @@
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mobslim.animate import build_traces
+from mobslim.listener import EventListener
+from mobslim.network import Grid
+from mobslim.processs_events import analyse_events, trip_durations
+from mobslim.sim import Sim
+from mobslim.sinks import (
+    ArrowListener,
+    BinaryListener,
+    CSVListener,
+    ParquetListener,
+    read_log,
+)
+
+
+def run(listener, network, plans):
+    sim = Sim(network=network, listener=listener)
+    sim.set(plans)
+    return sim.run()
+
+
+@pytest.mark.parametrize(
+    "sink,name",
+    [(ArrowListener, "events.arrow"), (ParquetListener, "events.parquet")],
+)
+def test_arrow_sinks_stream_the_same_events(
+    tmp_path, sink, name, ring_network, ring_plans
+):
+    pytest.importorskip("pyarrow")
+    network = ring_network(length=100)
+    plans = ring_plans(network, agents=40)
+    events = run(EventListener(), network, plans)
+    with sink(tmp_path / name, batch_size=64, queue_size=2) as listener:
+        path = run(listener, network, plans)
+    assert len(listener) == len(events)
+    assert list(read_log(path)) == events
+
+
+def test_csv_sink_streams_compressed_rows(tmp_path, ring_network, ring_plans):
+    network = ring_network(length=100)
+    plans = ring_plans(network, agents=40)
+    events = run(EventListener(), network, plans)
+    with CSVListener(tmp_path / "events.csv.gz", batch_size=64) as listener:
+        run(listener, network, plans)
+    with gzip.open(tmp_path / "events.csv.gz", "rt") as f:
+        frame = pd.read_csv(f)
+    assert len(frame) == len(events)
+    assert list(frame.columns) == [
+        "time",
+        "agent_id",
+        "event",
+        "activity",
+        "location",
+        "duration",
+    ]
+    assert frame["event"].iloc[0] == events[0][2][0].name
+    assert (frame["time"].to_numpy() == [e[0] for e in events]).all()
+
+
+def test_arrow_sink_keeps_tuple_node_ids(tmp_path):
+    pytest.importorskip("pyarrow")
+    from mobslim.agents import ActivityType, Plan
+    from mobslim.expected import SimpleExpectedDurations
+    from mobslim.planners.greedy_trip_planner import GreedyTripPlanner
+    from mobslim.planners.rerouters.simple_rerouter import StaticRouter
+
+    network = Grid(size=2)
+    plan = Plan()
+    plan.add_activity(ActivityType.HOME, (0, 0), 10)
+    plan.add_trip((0, 0), (0, 1), 0)
+    plan.add_activity(ActivityType.WORK, (0, 1), 10)
+    plan.finish()
+    plans = {"a": plan}
+    router = StaticRouter(network, SimpleExpectedDurations(network))
+    GreedyTripPlanner(plans, router, network).plan()
+    events = run(EventListener(), network, plans)
+    with ArrowListener(tmp_path / "events.arrow") as listener:
+        path = run(listener, network, plans)
+    assert list(read_log(path)) == events
+
+
+def test_binary_sink_is_memory_mapped(tmp_path, ring_network, ring_plans):
+    network = ring_network(length=100)
+    plans = ring_plans(network, agents=40)
+    events = run(EventListener(), network, plans)
+    with BinaryListener(tmp_path / "events.bin", batch_size=64) as listener:
+        path = run(listener, network, plans)
+
+    log = read_log(path)
+    assert isinstance(log.times.base, np.memmap)
+    assert list(log) == events
+    start, end = events[50][0], events[150][0]
+    assert list(log.window(start, end)) == [
+        event for event in events if start <= event[0] < end
+    ]
+    positions = network.node_positions
+    assert build_traces(log, positions) == build_traces(events, positions)
+    assert analyse_events(network, log) == analyse_events(network, events)
+    assert trip_durations(log) == trip_durations(events)
+
+    with BinaryListener(tmp_path / "empty.bin") as listener:
+        run(listener, network, {})
+    assert list(read_log(tmp_path / "empty.bin")) == []
+
+
+def test_sink_opens_its_stream_on_first_write(
+    tmp_path, ring_network, ring_plans
+):
+    network = ring_network(length=100)
+    plans = ring_plans(network, agents=40)
+    listener = BinaryListener(tmp_path / "events.bin", batch_size=64)
+    sim = Sim(network=network, listener=listener)
+    sim.set(plans)
+    assert listener.thread is None
+    assert not (tmp_path / "events.bin").exists()
+    with listener:
+        sim.run()
+        assert listener.thread is not None
+    assert len(read_log(tmp_path / "events.bin")) == len(listener)
+
+
+def test_binary_sink_keeps_tuple_agent_ids(tmp_path, ring_network, ring_plans):
+    network = ring_network(length=100)
+    plans = ring_plans(network, agents=10)
+    plans = {("agent", i): plan for i, plan in plans.items()}
+    events = run(EventListener(), network, plans)
+    with BinaryListener(tmp_path / "events.bin") as listener:
+        path = run(listener, network, plans)
+    assert list(read_log(path)) == events
+
+
+def test_sink_rejects_ids_it_cannot_restore(tmp_path, ring_network, ring_plans):
+    network = ring_network(length=100)
+    plans = ring_plans(network, agents=10)
+    plans = {object(): plan for plan in plans.values()}
+    with pytest.raises(TypeError, match="agent and node ids"):
+        with BinaryListener(tmp_path / "events.bin") as listener:
+            run(listener, network, plans)
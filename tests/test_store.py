@@ -0,0 +1,61 @@
+import pytest
+
+from mobslim.listener import LINK_INSTRUCTIONS, ColumnarListener, EventListener
+from mobslim.processs_events import filter_agent
+from mobslim.sim import Sim
+from mobslim.sinks import ArrowListener
+from mobslim.store import EventStore
+
+
+def run(listener, network, plans):
+    sim = Sim(network=network, listener=listener)
+    sim.set(plans)
+    return sim.run()
+
+
+def test_store_looks_up_agents_links_and_times(ring_network, ring_plans):
+    network = ring_network(length=100)
+    plans = ring_plans(network, agents=40)
+    events = run(EventListener(), network, plans)
+    link = events[10][2][2]
+    for store in (
+        EventStore(events),
+        EventStore(run(ColumnarListener(), network, plans)),
+    ):
+        assert len(store) == len(events)
+        for agent_id in (0, 7, 39):
+            assert list(store.agent(agent_id)) == filter_agent(events, agent_id)
+            assert filter_agent(store, agent_id) == filter_agent(
+                events, agent_id
+            )
+        assert list(store.agent("missing")) == []
+        assert list(store.link(link)) == [
+            event
+            for event in events
+            if event[2][0] in LINK_INSTRUCTIONS and event[2][2] == link
+        ]
+        start, end = events[50][0], events[150][0]
+        assert list(store.window(start, end)) == [
+            event for event in events if start <= event[0] < end
+        ]
+        assert list(store.agent(7, start, end)) == [
+            event
+            for event in filter_agent(events, 7)
+            if start <= event[0] < end
+        ]
+
+
+def test_store_index_is_saved_next_to_the_events(
+    tmp_path, ring_network, ring_plans
+):
+    pytest.importorskip("pyarrow")
+    network = ring_network(length=100)
+    plans = ring_plans(network, agents=40)
+    with ArrowListener(tmp_path / "events.arrow") as listener:
+        path = run(listener, network, plans)
+    index_path = EventStore.open(path).save_index(path)
+    assert index_path.name == "events.arrow.index.npz"
+
+    store = EventStore.open(path)
+    events = run(EventListener(), network, plans)
+    assert list(store.agent(3)) == filter_agent(events, 3)
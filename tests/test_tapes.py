@@ -0,0 +1,14 @@
+import copy
+
+from mobslim.tapes import compile_plans
+
+
+def test_tapes_decode_to_plan_instructions(ring_network, ring_plans):
+    network = ring_network()
+    plans = ring_plans(network, agents=12)
+    tapes = compile_plans(plans, network)
+    assert tapes.agent_ids == sorted(plans)
+    for agent, agent_id in enumerate(tapes.agent_ids):
+        plan = copy.deepcopy(plans[agent_id])
+        expected = [i for pair in plan.get_instructions() for i in pair]
+        assert tapes.instructions(agent) == expected